@@ -0,0 +1,179 @@
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine, Session
+from fastapi.concurrency import run_in_threadpool
+import logging
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# 每個連線建立時套用的SQLite設定
+# WAL讓讀取不會被寫入擋住；WAL模式下synchronous=NORMAL仍可保證資料庫一致，只有斷電時可能遺失最後幾筆交易
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,       # 負數單位為KB，每個連線約20MB頁面快取
+    "mmap_size": 268435456,     # 以記憶體映射讀取最多256MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,       # 寫入鎖被占用時最多等待5秒，而不是立刻回報database is locked
+}
+
+def sqlite_pragmas(synchronous="NORMAL", cache_size_kb=20000, mmap_size_mb=256, busy_timeout_ms=5000):
+    """
+    產生SQLite設定
+
+    Args:
+        synchronous: OFF、NORMAL或FULL
+        cache_size_kb: 每個連線的頁面快取大小
+        mmap_size_mb: 記憶體映射的大小，0則停用
+        busy_timeout_ms: 等待寫入鎖的毫秒數
+
+    Returns:
+        dict: PRAGMA名稱與值
+    """
+    return {
+        **DEFAULT_PRAGMAS,
+        "synchronous": synchronous,
+        "cache_size": -cache_size_kb,
+        "mmap_size": mmap_size_mb * 1024 * 1024,
+        "busy_timeout": busy_timeout_ms,
+    }
+
+def _register_pragmas(engine, pragmas):
+    """連線建立時套用pragmas，journal_mode會寫入資料庫檔案，其餘設定只對該連線有效"""
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def create_sqlite_engine(path, pool_size=10, max_overflow=20, pool_timeout=30, pragmas=DEFAULT_PRAGMAS):
+    """
+    建立有連線池與SQLite設定的同步engine
+
+    Args:
+        path: 資料庫檔案路徑
+        pool_size: 連線池保留的連線數
+        max_overflow: 超過pool_size時最多再建立的連線數
+        pool_timeout: 等待可用連線的秒數
+        pragmas: 每個連線建立時套用的設定，None則不設定
+
+    Returns:
+        sqlalchemy.Engine
+    """
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    if pragmas:
+        _register_pragmas(engine, pragmas)
+    return engine
+
+def create_async_sqlite_engine(path, pool_size=10, max_overflow=20, pool_timeout=30, pragmas=DEFAULT_PRAGMAS):
+    """
+    建立使用aiosqlite的非同步engine，參數與create_sqlite_engine相同
+
+    Returns:
+        sqlalchemy.ext.asyncio.AsyncEngine
+
+    Raises:
+        RuntimeError: 沒有安裝aiosqlite
+    """
+    try:
+        import aiosqlite  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("使用非同步資料庫需要安裝aiosqlite") from e
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}",
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    if pragmas:
+        # aiosqlite的連線在背景執行緒中，事件要註冊在sync_engine上
+        _register_pragmas(engine.sync_engine, pragmas)
+    return engine
+
+class Database:
+    """
+    SQLite存取層
+    寫入使用同步Session；讀取不阻塞事件迴圈，啟用非同步時使用aiosqlite，否則在執行緒池中執行同步查詢
+    """
+
+    def __init__(self, path, pool_size=10, max_overflow=20, pool_timeout=30, pragmas=DEFAULT_PRAGMAS, use_async=False):
+        """
+        初始化資料庫
+
+        Args:
+            path: 資料庫檔案路徑
+            pool_size: 連線池保留的連線數
+            max_overflow: 超過pool_size時最多再建立的連線數
+            pool_timeout: 等待可用連線的秒數
+            pragmas: 每個連線建立時套用的SQLite設定
+            use_async: 讀取是否使用aiosqlite的非同步engine
+        """
+        self.path = path
+        self.engine = create_sqlite_engine(path, pool_size, max_overflow, pool_timeout, pragmas)
+        self.async_engine = create_async_sqlite_engine(path, pool_size, max_overflow, pool_timeout, pragmas) if use_async else None
+        logger.info(f"資料庫: {path}，連線池: {pool_size}+{max_overflow}，非同步讀取: {use_async}")
+
+    @property
+    def engines(self):
+        """所有底層的同步engine，用於註冊事件"""
+        engines = [self.engine]
+        if self.async_engine is not None:
+            engines.append(self.async_engine.sync_engine)
+        return engines
+
+    def session(self):
+        return Session(self.engine)
+
+    def _read_sync(self, statement):
+        with Session(self.engine) as session:
+            return session.exec(statement).all()
+
+    async def read(self, statement):
+        """
+        執行查詢並取回所有結果
+
+        Args:
+            statement: select語句
+
+        Returns:
+            list: 查詢結果
+        """
+        if self.async_engine is not None:
+            from sqlmodel.ext.asyncio.session import AsyncSession
+            async with AsyncSession(self.async_engine) as session:
+                return (await session.exec(statement)).all()
+        return await run_in_threadpool(self._read_sync, statement)
+
+    async def write(self, func, *args):
+        """
+        在執行緒池中以同步Session執行寫入
+
+        Args:
+            func: 參數為(session, *args)的函式，需自行commit
+
+        Returns:
+            func的回傳值
+        """
+        def run():
+            with Session(self.engine) as session:
+                return func(session, *args)
+        return await run_in_threadpool(run)
+
+    async def dispose(self):
+        """關閉所有連線"""
+        self.engine.dispose()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    有上限的背景工作佇列
+    固定數量的worker從佇列取出工作ID交給handler處理，佇列滿時拒絕新工作以提供背壓
+    """
+
+    def __init__(self, handler, workers=2, max_size=100):
+        """
+        初始化工作佇列
+
+        Args:
+            handler: 處理單一工作的協程函式，參數為工作ID
+            workers: 同時處理工作的worker數量
+            max_size: 佇列中最多等待的工作數量
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self._queue = None
+        self._tasks = []
+        self._enqueued_at = {}
+        self._in_flight = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "total_run": 0.0,
+        }
+
+    def start(self):
+        """啟動worker，需在事件迴圈中呼叫"""
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"背景工作佇列啟動，worker數量: {self.workers}，佇列上限: {self.max_size}")
+
+    async def stop(self):
+        """停止所有worker，尚未處理的工作保留在資料庫中，下次啟動時重新排入"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id):
+        """
+        排入新工作
+
+        Args:
+            job_id: 工作ID
+
+        Raises:
+            asyncio.QueueFull: 佇列已滿
+        """
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise
+        self._enqueued_at[job_id] = time.monotonic()
+        self._stats["submitted"] += 1
+
+    async def resubmit(self, job_ids):
+        """
+        重新排入重啟前未完成的工作，佇列滿時等待空位
+
+        Args:
+            job_ids: 工作ID列表
+        """
+        for job_id in job_ids:
+            self._enqueued_at[job_id] = time.monotonic()
+            await self._queue.put(job_id)
+            self._stats["submitted"] += 1
+        if job_ids:
+            logger.info(f"重新排入 {len(job_ids)} 個未完成的工作")
+
+    async def _worker(self, index):
+        while True:
+            job_id = await self._queue.get()
+            wait = time.monotonic() - self._enqueued_at.pop(job_id, time.monotonic())
+            self._stats["total_wait"] += wait
+            self._stats["max_wait"] = max(self._stats["max_wait"], wait)
+
+            self._in_flight += 1
+            start = time.monotonic()
+            try:
+                await self.handler(job_id)
+                self._stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"worker {index} 處理工作 {job_id} 時發生錯誤: {e}")
+            finally:
+                self._in_flight -= 1
+                self._stats["total_run"] += time.monotonic() - start
+                self._queue.task_done()
+
+    def metrics(self):
+        """
+        取得佇列統計資料
+
+        Returns:
+            dict: 佇列深度、處理中數量、完成/失敗/拒絕數量與平均等待/執行時間
+        """
+        finished = self._stats["completed"] + self._stats["failed"]
+        started = finished + self._in_flight
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "submitted": self._stats["submitted"],
+            "completed": self._stats["completed"],
+            "failed": self._stats["failed"],
+            "rejected": self._stats["rejected"],
+            "avg_wait_seconds": round(self._stats["total_wait"] / started, 3) if started else 0.0,
+            "max_wait_seconds": round(self._stats["max_wait"], 3),
+            "avg_run_seconds": round(self._stats["total_run"] / finished, 3) if finished else 0.0,
+        }
@@ -1,18 +1,27 @@
-from fastapi import FastAPI, Body,Depends,HTTPException,status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Body,Depends,HTTPException,status,Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordBearer,OAuth2PasswordRequestForm
+from fastapi.concurrency import iterate_in_threadpool
 from contextlib import asynccontextmanager  # 用於建立 lifespan 
+import asyncio
 import logging
-from sqlmodel import SQLModel,Field,create_engine,Session,select
+from sqlmodel import SQLModel,Field,Session,select
+from sqlalchemy import event, func, or_, and_, Index
 from pydantic import BaseModel
 from jose import JWTError, jwt  # JWT處理
 from passlib.context import CryptContext  # 加密用
 from package.rag import RAGService  
+from package.metrics import REGISTRY
+from app.jobs import JobQueue
+from app.database import Database, sqlite_pragmas
 from datetime import datetime,timedelta
 from typing import Annotated,Optional,Dict,List,Set
 import json
+import time
+import base64
+import secrets
 import os
 from dotenv import load_dotenv
 import jose
@@ -30,12 +39,123 @@ google_search_api_key = os.getenv("google_search_api_key")
 google_cse_id = os.getenv("google_cse_id")
 model_name = os.getenv("model_name")
 
+# 各階段的模型與輸出上限，沒設定模型時使用model_name
+keyword_model_name = os.getenv("keyword_model_name") or None
+comparison_model_name = os.getenv("comparison_model_name") or None
+keyword_max_output_tokens = int(os.getenv("keyword_max_output_tokens", 64))
+comparison_max_output_tokens = int(os.getenv("comparison_max_output_tokens", 4096))
+
+# 產品比較要求Gemini輸出JSON，無法解析時用關鍵字模型修正一次
+structured_output = os.getenv("structured_output", "true").lower() == "true"
+json_repair = os.getenv("json_repair", "true").lower() == "true"
+
+# 商品頁面併發抓取設定
+fetch_max_workers = int(os.getenv("fetch_max_workers", 8))
+fetch_per_host_limit = int(os.getenv("fetch_per_host_limit", 4))
+
+# 商品頁面HTTP連線設定
+http_connect_timeout = float(os.getenv("http_connect_timeout", 3.05))
+http_read_timeout = float(os.getenv("http_read_timeout", 10))
+http_max_retries = int(os.getenv("http_max_retries", 3))
+
+# 商品快取設定，持久層與資料庫放在同一個目錄
+cache_db_path = os.getenv("cache_db_path", "/code/cache.db")
+product_cache_size = int(os.getenv("product_cache_size", 1000))
+price_ttl = int(os.getenv("price_ttl", 600))
+specs_ttl = int(os.getenv("specs_ttl", 86400))
+
+# Google搜尋結果快取設定
+search_cache_ttl = int(os.getenv("search_cache_ttl", 3600))
+search_cache_size = int(os.getenv("search_cache_size", 500))
+search_cache_persist = os.getenv("search_cache_persist", "true").lower() == "true"
+
+# 規則式關鍵字的最低信心分數，大於1則一律使用Gemini
+keyword_min_confidence = float(os.getenv("keyword_min_confidence", 0.8))
+
+# 非同步API中執行同步步驟的執行緒數量上限
+rag_blocking_workers = int(os.getenv("rag_blocking_workers", 16))
+
+# 背景比較工作設定，worker數量依Gemini配額調整
+job_workers = int(os.getenv("job_workers", 2))
+job_queue_size = int(os.getenv("job_queue_size", 100))
+
+# 產品比較結果快取設定，ttl為0則停用
+result_cache_ttl = int(os.getenv("result_cache_ttl", 900))
+result_cache_size = int(os.getenv("result_cache_size", 256))
+
+# 比較提示詞中商品資訊的token預算
+context_max_tokens = int(os.getenv("context_max_tokens", 6000))
+
+# 依預算與規格篩選後送進比較提示詞的商品數量，0則不限制，應與search_rerank_top_n相同避免抓取後又捨棄
+product_top_k = int(os.getenv("product_top_k", 8))
+
+# 搜尋結果重新排序並去除重複商品後抓取的商品數量，0則不限制
+search_rerank_top_n = int(os.getenv("search_rerank_top_n", 8))
+
+# 近似查詢快取設定，ttl為0則停用
+semantic_cache_ttl = int(os.getenv("semantic_cache_ttl", 900))
+semantic_cache_size = int(os.getenv("semantic_cache_size", 512))
+semantic_result_threshold = float(os.getenv("semantic_result_threshold", 0.9))
+semantic_stage_threshold = float(os.getenv("semantic_stage_threshold", 0.75))
+
+# 商品搜尋來源: google或hybrid(近期用Google搜尋過的關鍵字先查本地全文索引，不足時才用Google搜尋)
+retriever_mode = os.getenv("retriever_mode", "hybrid")
+local_min_hits = int(os.getenv("local_min_hits", 5))
+local_max_age = int(os.getenv("local_max_age", 3 * 86400))
+local_query_ttl = int(os.getenv("local_query_ttl", 86400))
+
+# 熱門商品背景更新設定，間隔為0則停用
+refresh_interval = int(os.getenv("refresh_interval", 60))
+refresh_max_per_cycle = int(os.getenv("refresh_max_per_cycle", 20))
+refresh_rate = float(os.getenv("refresh_rate", 1.0))
+
+# /metrics的存取權杖，Prometheus需帶Authorization: Bearer <metrics_token>
+# 沒有設定時/metrics一律拒絕，除非metrics_public=true(只在/metrics沒有對外公開時使用)
+metrics_token = os.getenv("metrics_token") or None
+metrics_public = os.getenv("metrics_public", "false").lower() == "true"
+
 # 初始化 RAG 服務
 rag_service = RAGService(
     gemini_api_key=gemini_api_key,
     google_search_api_key=google_search_api_key,
     google_cse_id=google_cse_id,
-    model_name=model_name
+    model_name=model_name,
+    fetch_max_workers=fetch_max_workers,
+    fetch_per_host_limit=fetch_per_host_limit,
+    http_connect_timeout=http_connect_timeout,
+    http_read_timeout=http_read_timeout,
+    http_max_retries=http_max_retries,
+    cache_db_path=cache_db_path,
+    product_cache_size=product_cache_size,
+    price_ttl=price_ttl,
+    specs_ttl=specs_ttl,
+    search_cache_ttl=search_cache_ttl,
+    search_cache_size=search_cache_size,
+    search_cache_persist=search_cache_persist,
+    keyword_min_confidence=keyword_min_confidence,
+    blocking_workers=rag_blocking_workers,
+    result_cache_ttl=result_cache_ttl,
+    result_cache_size=result_cache_size,
+    context_max_tokens=context_max_tokens,
+    product_top_k=product_top_k,
+    search_rerank_top_n=search_rerank_top_n,
+    semantic_cache_ttl=semantic_cache_ttl,
+    semantic_cache_size=semantic_cache_size,
+    semantic_result_threshold=semantic_result_threshold,
+    semantic_stage_threshold=semantic_stage_threshold,
+    retriever_mode=retriever_mode,
+    local_min_hits=local_min_hits,
+    local_max_age=local_max_age,
+    local_query_ttl=local_query_ttl,
+    refresh_interval=refresh_interval,
+    refresh_max_per_cycle=refresh_max_per_cycle,
+    refresh_rate=refresh_rate,
+    keyword_model_name=keyword_model_name,
+    comparison_model_name=comparison_model_name,
+    keyword_max_output_tokens=keyword_max_output_tokens,
+    comparison_max_output_tokens=comparison_max_output_tokens,
+    structured_output=structured_output,
+    json_repair=json_repair
 )
 
 #設定JWT參數
@@ -47,11 +167,35 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-#設定資料庫
-databas_name="/code/database.db"
-database_path=f"sqlite:///{databas_name}"
-connect_args={"check_same_thread":False}
-engine=create_engine(database_path,connect_args=connect_args)
+#設定資料庫，可用database_file指定其它路徑(例如效能測試使用暫存檔)
+databas_name=os.getenv("database_file", "/code/database.db")
+database=Database(
+    databas_name,
+    pool_size=int(os.getenv("database_pool_size", 10)),
+    max_overflow=int(os.getenv("database_max_overflow", 20)),
+    pool_timeout=float(os.getenv("database_pool_timeout", 30)),
+    pragmas=sqlite_pragmas(
+        synchronous=os.getenv("sqlite_synchronous", "NORMAL"),
+        cache_size_kb=int(os.getenv("sqlite_cache_size_kb", 20000)),
+        mmap_size_mb=int(os.getenv("sqlite_mmap_size_mb", 256))
+    ),
+    use_async=os.getenv("database_async", "false").lower() == "true"
+)
+engine=database.engine
+
+#資料庫查詢耗時
+db_query_seconds = REGISTRY.histogram("db_query_seconds", "資料庫查詢耗時(秒)", ["operation"])
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    db_query_seconds.observe(time.perf_counter() - conn.info["query_start"].pop(), operation=operation)
+
+for db_engine in database.engines:
+    event.listen(db_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", after_cursor_execute)
 
 #用戶資料
 class User(SQLModel, table=True):
@@ -65,12 +209,28 @@ class User(SQLModel, table=True):
 
 #問答紀錄
 class QueryRecord(SQLModel, table=True):
+    # 歷史記錄依(user_id, created_at, id)分頁，複合索引讓COUNT與分頁都不需要掃描整張表
+    __table_args__ = (Index("ix_queryrecord_user_created_id", "user_id", "created_at", "id"),)
+
     id: int = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
     query: str
     response: str
     created_at: datetime = Field(default_factory=datetime.now)
 
+#背景比較工作
+class ComparisonJob(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    query: str
+    status: str = Field(default="queued", index=True)  # queued、running、done、failed
+    result: Optional[str] = Field(default=None, nullable=True)  # 解析後的JSON字串
+    record_id: Optional[int] = Field(default=None, nullable=True)
+    error: Optional[str] = Field(default=None, nullable=True)
+    created_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime] = Field(default=None, nullable=True)
+    finished_at: Optional[datetime] = Field(default=None, nullable=True)
+
 #回應模型
 class UserResponse(BaseModel):
     id: int
@@ -93,10 +253,30 @@ class QueryRecordResponse(BaseModel):
     response: str
     created_at: datetime
 
+# 問答記錄摘要，列表不包含完整的回應
+class QueryRecordSummary(BaseModel):
+    id: int
+    user_id: int
+    query: str
+    created_at: datetime
+
 # 多筆問答記錄回應模型
 class QueryHistoryResponse(BaseModel):
-    records: list[QueryRecordResponse]
+    records: list[QueryRecordSummary]
     total: int
+    next_cursor: Optional[str] = None  # 下一頁的cursor，沒有下一頁時為None
+
+# 背景比較工作回應模型
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    query: str
+    result: Optional[dict] = None
+    record_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 #給前端用
 class token(BaseModel):
@@ -108,9 +288,12 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 def creat_db():
     SQLModel.metadata.create_all(engine)
+    # create_all不會替已存在的資料表補上新的索引
+    for index in QueryRecord.__table__.indexes:
+        index.create(engine, checkfirst=True)
 
-#安全建立資料庫連接
-async def creat_session():
+#安全建立資料庫連接，同步的依賴由FastAPI在執行緒池中執行，不阻塞事件迴圈
+def creat_session():
     with Session(engine) as session:
         yield session
 
@@ -121,7 +304,24 @@ v_session=Annotated[Session,Depends(creat_session)]
 async def lifespan(app:FastAPI):
     creat_db()
     print("資料庫建立完成")
+    # 建立並預熱Gemini與Custom Search客戶端
+    rag_service.startup()
+    # 啟動背景工作佇列，重新排入重啟前未完成的工作
+    job_queue.start()
+    resubmit_task = asyncio.create_task(job_queue.resubmit(load_unfinished_jobs()))
+    # 啟動熱門商品背景更新
+    if rag_service.refresher is not None:
+        rag_service.refresher.start()
     yield
+    resubmit_task.cancel()
+    await job_queue.stop()
+    if rag_service.refresher is not None:
+        await rag_service.refresher.stop()
+    logger.info(f"HTTP連線池統計: {rag_service.http_client.pool_stats()}")
+    logger.info(f"商品快取統計: {rag_service.product_cache.stats()}")
+    logger.info(f"搜尋快取統計: {rag_service.search_cache.stats()}")
+    rag_service.close()
+    await database.dispose()
 
 #安全性設定
 #加密方法
@@ -221,6 +421,84 @@ app.add_middleware(
     allow_headers=["*"],    #允許所有header
 )
 
+#API請求指標
+http_request_seconds = REGISTRY.histogram("http_request_seconds", "API請求耗時(秒)", ["method", "route", "status"])
+http_requests_in_flight = REGISTRY.gauge("http_requests_in_flight", "處理中的API請求數")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    http_requests_in_flight.inc()
+
+    def observe(status_code):
+        http_requests_in_flight.dec()
+        # 以路由樣板為標籤，例如/api/history/{record_id}，避免每個ID都產生一組時間序列
+        route = request.scope.get("route")
+        http_request_seconds.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status_code)
+        )
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        observe(500)
+        raise
+
+    # call_next送出標頭就返回，body(例如/api/search/stream的整段串流)送完才記錄耗時
+    body_iterator = response.body_iterator
+
+    async def observed_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            observe(response.status_code)
+
+    response.body_iterator = observed_body()
+    return response
+
+
+# 歷史記錄每頁最多筆數
+HISTORY_MAX_LIMIT = 100
+
+def encode_history_cursor(record) -> str:
+    """把最後一筆記錄的(created_at, id)編碼成cursor"""
+    raw = json.dumps([record.created_at.isoformat(), record.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str):
+    """解析cursor，格式錯誤時回傳400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的cursor")
+
+def history_page_statement(user_id: int, limit: int, skip: int = 0, after=None):
+    """
+    歷史記錄摘要的分頁查詢，不包含response
+    after為(created_at, id)時從該筆記錄之後開始並忽略skip
+    """
+    statement = select(QueryRecord.id, QueryRecord.user_id, QueryRecord.query, QueryRecord.created_at)\
+        .where(QueryRecord.user_id == user_id)\
+        .order_by(QueryRecord.created_at.desc(), QueryRecord.id.desc())
+    if after is not None:
+        created_at, record_id = after
+        statement = statement.where(or_(
+            QueryRecord.created_at < created_at,
+            and_(QueryRecord.created_at == created_at, QueryRecord.id < record_id)
+        ))
+    else:
+        statement = statement.offset(max(skip, 0))
+    return statement.limit(limit)
+
+def history_count_statement(user_id: int):
+    """用戶的歷史記錄總數"""
+    return select(func.count(QueryRecord.id)).where(QueryRecord.user_id == user_id)
 
 # 用戶註冊
 @app.post("/api/register", response_model=UserResponse)
@@ -253,7 +531,7 @@ def register_user(user: UserCreate, session: v_session):
 
 # 登入
 @app.post("/api/token", response_model=token)
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],session:v_session):
+def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],session:v_session):
     """登入並獲取token"""
     # 認證用戶
     user = verfiy_user(session, form_data.username, form_data.password)
@@ -272,8 +550,8 @@ async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm,
 
     return {"access_token": access_token, "token_type": "bearer"}
 
-# 獲取當前用戶
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session:v_session):
+# 獲取當前用戶，查詢資料庫的同步依賴在執行緒池中執行
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session:v_session):
     """從token獲取當前用戶"""
     #定義錯誤訊息
     credentials_exception = HTTPException(
@@ -359,35 +637,42 @@ async def logout(
 async def get_user_history(
     skip: int = 0,
     limit: int = 10,
-    current_user: Annotated[User, Depends(get_current_active_user)] = None,
-    session: v_session = None
+    cursor: Optional[str] = None,
+    current_user: Annotated[User, Depends(get_current_active_user)] = None
 ):
-    """獲取用戶的問答歷史記錄"""
-    
-    statement = select(QueryRecord).where(QueryRecord.user_id == current_user.id).order_by(QueryRecord.created_at.desc()).offset(skip).limit(limit)
+    """
+    獲取用戶的問答歷史記錄摘要，完整回應請用/api/history/{record_id}
+    有cursor時從cursor之後開始(忽略skip)，否則沿用skip/limit分頁
+    """
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    after = decode_history_cursor(cursor) if cursor else None
     
-    records = session.exec(statement).all()
+    # 多取一筆判斷是否還有下一頁
+    rows = await database.read(history_page_statement(current_user.id, limit + 1, skip, after))
+    records = [QueryRecordSummary(id=row.id, user_id=row.user_id, query=row.query, created_at=row.created_at) for row in rows[:limit]]
+    next_cursor = encode_history_cursor(records[-1]) if len(rows) > limit else None
     
     # 獲取總記錄數
-    total_count = session.exec(select(QueryRecord).where(QueryRecord.user_id == current_user.id)).all()
+    total = (await database.read(history_count_statement(current_user.id)))[0]
     
     return {
         "records": records,
-        "total": len(total_count)
+        "total": total,
+        "next_cursor": next_cursor
     }
 
 # 獲取最新的用戶問答
 @app.get("/api/history/latest", response_model=QueryRecordResponse)
 async def get_latest_record(
-    current_user: Annotated[User, Depends(get_current_active_user)] = None,
-    session: v_session = None
+    current_user: Annotated[User, Depends(get_current_active_user)] = None
 ):
     """獲取用戶最新的問答記錄"""
     
     statement = select(QueryRecord).where(QueryRecord.user_id == current_user.id)\
-        .order_by(QueryRecord.created_at.desc()).limit(1)
+        .order_by(QueryRecord.created_at.desc(), QueryRecord.id.desc()).limit(1)
     
-    record = session.exec(statement).first()
+    records = await database.read(statement)
+    record = records[0] if records else None
     
     if not record:
         raise HTTPException(status_code=404, detail="無問答記錄")
@@ -398,8 +683,7 @@ async def get_latest_record(
 @app.get("/api/history/{record_id}", response_model=QueryRecordResponse)
 async def get_record_by_id(
     record_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)] = None,
-    session: v_session = None
+    current_user: Annotated[User, Depends(get_current_active_user)] = None
 ):
     """根據ID獲取特定的問答記錄"""
     
@@ -409,7 +693,8 @@ async def get_record_by_id(
         QueryRecord.user_id == current_user.id
     )
     
-    record = session.exec(statement).first()
+    records = await database.read(statement)
+    record = records[0] if records else None
     
     if not record:
         raise HTTPException(status_code=404, detail="記錄不存在或無權存取")
@@ -418,7 +703,7 @@ async def get_record_by_id(
 
 # 刪除問答記錄
 @app.delete("/api/history/{record_id}")
-async def delete_record(
+def delete_record(
     record_id: int,
     current_user: Annotated[User, Depends(get_current_active_user)] = None,
     session: v_session = None
@@ -442,36 +727,110 @@ async def delete_record(
     
     return {"message": "記錄刪除成功"}
 
+# HTTP連線池統計
+@app.get("/api/stats/http")
+async def get_http_stats(current_user: Annotated[User, Depends(get_current_active_user)]):
+    """獲取商品頁面HTTP連線池的統計資料"""
+    return rag_service.http_client.pool_stats()
+
+# Gemini呼叫統計
+@app.get("/api/stats/llm")
+async def get_llm_stats(current_user: Annotated[User, Depends(get_current_active_user)]):
+    """獲取關鍵字與產品比較階段的Gemini模型、耗時與token用量"""
+    return rag_service.llm_stats()
+
+# 商品快取統計
+@app.get("/api/stats/cache")
+async def get_cache_stats(current_user: Annotated[User, Depends(get_current_active_user)]):
+    """獲取商品與搜尋快取的命中、未命中與淘汰統計"""
+    return {
+        "product": rag_service.product_cache.stats(),
+        "search": rag_service.search_cache.stats(),
+        "result": rag_service.result_cache.stats() if rag_service.result_cache else None,
+        "semantic": rag_service.semantic_cache.stats() if rag_service.semantic_cache else None,
+        "index": rag_service.product_index.stats() if rag_service.product_index else None,
+        "refresher": rag_service.refresher.stats() if rag_service.refresher else None
+    }
+
+# 輸出時才讀取的快取命中率與佇列深度
+def collect_service_metrics():
+    caches = {
+        "product": rag_service.product_cache.stats(),
+        "search": rag_service.search_cache.stats(),
+    }
+    if rag_service.result_cache:
+        caches["result"] = rag_service.result_cache.stats()
+    samples = [({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()]
+    if rag_service.semantic_cache:
+        semantic = rag_service.semantic_cache.stats()
+        samples.append(({"cache": "semantic_result"}, semantic["result_hit_rate"]))
+        samples.append(({"cache": "semantic_stages"}, semantic["stage_hit_rate"]))
+    if rag_service.product_index:
+        samples.append(({"cache": "product_index"}, rag_service.product_index.stats()["hit_rate"]))
+
+    jobs = job_queue.metrics()
+    http = rag_service.http_client.pool_stats()
+    return [
+        ("cache_hit_ratio", "各快取的命中率", "gauge", samples),
+        ("job_queue_depth", "背景比較工作佇列中等待的工作數", "gauge", [({}, jobs["queue_depth"])]),
+        ("job_in_flight", "執行中的背景比較工作數", "gauge", [({}, jobs["in_flight"])]),
+        ("http_pool_reuse_ratio", "商品頁面連線重用率", "gauge", [({}, http["reuse_rate"])]),
+    ]
+
+REGISTRY.register_collector(collect_service_metrics)
+
+# Prometheus指標
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """以Prometheus文字格式輸出各階段耗時、錯誤數、token用量與快取命中率"""
+    if metrics_token is None:
+        if not metrics_public:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="未設定metrics_token")
+    elif not secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {metrics_token}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="無效的metrics權杖")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+#儲存問答記錄
+def save_query_record(session: Session, query_record: QueryRecord) -> int:
+    session.add(query_record)
+    session.commit()
+    return query_record.id
+
+#解析查詢內容
+def parse_user_query(body) -> str:
+    """從request body取出用戶查詢"""
+    if isinstance(body, dict):
+        return body["content"]
+    # 如果不是字典，嘗試解析 JSON
+    return json.loads(body)["content"]
+
+#SSE事件格式
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/api/search")
 async def response(
     body=Body(None), 
-    current_user: Annotated[User, Depends(get_current_active_user)] = None, 
-    session: v_session = None
+    current_user: Annotated[User, Depends(get_current_active_user)] = None
 ):
     """
     處理用戶產品比較請求
     """
     try:
         # 處理 request body
-        if isinstance(body, dict):
-            user_query = body["content"]
-        else:
-            # 如果不是字典，嘗試解析 JSON
-            user_query = json.loads(body)["content"]
+        user_query = parse_user_query(body)
         logger.info(f"收到用戶查詢: {user_query}")
         
         # RAG
-        original_response, response_json = rag_service.process_product_comparison(user_query)
+        original_response, response_json = await rag_service.aprocess_product_comparison(user_query)
         
-        # 儲存問答記錄到資料庫
+        # 儲存問答記錄到資料庫，在執行緒池中寫入避免阻塞事件迴圈
         query_record = QueryRecord(
             user_id=current_user.id,
             query=user_query,
             response=original_response
         )
-        session.add(query_record)
-        session.commit()
-        session.refresh(query_record)
+        await database.write(save_query_record, query_record)
         
         # 回傳 JSON 結果
         return JSONResponse(content=response_json)
@@ -480,3 +839,188 @@ async def response(
         logger.error(f"處理請求時發生錯誤: {str(e)}")
         error_response = {"error": f"處理請求時發生錯誤: {str(e)}"}
         return JSONResponse(content=error_response, status_code=500)
+
+@app.post("/api/search/stream")
+async def stream_response(
+    body=Body(None),
+    current_user: Annotated[User, Depends(get_current_active_user)] = None
+):
+    """
+    以Server-Sent Events串流處理用戶產品比較請求
+    依序傳送keywords、search_results、product、token事件，最後以result事件傳送解析後的JSON
+    """
+    try:
+        user_query = parse_user_query(body)
+    except Exception as e:
+        logger.error(f"處理請求時發生錯誤: {str(e)}")
+        return JSONResponse(content={"error": f"處理請求時發生錯誤: {str(e)}"}, status_code=400)
+    logger.info(f"收到用戶串流查詢: {user_query}")
+    user_id = current_user.id
+    
+    async def event_stream():
+        # RAG流程是同步的產生器，在執行緒池中逐一取出事件
+        async for event, data in iterate_in_threadpool(rag_service.stream_product_comparison(user_query)):
+            if event != "result":
+                yield sse_event(event, data)
+                continue
+            
+            original_response, response_json = data
+            # 串流開始後依賴注入的session已關閉，另開session儲存問答記錄
+            try:
+                await database.write(save_query_record, QueryRecord(user_id=user_id, query=user_query, response=original_response))
+            except Exception as e:
+                logger.error(f"儲存問答記錄時發生錯誤: {str(e)}")
+            yield sse_event("result", response_json)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 避免nginx緩衝事件
+    )
+
+#取出未完成的背景工作
+def load_unfinished_jobs() -> List[str]:
+    """取出重啟前排隊中或執行中的工作，依建立時間排序"""
+    with Session(engine) as session:
+        statement = select(ComparisonJob).where(ComparisonJob.status.in_(["queued", "running"]))\
+            .order_by(ComparisonJob.created_at)
+        return [job.id for job in session.exec(statement).all()]
+
+#開始執行背景工作
+def start_comparison_job(session: Session, job_id: str):
+    """將工作標記為執行中，工作不存在或已結束時回傳None，否則回傳(user_id, query)"""
+    job = session.get(ComparisonJob, job_id)
+    if job is None or job.status in ("done", "failed"):
+        return None
+    job.status = "running"
+    job.started_at = datetime.now()
+    session.add(job)
+    session.commit()
+    return job.user_id, job.query
+
+#背景工作失敗
+def fail_comparison_job(session: Session, job_id: str, error: str):
+    job = session.get(ComparisonJob, job_id)
+    job.status = "failed"
+    job.error = error
+    job.finished_at = datetime.now()
+    session.add(job)
+    session.commit()
+
+#背景工作完成，儲存問答記錄
+def finish_comparison_job(session: Session, job_id: str, user_id: int, user_query: str, original_response: str, response_json: dict):
+    query_record = QueryRecord(user_id=user_id, query=user_query, response=original_response)
+    session.add(query_record)
+    session.flush()
+    
+    job = session.get(ComparisonJob, job_id)
+    job.status = "done"
+    job.result = json.dumps(response_json, ensure_ascii=False)
+    job.record_id = query_record.id
+    job.finished_at = datetime.now()
+    session.add(job)
+    session.commit()
+
+#執行背景比較工作
+async def run_comparison_job(job_id: str):
+    """
+    執行單一背景比較工作，完成時寫入問答記錄
+    RAG回傳錯誤結果時工作標記為失敗，不寫入問答記錄
+
+    Raises:
+        RuntimeError: RAG回傳錯誤結果
+    """
+    claimed = await database.write(start_comparison_job, job_id)
+    if claimed is None:
+        return
+    user_id, user_query = claimed
+    
+    try:
+        original_response, response_json = await rag_service.aprocess_product_comparison(user_query)
+    except Exception as e:
+        await database.write(fail_comparison_job, job_id, str(e))
+        raise
+    
+    # aprocess_product_comparison發生錯誤時不會拋出例外，而是回傳含error的結果
+    if "error" in response_json:
+        await database.write(fail_comparison_job, job_id, response_json["error"])
+        raise RuntimeError(response_json["error"])
+    
+    await database.write(finish_comparison_job, job_id, user_id, user_query, original_response, response_json)
+
+job_queue = JobQueue(run_comparison_job, workers=job_workers, max_size=job_queue_size)
+
+def job_to_response(job: ComparisonJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "query": job.query,
+        "result": json.loads(job.result) if job.result else None,
+        "record_id": job.record_id,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+#儲存新的比較工作
+def save_comparison_job(session: Session, job: ComparisonJob) -> ComparisonJob:
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+#刪除無法排入佇列的比較工作
+def delete_comparison_job(session: Session, job_id: str):
+    job = session.get(ComparisonJob, job_id)
+    if job is not None:
+        session.delete(job)
+        session.commit()
+
+# 建立背景比較工作
+@app.post("/api/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_comparison_job(
+    body=Body(None),
+    current_user: Annotated[User, Depends(get_current_active_user)] = None
+):
+    """排入產品比較工作並立即回傳工作ID"""
+    try:
+        user_query = parse_user_query(body)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"處理請求時發生錯誤: {str(e)}")
+    
+    # 佇列只能在事件迴圈中操作，資料庫寫入交給執行緒池
+    job = await database.write(save_comparison_job, ComparisonJob(user_id=current_user.id, query=user_query))
+    
+    try:
+        job_queue.submit(job.id)
+    except asyncio.QueueFull:
+        await database.write(delete_comparison_job, job.id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="目前比較工作過多，請稍後再試",
+            headers={"Retry-After": "10"},
+        )
+    
+    logger.info(f"排入比較工作 {job.id}: {user_query}")
+    return job_to_response(job)
+
+# 背景工作佇列統計
+@app.get("/api/jobs/metrics")
+async def get_job_metrics(current_user: Annotated[User, Depends(get_current_active_user)]):
+    """獲取背景工作佇列深度與等待時間統計"""
+    return job_queue.metrics()
+
+# 查詢背景比較工作
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+def get_comparison_job(
+    job_id: str,
+    current_user: Annotated[User, Depends(get_current_active_user)] = None,
+    session: v_session = None
+):
+    """獲取比較工作的狀態，完成時包含結果"""
+    job = session.get(ComparisonJob, job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="工作不存在或無權存取")
+    return job_to_response(job)
+
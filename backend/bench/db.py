@@ -0,0 +1,242 @@
+"""
+資料庫混合負載測試
+同時讀取歷史記錄(COUNT加一頁摘要)與寫入問答記錄，比較原本的SQLite設定、WAL加調整過的pragmas，
+以及在事件迴圈中以執行緒池或aiosqlite讀取的延遲、吞吐量與事件迴圈延遲。
+
+用法(在backend目錄下):
+    python -m bench.db --readers 8 --writers 2 --duration 10
+    python -m bench.db --configs tuned,async --readers 32 --json bench/results/db.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import argparse
+import tempfile
+import asyncio
+import logging
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+# baseline: 原本的設定；tuned: WAL與pragmas；threadpool/async: 在事件迴圈中以執行緒池或aiosqlite讀取
+CONFIGS = ("baseline", "tuned", "threadpool", "async")
+
+# 問答記錄的回應大小，與實際的比較結果相近
+RESPONSE_SIZE = 4096
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="資料庫混合負載測試")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="以逗號分隔的設定: " + ", ".join(CONFIGS))
+    parser.add_argument("--readers", type=int, default=8, help="同時讀取歷史記錄的數量")
+    parser.add_argument("--writers", type=int, default=2, help="同時寫入問答記錄的數量")
+    parser.add_argument("--duration", type=float, default=10, help="每個設定執行的秒數")
+    parser.add_argument("--users", type=int, default=50, help="預先建立的用戶數")
+    parser.add_argument("--records", type=int, default=200, help="每個用戶預先建立的問答記錄數")
+    parser.add_argument("--pages", type=int, default=5, help="讀取時隨機選擇前幾頁")
+    parser.add_argument("--json", help="把結果寫入JSON檔案")
+    return parser.parse_args(argv)
+
+def percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * p / 100)))]
+
+def summarize(latencies, errors, duration):
+    ordered = sorted(latencies)
+    return {
+        "ops": len(ordered),
+        "ops_per_second": round(len(ordered) / duration, 1),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        "errors": errors,
+    }
+
+def seed(path, users, records):
+    """建立資料表並寫入測試資料"""
+    from sqlmodel import SQLModel, Session, create_engine
+    from app.main import User, QueryRecord
+    from datetime import datetime, timedelta
+
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    start = datetime.now() - timedelta(days=30)
+    with Session(engine) as session:
+        for user_id in range(1, users + 1):
+            session.add(User(id=user_id, user_name=f"user{user_id}", email=f"user{user_id}@bench.local", hashed_password="x"))
+            for index in range(records):
+                session.add(QueryRecord(
+                    user_id=user_id,
+                    query=f"查詢 {index}",
+                    response="x" * RESPONSE_SIZE,
+                    created_at=start + timedelta(minutes=index)
+                ))
+        session.commit()
+    engine.dispose()
+
+class Workload:
+    """讀取與寫入的操作，同步與非同步共用"""
+
+    def __init__(self, users, pages):
+        from app.main import QueryRecord, history_page_statement, history_count_statement, save_query_record
+        self.QueryRecord = QueryRecord
+        self.page_statement = history_page_statement
+        self.count_statement = history_count_statement
+        self.save = save_query_record
+        self.users = users
+        self.pages = pages
+
+    def read_statements(self):
+        user_id = random.randint(1, self.users)
+        return self.count_statement(user_id), self.page_statement(user_id, 10, random.randrange(self.pages) * 10)
+
+    def new_record(self):
+        return self.QueryRecord(user_id=random.randint(1, self.users), query="新的查詢", response="y" * RESPONSE_SIZE)
+
+def run_threads(engine, workload, readers, writers, duration):
+    """以執行緒與同步Session執行混合負載"""
+    from sqlmodel import Session
+    from sqlalchemy.exc import OperationalError
+
+    deadline = time.perf_counter() + duration
+    results = {"read": ([], [0]), "write": ([], [0])}
+    lock = threading.Lock()
+
+    def loop(kind):
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with Session(engine) as session:
+                    if kind == "read":
+                        count_statement, page_statement = workload.read_statements()
+                        session.exec(count_statement).one()
+                        session.exec(page_statement).all()
+                    else:
+                        workload.save(session, workload.new_record())
+            except OperationalError:
+                # 例如database is locked
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        with lock:
+            results[kind][0].extend(latencies)
+            results[kind][1][0] += errors
+
+    with ThreadPoolExecutor(max_workers=readers + writers) as executor:
+        for kind, count in (("read", readers), ("write", writers)):
+            for _ in range(count):
+                executor.submit(loop, kind)
+    return {kind: summarize(latencies, errors[0], duration) for kind, (latencies, errors) in results.items()}
+
+async def run_async(database, workload, readers, writers, duration):
+    """以asyncio執行混合負載，與API相同透過Database讀寫"""
+    from sqlalchemy.exc import OperationalError
+
+    deadline = time.perf_counter() + duration
+    results = {"read": ([], [0]), "write": ([], [0])}
+    lag = []
+
+    async def loop(kind):
+        latencies, errors = results[kind]
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if kind == "read":
+                    count_statement, page_statement = workload.read_statements()
+                    await database.read(count_statement)
+                    await database.read(page_statement)
+                else:
+                    await database.write(workload.save, workload.new_record())
+            except OperationalError:
+                errors[0] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    async def monitor():
+        # 量測事件迴圈延遲，同步查詢阻塞事件迴圈時會變大
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag.append(time.perf_counter() - start - 0.01)
+
+    tasks = [loop("read") for _ in range(readers)] + [loop("write") for _ in range(writers)]
+    await asyncio.gather(monitor(), *tasks)
+    summary = {kind: summarize(latencies, errors[0], duration) for kind, (latencies, errors) in results.items()}
+    summary["loop_lag_p99_ms"] = round(percentile(sorted(lag), 99) * 1000, 2)
+    return summary
+
+def run_config(name, path, args, workload):
+    from app.database import Database, create_sqlite_engine
+    if name == "baseline":
+        # 原本的設定: 預設的rollback journal，沒有pragmas
+        from sqlmodel import create_engine
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        try:
+            return run_threads(engine, workload, args.readers, args.writers, args.duration)
+        finally:
+            engine.dispose()
+    if name == "tuned":
+        engine = create_sqlite_engine(path, pool_size=args.readers + args.writers, max_overflow=0)
+        try:
+            return run_threads(engine, workload, args.readers, args.writers, args.duration)
+        finally:
+            engine.dispose()
+
+    database = Database(path, pool_size=args.readers + args.writers, max_overflow=0, use_async=name == "async")
+
+    async def run():
+        try:
+            return await run_async(database, workload, args.readers, args.writers, args.duration)
+        finally:
+            await database.dispose()
+    return asyncio.run(run())
+
+def print_result(name, result):
+    for kind in ("read", "write"):
+        stats = result[kind]
+        print(f"{name:<10} {kind:<6} {stats['ops_per_second']:>8} ops/s  p50 {stats['p50_ms']:>8}ms  "
+              f"p95 {stats['p95_ms']:>8}ms  p99 {stats['p99_ms']:>8}ms  錯誤 {stats['errors']}")
+    if "loop_lag_p99_ms" in result:
+        print(f"{name:<10} 事件迴圈延遲p99 {result['loop_lag_p99_ms']}ms")
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="pchome-db-bench-")
+    os.environ.setdefault("database_file", os.path.join(workdir, "app.db"))
+    os.environ.setdefault("cache_db_path", os.path.join(workdir, "cache.db"))
+    os.environ.setdefault("model_name", "gemini-2.0-flash")
+    os.environ.setdefault("refresh_interval", "0")
+    logging.basicConfig(level=logging.WARNING)
+    # 載入app.main取得資料表定義與實際使用的查詢
+    import app.main  # noqa: F401
+    logging.getLogger().setLevel(logging.WARNING)
+
+    seeded = os.path.join(workdir, "seed.db")
+    print(f"建立 {args.users} 個用戶，每個用戶 {args.records} 筆問答記錄...")
+    seed(seeded, args.users, args.records)
+    workload = Workload(args.users, args.pages)
+
+    results = {"settings": {key: value for key, value in vars(args).items() if key != "json"}, "configs": {}}
+    print(f"讀取 {args.readers}、寫入 {args.writers}，每個設定 {args.duration}秒\n")
+    try:
+        for name in args.configs.split(","):
+            path = os.path.join(workdir, f"{name}.db")
+            shutil.copyfile(seeded, path)
+            result = run_config(name, path, args, workload)
+            results["configs"][name] = result
+            print_result(name, result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
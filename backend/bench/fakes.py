@@ -0,0 +1,358 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from requests.adapters import HTTPAdapter
+from package.context_builder import estimate_tokens
+from package.reranker import tokenize
+from html import escape
+import threading
+import asyncio
+import json
+import time
+import zlib
+import re
+
+# 模擬的PChome網址，實際請求會轉到本地的FakePChomeServer
+PCHOME_BASE_URL = "https://24h.pchome.com.tw"
+
+# 比較提示詞中每個商品的欄位
+_PRODUCT_LINE = re.compile(r"^\s*(商品名稱|品牌|售價|購買連結): (.+)$", re.MULTILINE)
+
+def product_url(product):
+    """商品在PChome上的網址"""
+    return f"{PCHOME_BASE_URL}/prod/{product['id']}"
+
+def render_product_page(product, padding_bytes=150 * 1024):
+    """
+    產生與PChome商品頁面結構相同的HTML
+
+    Args:
+        product: catalog.json中的商品
+        padding_bytes: 額外的script與導覽列大小，模擬真實頁面中與商品無關的內容
+
+    Returns:
+        HTML字串
+    """
+    features = "".join(f"<li>{escape(feature)}</li>" for feature in product["features"])
+    specs_text = "".join(f"<p>{escape(line)}</p>" for line in product["specs_text"])
+    spec_rows = "".join(
+        f'<tr><th>{escape(key)}</th><td><div class="c-tableGrid__htmlText">{escape(value)}</div></td></tr>'
+        for key, value in product["specs"]
+    )
+    original_price = (
+        f'<div class="o-prodPrice__originalPrice">{escape(product["original_price"])}</div>'
+        if product["original_price"] else ""
+    )
+
+    # 真實頁面大部分是內嵌的JSON與導覽列，解析器仍需要掃過這些內容
+    nav_item = '<li class="c-menu__item"><a href="/region/DHAF">筆記型電腦</a></li>'
+    nav = "".join(nav_item for _ in range(padding_bytes // 2 // len(nav_item)))
+    state = json.dumps({"items": ["x" * 64] * (padding_bytes // 2 // 70)})
+
+    return f"""<!DOCTYPE html>
+<html lang="zh-TW"><head><meta charset="utf-8"><title>{escape(product['name'])} - PChome 24h購物</title>
+<script>window.__INITIAL_STATE__ = {state};</script></head>
+<body>
+<ul class="c-menu">{nav}</ul>
+<div class="c-prodInfoV2">
+  <span class="o-prodMainName__colorSecondary">{escape(product['brand'])}</span>
+  <h1 class="o-prodMainName o-prodMainName__grayDarkest--l700">{escape(product['name'])}</h1>
+  <ul class="c-blockCombine__list c-blockCombine__list--prodSlogan">{features}</ul>
+  <div class="o-prodPrice">
+    <div class="o-prodPrice__price">{escape(product['price'])}</div>
+    {original_price}
+  </div>
+</div>
+<div class="c-blockCombine">
+  <div class="c-blockCombine__item c-blockCombine__item--prodSpecification">{specs_text}</div>
+</div>
+<table class="c-tableGrid c-tableGrid--prodSpec"><tbody>{spec_rows}</tbody></table>
+</body></html>"""
+
+class FakePChomeServer:
+    """
+    提供商品頁面的本地HTTP伺服器
+    回應帶有ETag，支援If-None-Match條件式請求，可設定每個請求的延遲
+    """
+
+    def __init__(self, pages, latency=0.05, etag=True, host="127.0.0.1", port=0):
+        """
+        初始化伺服器
+
+        Args:
+            pages: {商品ID: HTML字串}
+            latency: 每個請求的延遲秒數
+            etag: 是否提供ETag並回應304
+            host: 監聽位址
+            port: 監聽埠號，0則自動選擇
+        """
+        self.pages = {product_id: html.encode("utf-8") for product_id, html in pages.items()}
+        self.latency = latency
+        self.etag = etag
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "not_modified": 0, "not_found": 0, "bytes": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive，讓HTTPClient的連線池可以重用連線
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._count("requests")
+                time.sleep(server.latency)
+                match = re.match(r"^/prod/([A-Za-z0-9]+-[A-Za-z0-9]+)", self.path)
+                body = server.pages.get(match.group(1).upper()) if match else None
+                if body is None:
+                    server._count("not_found")
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = f'"{zlib.crc32(body):08x}"'
+                if server.etag and self.headers.get("If-None-Match") == etag:
+                    server._count("not_modified")
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                server._count("bytes", len(body))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if server.etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-pchome", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+class PChomeRedirectAdapter(HTTPAdapter):
+    """把PChome網址的請求轉到本地伺服器，其餘行為(連線池、重試)與原本的adapter相同"""
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = request.url.replace(PCHOME_BASE_URL, self.base_url, 1)
+        return super().send(request, **kwargs)
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+class FakeGeminiResponse:
+    """與Gemini回應相同介面的物件"""
+
+    def __init__(self, text, prompt_tokens=0, output_tokens=0):
+        self.text = text
+        self.parts = [text] if text else []
+        self.usage_metadata = _Usage(prompt_tokens, output_tokens)
+
+class FakeGeminiModel:
+    """
+    取代GenerativeModel的假模型
+    回應時間為固定延遲加上輸出token數除以每秒token數，串流時依同樣的速率分段輸出。
+    比較提示詞回傳以提示詞中的商品組成的JSON，其餘提示詞回傳搜尋關鍵字
+    """
+
+    def __init__(self, latency=0.5, tokens_per_second=150, chunk_tokens=20):
+        """
+        初始化假模型
+
+        Args:
+            latency: 第一個token之前的延遲秒數
+            tokens_per_second: 輸出速度
+            chunk_tokens: 串流時每個片段的token數
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _reply(self, prompt):
+        with self._lock:
+            self.calls += 1
+        if "JSON" not in prompt:
+            user_query = prompt.rsplit("用戶需求:", 1)[-1].strip()
+            return "最終關鍵字: " + " ".join(word for word in re.split(r"[\s,，。、]+", user_query) if word)[:40]
+
+        products = []
+        current = {}
+        for label, value in _PRODUCT_LINE.findall(prompt):
+            if label == "商品名稱" and current:
+                products.append(current)
+                current = {}
+            current[label] = value.strip()
+        if current:
+            products.append(current)
+
+        comparisons = [
+            {
+                "product_name": product.get("商品名稱", ""),
+                "brand": product.get("品牌", ""),
+                "price": product.get("售價", ""),
+                "pros": ["規格符合需求", "價格合理"],
+                "cons": ["重量偏重"],
+                "key_features": ["效能穩定"],
+                "suitable_scenarios": ["日常使用"],
+                "rating": round(9.0 - index * 0.4, 1),
+                "link": product.get("購買連結", ""),
+            }
+            for index, product in enumerate(products[:4])
+        ]
+        names = [item["product_name"] for item in comparisons] or [""]
+        return json.dumps({
+            "comparison_results": {
+                "best_choice": names[0],
+                "best_value": names[-1],
+                "best_quality": names[0],
+                "most_features": names[0],
+            },
+            "product_comparisons": comparisons,
+            "analysis": "整體而言，第一個商品最符合需求。",
+        }, ensure_ascii=False)
+
+    def _output_seconds(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        text = self._reply(contents)
+        prompt_tokens = estimate_tokens(contents)
+        output_tokens = estimate_tokens(text)
+        if stream:
+            return self._stream(text, prompt_tokens, output_tokens)
+        time.sleep(self.latency + self._output_seconds(output_tokens))
+        return FakeGeminiResponse(text, prompt_tokens, output_tokens)
+
+    def _stream(self, text, prompt_tokens, output_tokens):
+        time.sleep(self.latency)
+        # 以字元數近似切成每段chunk_tokens個token
+        step = max(1, len(text) * self.chunk_tokens // max(output_tokens, 1))
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        for index, piece in enumerate(pieces):
+            time.sleep(self._output_seconds(estimate_tokens(piece)))
+            last = index == len(pieces) - 1
+            yield FakeGeminiResponse(piece, prompt_tokens if last else 0, output_tokens if last else 0)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        text = self._reply(contents)
+        output_tokens = estimate_tokens(text)
+        await asyncio.sleep(self.latency + self._output_seconds(output_tokens))
+        return FakeGeminiResponse(text, estimate_tokens(contents), output_tokens)
+
+    def count_tokens(self, contents):
+        return _Usage(estimate_tokens(contents), 0)
+
+class _FakeSearchRequest:
+    def __init__(self, service, params):
+        self.service = service
+        self.params = params
+
+    def execute(self, http=None):
+        return self.service.search(self.params["q"], self.params.get("num", 10))
+
+class FakeSearchService:
+    """
+    取代Custom Search服務物件的假搜尋
+    以查詢與商品名稱、特色共有的詞數排序catalog中的商品，回傳與CSE相同格式的items
+    """
+
+    def __init__(self, products, latency=0.15):
+        """
+        初始化假搜尋
+
+        Args:
+            products: catalog.json中的商品列表
+            latency: 每次搜尋的延遲秒數
+        """
+        self.products = products
+        self.latency = latency
+        self._tokens = [set(tokenize(" ".join([product["name"], product["brand"], *product["features"]]))) for product in products]
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def cse(self):
+        return self
+
+    def list(self, **params):
+        return _FakeSearchRequest(self, params)
+
+    def search(self, query, num=10):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        query_tokens = set(tokenize(query.split(" ", 1)[-1]))
+        scored = sorted(
+            ((len(query_tokens & tokens), index) for index, tokens in enumerate(self._tokens)),
+            key=lambda item: (-item[0], item[1])
+        )
+        items = []
+        for score, index in scored[:num]:
+            if score == 0:
+                break
+            product = self.products[index]
+            items.append({
+                "title": f"{product['name']} - PChome 24h購物",
+                "link": product_url(product),
+                "snippet": " ".join(product["features"]),
+                "displayLink": "24h.pchome.com.tw",
+            })
+        return {"items": items}
+
+def install_fakes(rag_service, gemini, search, pchome_base_url):
+    """
+    把假的Gemini、Custom Search與PChome換進RAGService，需在lifespan啟動前呼叫
+
+    Args:
+        rag_service: RAGService
+        gemini: FakeGeminiModel，所有階段共用
+        search: FakeSearchService
+        pchome_base_url: FakePChomeServer的網址
+    """
+    for model_name in set(rag_service.stage_models.values()):
+        rag_service._models[model_name] = gemini
+    rag_service._search_service = search
+
+    # 沿用原本adapter的連線池大小與重試設定
+    adapter = rag_service.http_client._adapter
+    rag_service.http_client.session.mount(PCHOME_BASE_URL + "/", PChomeRedirectAdapter(
+        pchome_base_url,
+        pool_connections=adapter._pool_connections,
+        pool_maxsize=adapter._pool_maxsize,
+        max_retries=adapter.max_retries
+    ))
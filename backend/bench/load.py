@@ -0,0 +1,287 @@
+"""
+離線端對端負載測試
+以本地的假Gemini、假Custom Search與假PChome伺服器啟動FastAPI應用程式，
+在不同併發數下送出產品比較請求，回報延遲百分位數、每秒請求數與各階段耗時。
+
+用法(在backend目錄下):
+    python -m bench.load --concurrency 1,4,16 --requests 48 --json bench/results/now.json
+    python -m bench.load --compare bench/results/baseline.json
+"""
+from bench.fakes import FakeGeminiModel, FakeSearchService, FakePChomeServer, render_product_page, install_fakes
+from package.pchome_parser import extract_product_id
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import threading
+import itertools
+import argparse
+import tempfile
+import logging
+import socket
+import json
+import time
+import sys
+import os
+
+# 範例商品與查詢
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), "catalog.json")
+
+# 回報的延遲百分位數
+PERCENTILES = (50, 95, 99)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="離線端對端負載測試")
+    parser.add_argument("--concurrency", default="1,4,16", help="以逗號分隔的併發數")
+    parser.add_argument("--requests", type=int, default=48, help="每個併發數送出的請求數")
+    parser.add_argument("--endpoint", default="/api/search", choices=["/api/search", "/api/search/stream"])
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="假Gemini第一個token前的延遲秒數")
+    parser.add_argument("--tokens-per-second", type=float, default=150, help="假Gemini的輸出速度")
+    parser.add_argument("--search-latency", type=float, default=0.15, help="假Custom Search的延遲秒數")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="假PChome每個頁面的延遲秒數")
+    parser.add_argument("--page-size-kb", type=int, default=150, help="商品頁面中與商品無關的內容大小")
+    parser.add_argument("--corpus", help="以bench/corpus中這個版本的頁面取代產生的商品頁面，例如v1")
+    parser.add_argument("--no-etag", action="store_true", help="假PChome不回應304，每次都下載並解析完整頁面")
+    parser.add_argument("--warm-cache", action="store_true", help="保留結果、近似查詢、搜尋與商品快取(預設全部停用)")
+    parser.add_argument("--json", help="把結果寫入JSON檔案")
+    parser.add_argument("--compare", help="與之前的JSON結果比較")
+    parser.add_argument("--threshold", type=float, default=0.1, help="延遲增加或吞吐量下降超過這個比例視為退步")
+    return parser.parse_args(argv)
+
+def configure_environment(args, workdir):
+    """在載入app.main前設定環境變數，已設定的變數不覆寫"""
+    defaults = {
+        "database_file": os.path.join(workdir, "database.db"),
+        "cache_db_path": os.path.join(workdir, "cache.db"),
+        "gemini_api_key": "bench",
+        "google_search_api_key": "bench",
+        "google_cse_id": "bench",
+        "model_name": "gemini-2.0-flash",
+        "secret_key": "bench",
+        "refresh_interval": "0",
+        "retriever_mode": "google",
+        # 所有請求都經過Gemini，關鍵字階段的耗時才有意義
+        "keyword_min_confidence": "2",
+    }
+    if not args.warm_cache:
+        defaults.update({
+            "result_cache_ttl": "0",
+            "semantic_cache_ttl": "0",
+            "search_cache_ttl": "0",
+            "search_cache_persist": "false",
+            "price_ttl": "0",
+            "specs_ttl": "0",
+        })
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+def percentile(values, p):
+    """線性內插的百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class AppServer:
+    """在背景執行緒中以uvicorn執行FastAPI應用程式"""
+
+    def __init__(self, app):
+        import uvicorn
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="bench-app", daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=120):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("FastAPI應用程式啟動失敗")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+def login(base_url):
+    """註冊測試用戶並取得access token"""
+    import requests
+    user_name = f"bench_{int(time.time() * 1000)}"
+    password = "bench-password"
+    requests.post(f"{base_url}/api/register", json={"user_name": user_name, "email": f"{user_name}@bench.local", "password": password}, timeout=30).raise_for_status()
+    response = requests.post(f"{base_url}/api/token", data={"username": user_name, "password": password}, timeout=30)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+def stage_totals():
+    """各階段目前的(次數, 總秒數)"""
+    from package.metrics import RAG_STAGE_SECONDS, GEMINI_SECONDS, FETCH_SECONDS
+    from app.main import db_query_seconds
+    totals = {}
+    for key, value in RAG_STAGE_SECONDS.totals().items():
+        totals[dict(key)["stage"]] = value
+    for name, histogram in (("gemini", GEMINI_SECONDS), ("page_fetch", FETCH_SECONDS)):
+        count = sum(value[0] for value in histogram.totals().values())
+        seconds = sum(value[1] for value in histogram.totals().values())
+        totals[name] = (count, seconds)
+    db = db_query_seconds.totals()
+    totals["db_query"] = (sum(value[0] for value in db.values()), sum(value[1] for value in db.values()))
+    return totals
+
+def stage_breakdown(before, after):
+    """兩次快照之間各階段的平均毫秒數"""
+    breakdown = {}
+    for stage, (count, seconds) in after.items():
+        prev_count, prev_seconds = before.get(stage, (0, 0.0))
+        if count > prev_count:
+            breakdown[stage] = {
+                "count": count - prev_count,
+                "avg_ms": round((seconds - prev_seconds) / (count - prev_count) * 1000, 2),
+            }
+    return breakdown
+
+def run_level(base_url, endpoint, token, queries, concurrency, total):
+    """
+    以固定併發數送出total個請求
+
+    Returns:
+        dict: 延遲百分位數、每秒請求數、錯誤數與各階段耗時
+    """
+    import requests
+    local = threading.local()
+    query_cycle = itertools.cycle(queries)
+    query_lock = threading.Lock()
+
+    def send(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.headers["Authorization"] = f"Bearer {token}"
+        with query_lock:
+            query = next(query_cycle)
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}{endpoint}", json={"content": query}, timeout=300, stream=True)
+            # 串流端點要讀到result事件才算完成
+            body = b"".join(response.iter_content(chunk_size=None))
+            ok = response.status_code == 200 and b'"error"' not in body
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    before = stage_totals()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(total)))
+    wall = time.perf_counter() - start
+    after = stage_totals()
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(1 for _, ok in results if not ok),
+        "rps": round(total / wall, 2),
+        **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 1) for p in PERCENTILES},
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+        "stages": stage_breakdown(before, after),
+    }
+
+def print_level(result):
+    print(f"\n併發 {result['concurrency']:>3} | 請求 {result['requests']} | 錯誤 {result['errors']} | "
+          f"{result['rps']} req/s | p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms")
+    for stage, stats in result["stages"].items():
+        print(f"    {stage:<12} {stats['count']:>5} 次  平均 {stats['avg_ms']:>9.2f}ms")
+
+def compare(results, baseline, threshold):
+    """
+    與基準結果比較
+
+    Returns:
+        list: 退步的項目說明
+    """
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    print("\n與基準比較:")
+    for level in results["levels"]:
+        base = previous.get(level["concurrency"])
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            if not base[key]:
+                continue
+            change = (level[key] - base[key]) / base[key]
+            # 延遲增加或吞吐量下降才算退步
+            worse = change > threshold if key != "rps" else change < -threshold
+            mark = "  <-- 退步" if worse else ""
+            print(f"    併發 {level['concurrency']:>3} {key:<7} {base[key]:>9} -> {level[key]:>9} ({change:+.1%}){mark}")
+            if worse:
+                regressions.append(f"併發 {level['concurrency']} {key} {change:+.1%}")
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="pchome-bench-")
+    configure_environment(args, workdir)
+    logging.basicConfig(level=logging.WARNING)
+
+    with open(CATALOG_PATH, encoding="utf-8") as f:
+        catalog = json.load(f)
+    pages = {product["id"]: render_product_page(product, args.page_size_kb * 1024) for product in catalog["products"]}
+    if args.corpus:
+        from bench.parser import iter_pages
+        pages.update({extract_product_id(page["url"]): content.decode("utf-8") for _, page, content in iter_pages([args.corpus])})
+    pchome = FakePChomeServer(pages, latency=args.page_latency, etag=not args.no_etag).start()
+
+    # 環境變數設定好之後才載入應用程式
+    import app.main as main_app
+    # 應用程式的INFO日誌會拖慢測試
+    logging.getLogger().setLevel(logging.WARNING)
+    gemini = FakeGeminiModel(latency=args.gemini_latency, tokens_per_second=args.tokens_per_second)
+    search = FakeSearchService(catalog["products"], latency=args.search_latency)
+    install_fakes(main_app.rag_service, gemini, search, pchome.base_url)
+
+    server = AppServer(main_app.app)
+    server.start()
+    try:
+        token = login(server.base_url)
+        results = {
+            "endpoint": args.endpoint,
+            "settings": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+            "levels": [],
+        }
+        for concurrency in (int(value) for value in args.concurrency.split(",")):
+            level = run_level(server.base_url, args.endpoint, token, catalog["queries"], concurrency, args.requests)
+            print_level(level)
+            results["levels"].append(level)
+        results["fakes"] = {"gemini_calls": gemini.calls, "search_calls": search.calls, "pchome": pchome.stats()}
+    finally:
+        server.stop()
+        pchome.stop()
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n結果已寫入 {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n發現 {len(regressions)} 項退步: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
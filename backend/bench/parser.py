@@ -0,0 +1,272 @@
+"""
+商品頁面解析的正確性檢查與微基準測試
+corpus目錄中每個版本(v1、v2...)對應一種PChome頁面版型，每個頁面有HTML與golden輸出。
+
+用法(在backend目錄下):
+    python -m bench.parser check                 # 比對所有版本的解析結果與golden輸出
+    python -m bench.parser bench --repeat 20     # 量測pages/s、bytes/s與記憶體峰值
+    python -m bench.parser record v2 URL ...     # 儲存實際的商品頁面並產生golden輸出
+    python -m bench.parser update-golden v1      # 解析器有意變更後重新產生golden輸出
+"""
+from package.pchome_parser import parse_product_page, extract_product_id
+from package.product import ProductRecord
+from datetime import datetime
+import statistics
+import tracemalloc
+import argparse
+import json
+import time
+import sys
+import os
+
+# 頁面與golden輸出的目錄
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+# 解析模式: 完整解析、只建立需要節點的快速路徑、只解析價格
+MODES = {
+    "full": {"fast": False},
+    "fast": {"fast": True},
+    "price_only": {"fast": True, "price_only": True},
+}
+
+# 版型改變時解析器會退回這些預設值
+MISSING_VALUES = {"name": "無商品名稱", "brand": "查無品牌", "price": "無價格資訊"}
+
+def load_manifest(version):
+    with open(os.path.join(CORPUS_DIR, version, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(version, manifest):
+    with open(os.path.join(CORPUS_DIR, version, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def list_versions():
+    return sorted(
+        name for name in os.listdir(CORPUS_DIR)
+        if os.path.isfile(os.path.join(CORPUS_DIR, name, "manifest.json"))
+    )
+
+def iter_pages(versions):
+    """
+    讀取corpus中的頁面
+
+    Yields:
+        tuple: (版本, manifest中的頁面資料, HTML bytes)
+    """
+    for version in versions:
+        for page in load_manifest(version)["pages"]:
+            with open(os.path.join(CORPUS_DIR, version, page["file"]), "rb") as f:
+                yield version, page, f.read()
+
+def golden_output(url, html):
+    """
+    產生golden輸出，包含解析後的欄位與get_pchome_product_info的文字
+
+    Args:
+        url: 商品頁面網址
+        html: 商品頁面HTML字串
+
+    Returns:
+        dict
+    """
+    fields = parse_product_page(html, fast=False)
+    return {
+        "fields": fields,
+        "rendered": ProductRecord.from_fields(url, fields, extract_product_id(url)).render(),
+    }
+
+def write_golden(version, page, html):
+    path = os.path.join(CORPUS_DIR, version, page["golden"])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(golden_output(page["url"], html), f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def diff_fields(expected, actual):
+    """列出不同的欄位"""
+    return [key for key in sorted(set(expected) | set(actual)) if expected.get(key) != actual.get(key)]
+
+def check(versions):
+    """
+    比對快速與完整解析的結果和golden輸出，並檢查是否有欄位退回預設值
+
+    Returns:
+        int: 不符合的頁面數量
+    """
+    failures = 0
+    for version, page, content in iter_pages(versions):
+        html = content.decode("utf-8")
+        with open(os.path.join(CORPUS_DIR, version, page["golden"]), encoding="utf-8") as f:
+            golden = json.load(f)
+
+        problems = []
+        for mode in ("full", "fast"):
+            fields = parse_product_page(html, **MODES[mode])
+            changed = diff_fields(golden["fields"], fields)
+            if changed:
+                problems.append(f"{mode}解析的欄位不同: {', '.join(changed)}")
+        price_fields = parse_product_page(html, **MODES["price_only"])
+        changed = [key for key, value in price_fields.items() if golden["fields"].get(key) != value]
+        if changed:
+            problems.append(f"price_only解析的欄位不同: {', '.join(changed)}")
+
+        rendered = golden_output(page["url"], html)["rendered"]
+        if rendered != golden["rendered"]:
+            problems.append("get_pchome_product_info的文字不同")
+
+        missing = [key for key, value in MISSING_VALUES.items() if golden["fields"].get(key) == value]
+        if missing and not page.get("expect_missing"):
+            problems.append(f"golden輸出缺少欄位(版型可能已改變): {', '.join(missing)}")
+
+        status = "FAIL" if problems else "ok"
+        print(f"[{status}] {version}/{page['file']}")
+        for problem in problems:
+            print(f"       {problem}")
+        failures += bool(problems)
+
+    print(f"\n{failures} 個頁面不符合" if failures else "\n所有頁面都符合golden輸出")
+    return failures
+
+def measure(pages, mode, repeat):
+    """
+    重複解析所有頁面
+
+    Returns:
+        dict: pages/s、bytes/s、每頁平均與p95毫秒數
+    """
+    options = MODES[mode]
+    timings = []
+    total_bytes = 0
+    for _ in range(repeat):
+        for html, size in pages:
+            start = time.perf_counter()
+            parse_product_page(html, **options)
+            timings.append(time.perf_counter() - start)
+            total_bytes += size
+    elapsed = sum(timings)
+    ordered = sorted(timings)
+    return {
+        "pages_per_second": round(len(timings) / elapsed, 1),
+        "mb_per_second": round(total_bytes / elapsed / 1024 / 1024, 2),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+        "p95_ms": round(ordered[int((len(ordered) - 1) * 0.95)] * 1000, 3),
+    }
+
+def peak_memory(pages, mode):
+    """解析單一頁面時最大的tracemalloc峰值(KB)，另外量測以免影響速度"""
+    options = MODES[mode]
+    peak = 0
+    for html, _ in pages:
+        tracemalloc.start()
+        parse_product_page(html, **options)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+def bench(versions, modes, repeat, warmup=2):
+    """
+    量測各解析模式的速度與記憶體
+
+    Returns:
+        dict: {模式: 統計資料}
+    """
+    pages = [(content.decode("utf-8"), len(content)) for _, _, content in iter_pages(versions)]
+    total_kb = sum(size for _, size in pages) / 1024
+    print(f"{len(pages)} 個頁面，共 {total_kb:.0f}KB，重複 {repeat} 次\n")
+
+    results = {}
+    for mode in modes:
+        measure(pages, mode, warmup)
+        stats = measure(pages, mode, repeat)
+        stats["peak_kb"] = peak_memory(pages, mode)
+        results[mode] = stats
+        print(f"{mode:<11} {stats['pages_per_second']:>8} pages/s  {stats['mb_per_second']:>7} MB/s  "
+              f"平均 {stats['mean_ms']:>8}ms  p95 {stats['p95_ms']:>8}ms  記憶體峰值 {stats['peak_kb']:>9}KB")
+    return results
+
+def record(version, urls, layout=None):
+    """
+    下載商品頁面存入corpus並產生golden輸出，golden輸出需人工確認後再提交
+
+    Args:
+        version: 版本目錄名稱，不存在時建立
+        urls: 商品頁面網址
+        layout: 版型說明，建立新版本時寫入manifest
+    """
+    from package.http_client import HTTPClient
+    directory = os.path.join(CORPUS_DIR, version)
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, "manifest.json")
+    manifest = load_manifest(version) if os.path.exists(manifest_path) else {"layout": layout or "", "pages": []}
+
+    client = HTTPClient()
+    try:
+        for url in urls:
+            product_id = extract_product_id(url)
+            if product_id is None:
+                print(f"略過非商品頁面: {url}")
+                continue
+            response = client.get(url)
+            if response.status_code != 200:
+                print(f"略過 {url}: HTTP狀態碼 {response.status_code}")
+                continue
+            page = {
+                "file": f"{product_id}.html",
+                "golden": f"{product_id}.golden.json",
+                "url": url,
+                "source": "recorded",
+                "recorded_at": datetime.now().strftime("%Y-%m-%d"),
+            }
+            with open(os.path.join(directory, page["file"]), "wb") as f:
+                f.write(response.content)
+            write_golden(version, page, response.text)
+            manifest["pages"] = [item for item in manifest["pages"] if item["file"] != page["file"]] + [page]
+            print(f"已儲存 {version}/{page['file']} ({len(response.content) / 1024:.0f}KB)")
+    finally:
+        client.close()
+    save_manifest(version, manifest)
+
+def update_golden(versions):
+    """以目前的解析器重新產生golden輸出"""
+    for version, page, content in iter_pages(versions):
+        write_golden(version, page, content.decode("utf-8"))
+        print(f"已更新 {version}/{page['golden']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="商品頁面解析的正確性檢查與微基準測試")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = subparsers.add_parser("check", help="比對解析結果與golden輸出")
+    check_parser.add_argument("versions", nargs="*", help="要檢查的版本，預設全部")
+
+    bench_parser = subparsers.add_parser("bench", help="量測解析速度與記憶體")
+    bench_parser.add_argument("versions", nargs="*", help="要測試的版本，預設全部")
+    bench_parser.add_argument("--repeat", type=int, default=20, help="每個頁面重複解析的次數")
+    bench_parser.add_argument("--modes", default=",".join(MODES), help="以逗號分隔的解析模式")
+    bench_parser.add_argument("--json", help="把結果寫入JSON檔案")
+
+    record_parser = subparsers.add_parser("record", help="儲存實際的商品頁面")
+    record_parser.add_argument("version", help="版本目錄名稱，例如v2")
+    record_parser.add_argument("urls", nargs="+", help="PChome商品頁面網址")
+    record_parser.add_argument("--layout", help="新版型的說明")
+
+    golden_parser = subparsers.add_parser("update-golden", help="重新產生golden輸出")
+    golden_parser.add_argument("versions", nargs="+", help="要更新的版本")
+
+    args = parser.parse_args(argv)
+    if args.command == "check":
+        return 1 if check(args.versions or list_versions()) else 0
+    if args.command == "bench":
+        results = bench(args.versions or list_versions(), args.modes.split(","), args.repeat)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return 0
+    if args.command == "record":
+        record(args.version, args.urls, args.layout)
+        return 0
+    update_golden(args.versions)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import threading
+import asyncio
+import sqlite3
+import logging
+import json
+import time
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """
+    執行緒安全的記憶體LRU快取
+    超過容量時淘汰最久未使用的項目，可為每個項目設定存活時間(TTL)
+    """
+
+    def __init__(self, max_entries=1000, ttl=None):
+        """
+        初始化LRU快取
+
+        Args:
+            max_entries: 最大項目數量
+            ttl: 預設存活秒數，None為不過期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        """
+        取得快取項目
+
+        Args:
+            key: 快取key
+
+        Returns:
+            快取的值，不存在或已過期則回傳None
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        寫入快取項目
+
+        Args:
+            key: 快取key
+            value: 快取的值
+            ttl: 此項目的存活秒數，None則使用預設值
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def pop(self, key):
+        """移除快取項目"""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        取得快取統計資料
+
+        Returns:
+            dict: 命中、未命中、淘汰、過期次數與命中率
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+class SQLiteStore:
+    """
+    以SQLite保存的持久化key-value快取層
+    值以JSON儲存，每筆資料有各自的過期時間
+    """
+
+    def __init__(self, db_path, table):
+        """
+        初始化SQLite快取層
+
+        Args:
+            db_path: SQLite資料庫檔案路徑
+            table: 資料表名稱
+        """
+        self.db_path = db_path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = None
+        try:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # 持久層只是加速用，無法使用時退回純記憶體快取
+            logger.error(f"無法開啟快取資料庫 {db_path}: {e}")
+            self._conn = None
+
+    @property
+    def available(self):
+        return self._conn is not None
+
+    def get(self, key, with_ttl=False):
+        """
+        取得未過期的資料
+
+        Args:
+            key: 快取key
+            with_ttl: 一併回傳剩餘的存活秒數
+
+        Returns:
+            反序列化後的值，不存在或已過期則回傳None；
+            with_ttl為True時回傳(值, 剩餘秒數)，不過期的資料剩餘秒數為None
+        """
+        missing = (None, None) if with_ttl else None
+        if not self.available:
+            return missing
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"讀取快取資料庫錯誤: {e}")
+            return missing
+
+        if row is None:
+            return missing
+        value, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            self.delete(key)
+            return missing
+        if with_ttl:
+            return json.loads(value), (expires_at - now if expires_at is not None else None)
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """
+        寫入資料
+
+        Args:
+            key: 快取key
+            value: 可JSON序列化的值
+            ttl: 存活秒數，None為不過期
+        """
+        if not self.available:
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        try:
+            with self._lock:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"寫入快取資料庫錯誤: {e}")
+
+    def delete(self, key):
+        """刪除資料"""
+        if not self.available:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"刪除快取資料庫錯誤: {e}")
+
+    def purge_expired(self):
+        """
+        清除所有已過期的資料
+
+        Returns:
+            刪除的筆數
+        """
+        if not self.available:
+            return 0
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+                )
+                self._conn.commit()
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"清除過期快取錯誤: {e}")
+            return 0
+
+    def close(self):
+        """關閉資料庫連線"""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+class _Abandoned(Exception):
+    """SingleFlight的執行者沒有完成就離開"""
+
+class SingleFlight:
+    """
+    相同key的併發呼叫只執行一次，其餘呼叫等待並共用同一個結果
+    執行緒(do、join)與asyncio(ado)版本共用同一份執行中的呼叫，同步與非同步的相同請求也只執行一次
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> concurrent.futures.Future
+        self.coalesced = 0
+
+    def _register(self, key):
+        """
+        登記為key的執行者，已有執行者時回傳其Future
+
+        Returns:
+            tuple: (是否為執行者, Future)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = Future()
+                self._calls[key] = future
+                return True, future
+            self.coalesced += 1
+            return False, future
+
+    def join(self, key):
+        """
+        等待相同key的執行者，沒有執行者或執行者中途放棄時登記為執行者
+
+        Args:
+            key: 合併呼叫用的key
+
+        Returns:
+            tuple: (是否為執行者, Future或結果)
+                - 執行者拿到Future，完成後需呼叫finish或abandon
+                - 等待者直接拿到執行者的結果，執行者失敗時拋出同一個例外
+        """
+        while True:
+            leader, future = self._register(key)
+            if leader:
+                return True, future
+            try:
+                return False, future.result()
+            except _Abandoned:
+                continue
+
+    def finish(self, key, future, result=None, exception=None):
+        """
+        執行者完成時把結果或例外交給等待者
+
+        Args:
+            key: 合併呼叫用的key
+            future: join回傳的Future
+            result: 執行結果
+            exception: 執行失敗時的例外
+        """
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+
+    def abandon(self, key, future):
+        """執行者沒有產生結果就離開(例如串流被中斷)，等待者改為重新競爭執行"""
+        self.finish(key, future, exception=_Abandoned())
+
+    def do(self, key, func):
+        """
+        執行func，若相同key正在執行則等待其結果
+
+        Args:
+            key: 合併呼叫用的key
+            func: 無參數的函式
+
+        Returns:
+            func的回傳值
+        """
+        leader, value = self.join(key)
+        if not leader:
+            return value
+
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, value, exception=e)
+            raise
+        self.finish(key, value, result)
+        return result
+
+    async def ado(self, key, coro_func):
+        """
+        do的asyncio版本
+        執行者的呼叫在獨立的task中執行，發起者與等待者都以shield等待，任何一方被取消都不會取消呼叫或其他等待者。
+        執行者是其它執行緒(do或串流)時以wrap_future等待，不阻塞事件迴圈
+
+        Args:
+            key: 合併呼叫用的key
+            coro_func: 無參數的協程函式
+
+        Returns:
+            coro_func的回傳值
+        """
+        while True:
+            leader, future = self._register(key)
+            if leader:
+                task = asyncio.ensure_future(coro_func())
+                task.add_done_callback(lambda done: self._finish_task(key, future, done))
+                return await asyncio.shield(task)
+            try:
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _Abandoned:
+                continue
+
+    def _finish_task(self, key, future, task):
+        """ado的task結束時把結果交給等待者，task被取消時等待者重新競爭執行"""
+        if task.cancelled():
+            self.abandon(key, future)
+        elif task.exception() is not None:
+            self.finish(key, future, exception=task.exception())
+        else:
+            self.finish(key, future, task.result())
@@ -0,0 +1,163 @@
+import logging
+import math
+import re
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# 中日韓文字大約一個字一個token，其它文字大約四個字元一個token
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+# 比較時最重要的規格，排在其它規格前面
+KEY_SPEC_PATTERN = re.compile(
+    r"處理器|cpu|記憶體|ram|顯示卡|顯卡|gpu|螢幕|尺寸|解析度|更新率|硬碟|ssd|容量|儲存|電池|續航|重量|作業系統|"
+    r"功率|瓦數|噪音|防水|連線|藍牙|保固|型號",
+    re.IGNORECASE
+)
+
+def estimate_tokens(text):
+    """
+    估計文字的token數量
+
+    Args:
+        text: 要估計的文字
+
+    Returns:
+        估計的token數量
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def _normalize(text):
+    """去除空白與標點，用於判斷重複內容"""
+    return re.sub(r"[\s:：,，、/|]+", "", text).lower()
+
+class ContextBuilder:
+    """
+    有token預算的檢索內容產生器
+    依重要性排序商品欄位(名稱、價格、品牌、主要規格優先)，去除規格表與規格說明重複的內容，
+    並在預算內盡量保留每個商品的資訊
+    """
+
+    def __init__(self, max_tokens=6000, max_line_chars=150):
+        """
+        初始化檢索內容產生器
+
+        Args:
+            max_tokens: 所有商品資訊的token預算
+            max_line_chars: 規格說明每行保留的最大字元數
+        """
+        self.max_tokens = max_tokens
+        self.max_line_chars = max_line_chars
+
+    def _ranked_lines(self, product):
+        """
+        產生依重要性排序的商品資訊行
+
+        Returns:
+            tuple: (一定要保留的行, 依重要性排序可捨棄的(區段標題, 行)列表)
+        """
+        required = [
+            f"商品名稱: {product.name}",
+            f"品牌: {product.brand}",
+            f"售價: {product.price_text}",
+            f"購買連結: {product.url}",
+        ]
+        if product.original_price_text:
+            required.append(f"原價: {product.original_price_text}")
+
+        key_specs, other_specs = [], []
+        seen = set()
+        for key, value in product.spec_items():
+            line = f"{key}: {value}"
+            (key_specs if KEY_SPEC_PATTERN.search(key) else other_specs).append(("商品規格:", line))
+            seen.add(_normalize(value))
+            seen.add(_normalize(line))
+
+        features = [("商品特點:", f"- {feature}") for feature in product.features]
+
+        # 規格說明常與規格表重複，只保留規格表沒有的內容並截斷過長的行
+        spec_notes = []
+        for line in product.specs_text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            normalized = _normalize(line)
+            if normalized in seen or any(value and value in normalized for value in seen if len(value) >= 4):
+                continue
+            seen.add(normalized)
+            if len(line) > self.max_line_chars:
+                line = line[:self.max_line_chars] + "…"
+            spec_notes.append(("其它規格說明:", line))
+
+        return required, key_specs + features + other_specs + spec_notes
+
+    def _render(self, required, optional):
+        """把保留的行組合成與原本格式相同的商品資訊"""
+        sections = {}
+        for header, line in optional:
+            sections.setdefault(header, []).append(line)
+
+        parts = list(required)
+        for header in ("商品特點:", "商品規格:", "其它規格說明:"):
+            if header in sections:
+                parts.append(header)
+                parts.extend(sections[header])
+        return "\n".join(parts) + "\n"
+
+    def build(self, products):
+        """
+        在token預算內組合所有商品資訊，抓取失敗的商品不放入內容
+
+        Args:
+            products: 依搜尋排名排序的ProductRecord列表
+
+        Returns:
+            tuple: (檢索內容字串, 每個商品的token統計列表)
+        """
+        blocks = []
+        report = []
+        pending = sum(1 for product in products if product.ok)
+        remaining = self.max_tokens
+
+        for product in products:
+            if not product.ok:
+                # 錯誤訊息不放入提示詞，只記錄在統計中
+                report.append({"url": product.url, "error": product.error, "tokens": 0, "full_tokens": 0, "dropped_lines": 0})
+                continue
+
+            required, optional = self._ranked_lines(product)
+            full_tokens = estimate_tokens(self._render(required, optional))
+
+            # 剩餘預算平均分給還沒處理的商品，前面商品用不完的額度留給後面的商品
+            allowance = remaining // pending
+            pending -= 1
+            used = estimate_tokens("\n".join(required))
+            kept = []
+            for header, line in optional:
+                cost = estimate_tokens(line) + 1
+                if used + cost > allowance:
+                    # 標題不計，較短的行仍可能放得下
+                    continue
+                kept.append((header, line))
+                used += cost
+
+            block = self._render(required, kept)
+            tokens = estimate_tokens(block)
+            remaining -= tokens
+            blocks.append(block)
+            report.append({
+                "url": product.url,
+                "name": product.name,
+                "tokens": tokens,
+                "full_tokens": full_tokens,
+                "dropped_lines": len(optional) - len(kept),
+            })
+
+        total = sum(item["tokens"] for item in report)
+        full_total = sum(item["full_tokens"] for item in report)
+        logger.info(f"檢索內容token估計: {total}/{self.max_tokens} (未裁剪 {full_total})，"
+                    f"各商品: {[item['tokens'] for item in report if 'error' not in item]}，抓取失敗: {sum(1 for item in report if 'error' in item)}")
+        return "\n".join(blocks) + "\n", report
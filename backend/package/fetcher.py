@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+from collections import defaultdict, deque
+import threading
+import logging
+import time
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+class ConcurrentFetcher:
+    """
+    併發抓取器
+    用有上限的執行緒池同時處理多個網址，並限制每個主機的同時連線數。
+    主機已達上限的網址在佇列中等待，不佔用執行緒，因此實際併發數為
+    min(max_workers, 各主機min(per_host_limit, 該主機網址數)的總和)，
+    例如只抓PChome時為per_host_limit，其餘執行緒仍可處理其它主機
+    """
+
+    def __init__(self, max_workers=8, per_host_limit=4):
+        """
+        初始化併發抓取器
+
+        Args:
+            max_workers: 全域最多同時處理的網址數量
+            per_host_limit: 同一個主機最多同時處理的網址數量
+        """
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetcher")
+        self._active = defaultdict(int)     # 主機 -> 執行中的網址數量
+        self._pending = defaultdict(deque)  # 主機 -> 等待中的(future, fetch_func, url, on_error)
+        self._lock = threading.Lock()
+
+    def _submit(self, fetch_func, url, on_error):
+        """
+        排入單一網址，主機未達上限時立即交給執行緒池，否則在該主機的佇列中等待
+
+        Returns:
+            concurrent.futures.Future: 抓取結果
+        """
+        future = Future()
+        host = urlparse(url or "").netloc
+        item = (future, fetch_func, url, on_error)
+        with self._lock:
+            if self._active[host] >= self.per_host_limit:
+                self._pending[host].append(item)
+                return future
+            self._active[host] += 1
+        self._start(host, item)
+        return future
+
+    def _start(self, host, item):
+        """開始執行已取得主機名額的網址，已被取消時把名額讓給下一個網址"""
+        future = item[0]
+        if not future.set_running_or_notify_cancel():
+            self._release(host)
+            return
+        try:
+            self._executor.submit(self._run, host, *item)
+        except RuntimeError as e:
+            # 執行緒池已關閉
+            future.set_exception(e)
+            self._release(host)
+
+    def _release(self, host):
+        """釋放主機名額，有等待中的網址時直接交給它"""
+        with self._lock:
+            queue = self._pending.get(host)
+            if not queue:
+                self._active[host] -= 1
+                return
+            item = queue.popleft()
+        self._start(host, item)
+
+    def _run(self, host, future, fetch_func, url, on_error):
+        """在執行緒中執行單一抓取，錯誤以on_error的結果取代"""
+        try:
+            try:
+                result = fetch_func(url)
+            except Exception as e:
+                logger.error(f"抓取 {url} 時發生錯誤: {e}")
+                result = on_error(url, e)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._release(host)
+
+    def map(self, fetch_func, urls, on_error=None, timeout=None):
+        """
+        併發抓取所有網址，結果依照輸入順序回傳
+
+        Args:
+            fetch_func: 處理單一網址的函式
+            urls: 網址列表
+            on_error: 發生例外時產生替代結果的函式，參數為(url, exception)，預設回傳None
+            timeout: 整批抓取的最長等待秒數，超過時間的網址以on_error的結果取代；
+                還在佇列中的網址不會再執行，已開始的抓取無法中斷，會在背景完成
+
+        Returns:
+            與urls順序相同的結果列表
+        """
+        on_error = on_error or (lambda url, e: None)
+        futures = [self._submit(fetch_func, url, on_error) for url in urls]
+        deadline = time.monotonic() + timeout if timeout else None
+
+        results = []
+        for url, future in zip(urls, futures):
+            remaining = max(deadline - time.monotonic(), 0) if deadline else None
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError as e:
+                # 超時的網址不再等待，避免拖慢整批結果
+                future.cancel()
+                logger.warning(f"抓取 {url} 超過 {timeout} 秒，略過")
+                results.append(on_error(url, e))
+        return results
+
+    def iter_completed(self, fetch_func, urls, on_error=None, timeout=None):
+        """
+        併發抓取所有網址，依完成順序逐一產生結果
+
+        Args:
+            fetch_func: 處理單一網址的函式
+            urls: 網址列表
+            on_error: 發生例外時產生替代結果的函式，參數為(url, exception)，預設回傳None
+            timeout: 整批抓取的最長等待秒數，超過時間的網址以on_error的結果取代
+
+        Yields:
+            tuple: (網址在urls中的索引, 結果)
+        """
+        on_error = on_error or (lambda url, e: None)
+        futures = {self._submit(fetch_func, url, on_error): index for index, url in enumerate(urls)}
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                pending.discard(future)
+                yield futures[future], future.result()
+        except FutureTimeoutError as e:
+            # 超時的網址不再等待，避免拖慢整批結果
+            for future in pending:
+                future.cancel()
+                url = urls[futures[future]]
+                logger.warning(f"抓取 {url} 超過 {timeout} 秒，略過")
+                yield futures[future], on_error(url, e)
+
+    def shutdown(self):
+        """關閉執行緒池，取消還在佇列中的網址"""
+        with self._lock:
+            pending = [item for queue in self._pending.values() for item in queue]
+            self._pending.clear()
+        for future, *_ in pending:
+            future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
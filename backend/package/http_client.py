@@ -0,0 +1,190 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+from package.metrics import FETCH_SECONDS, FETCH_BYTES, FETCH_ERRORS
+import threading
+import logging
+import time
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# 模擬一般瀏覽器，避免被當成機器人阻擋
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
+}
+
+class ResponseTooLarge(Exception):
+    """回應內容超過大小上限"""
+    pass
+
+class HTTPResult:
+    """
+    HTTP回應結果
+    內容已完整讀入，連線可立即歸還連線池
+    """
+
+    def __init__(self, url, status_code, headers, content, encoding, elapsed):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.elapsed = elapsed
+
+    @property
+    def text(self):
+        """以回應的編碼解碼內容"""
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+class HTTPClient:
+    """
+    長期存活的HTTP客戶端
+    整合連線池(keep-alive)、連線/讀取超時、指數退避重試以及回應大小限制
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, connect_timeout=3.05, read_timeout=10,
+                 max_retries=3, backoff_factor=0.5, backoff_max=8, max_body_size=5 * 1024 * 1024):
+        """
+        初始化HTTP客戶端
+
+        Args:
+            pool_connections: 要快取的主機連線池數量
+            pool_maxsize: 每個主機連線池保留的最大連線數
+            connect_timeout: 建立連線的超時秒數
+            read_timeout: 讀取回應的超時秒數
+            max_retries: 5xx或連線錯誤時的最大重試次數
+            backoff_factor: 指數退避的基數秒數
+            backoff_max: 單次退避的最長秒數
+            max_body_size: 回應內容的最大位元組數
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_body_size = max_body_size
+
+        # backoff_max是urllib3 2.x的參數，requirements.txt要求urllib3>=2.0
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_max=backoff_max,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            raise_on_status=False  # 重試用完後回傳最後一次的回應
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+        # 統計資料
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "too_large": 0,
+            "bytes": 0,
+        }
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def get(self, url, headers=None):
+        """
+        發送GET請求並讀取完整內容
+
+        Args:
+            url: 請求網址
+            headers: 額外的請求標頭
+
+        Returns:
+            HTTPResult
+        """
+        self._count("requests")
+        # 以主機為標籤，避免每個商品URL都產生一組時間序列
+        host = urlsplit(url).hostname or "unknown"
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            self._count("errors")
+            FETCH_ERRORS.inc(host=host, reason=type(e).__name__)
+            FETCH_SECONDS.observe(time.perf_counter() - start, host=host, status="error")
+            raise
+
+        with response:
+            retries = response.raw.retries
+            if retries is not None and retries.history:
+                self._count("retries", len(retries.history))
+
+            # 先檢查Content-Length，再邊讀邊檢查大小
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+                self._count("too_large")
+                FETCH_ERRORS.inc(host=host, reason="too_large")
+                raise ResponseTooLarge(f"回應大小 {content_length} bytes 超過上限 {self.max_body_size} bytes")
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > self.max_body_size:
+                    self._count("too_large")
+                    FETCH_ERRORS.inc(host=host, reason="too_large")
+                    raise ResponseTooLarge(f"回應大小超過上限 {self.max_body_size} bytes")
+                chunks.append(chunk)
+
+        elapsed = time.perf_counter() - start
+        self._count("bytes", size)
+        FETCH_SECONDS.observe(elapsed, host=host, status=str(response.status_code))
+        FETCH_BYTES.observe(size, host=host)
+        return HTTPResult(
+            url=url,
+            status_code=response.status_code,
+            headers=response.headers,
+            content=b"".join(chunks),
+            encoding=response.encoding,
+            elapsed=elapsed
+        )
+
+    def pool_stats(self):
+        """
+        取得連線池統計資料
+
+        Returns:
+            dict: 請求統計以及各主機的連線數、請求數與連線重用率
+        """
+        with self._lock:
+            stats = dict(self._stats)
+
+        pools = {}
+        poolmanager = self._adapter.poolmanager
+        for key in poolmanager.pools.keys():
+            pool = poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            num_requests = pool.num_requests
+            num_connections = pool.num_connections
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections": num_connections,
+                "requests": num_requests,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "reuse_rate": round(1 - num_connections / num_requests, 4) if num_requests else 0.0,
+            }
+
+        total_requests = sum(p["requests"] for p in pools.values())
+        total_connections = sum(p["connections"] for p in pools.values())
+        stats["pools"] = pools
+        stats["reuse_rate"] = round(1 - total_connections / total_requests, 4) if total_requests else 0.0
+        return stats
+
+    def close(self):
+        """關閉所有連線"""
+        self.session.close()
@@ -0,0 +1,150 @@
+import json
+import ast
+import re
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"'})
+
+def build_response_schema(example):
+    """
+    由範例結構產生Gemini的response_schema
+
+    Args:
+        example: 範例dict，值的型別決定欄位型別，list以第一個元素為項目型別
+
+    Returns:
+        dict: OpenAPI格式的schema
+    """
+    if isinstance(example, dict):
+        return {
+            "type": "object",
+            "properties": {key: build_response_schema(value) for key, value in example.items()},
+            "required": list(example),
+        }
+    if isinstance(example, list):
+        return {"type": "array", "items": build_response_schema(example[0] if example else "")}
+    if isinstance(example, bool):
+        return {"type": "boolean"}
+    if isinstance(example, (int, float)):
+        return {"type": "number"}
+    return {"type": "string"}
+
+def extract_json_text(text):
+    """
+    從回應中取出JSON部分，支援```json區塊、沒有結尾的區塊與沒有包起來的JSON
+
+    Args:
+        text: LLM回應文字
+
+    Returns:
+        JSON字串，找不到{或[時回傳None
+    """
+    if not text:
+        return None
+    match = _FENCE.search(text)
+    if match:
+        text = match.group(1)
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+    # 沒有結尾括號(輸出被截斷)時保留到最後，交給complete_partial_json補齊
+    return text[start:end + 1] if end > start else text[start:]
+
+def complete_partial_json(text):
+    """
+    補齊被截斷的JSON，關閉未結束的字串、陣列與物件
+
+    Args:
+        text: 可能不完整的JSON字串
+
+    Returns:
+        補齊後的JSON字串
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    # 截在key或逗號後面時去掉不完整的部分
+    text = re.sub(r',\s*"[^"]*"\s*:?\s*$', "", text) if stack and stack[-1] == "}" else text
+    text = re.sub(r"[,:]\s*$", "", text)
+    return text + "".join(reversed(stack))
+
+def loads_tolerant(text):
+    """
+    寬鬆的JSON解析，依序嘗試標準解析、修正常見錯誤、補齊截斷的內容與Python字面值
+
+    Args:
+        text: LLM回應文字
+
+    Returns:
+        解析後的物件，無法解析時回傳None
+    """
+    candidate = extract_json_text(text)
+    if candidate is None:
+        return None
+    cleaned = _TRAILING_COMMA.sub(r"\1", candidate.translate(_SMART_QUOTES))
+    for attempt in (candidate, cleaned, _TRAILING_COMMA.sub(r"\1", complete_partial_json(cleaned))):
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+    # 提示詞中的範例是Python dict，模型有時照著用單引號
+    try:
+        value = ast.literal_eval(cleaned)
+        return value if isinstance(value, (dict, list)) else None
+    except (ValueError, SyntaxError):
+        return None
+
+def schema_problems(data, schema, path="$"):
+    """
+    檢查資料是否符合schema，只檢查型別與必要欄位
+
+    Args:
+        data: 解析後的資料
+        schema: build_response_schema產生的schema
+        path: 目前檢查的位置，用於錯誤訊息
+
+    Returns:
+        list: 不符合的地方，符合時為空列表
+    """
+    expected = schema.get("type")
+    if expected == "object":
+        if not isinstance(data, dict):
+            return [f"{path} 應為物件"]
+        problems = [f"{path}.{key} 缺少" for key in schema.get("required", []) if key not in data]
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in data:
+                problems.extend(schema_problems(data[key], sub_schema, f"{path}.{key}"))
+        return problems
+    if expected == "array":
+        if not isinstance(data, list):
+            return [f"{path} 應為陣列"]
+        problems = []
+        for index, item in enumerate(data):
+            problems.extend(schema_problems(item, schema.get("items", {}), f"{path}[{index}]"))
+        return problems
+    if expected == "number" and not (isinstance(data, (int, float)) and not isinstance(data, bool)):
+        return [f"{path} 應為數字"]
+    if expected == "string" and not isinstance(data, str):
+        return [f"{path} 應為字串"]
+    return []
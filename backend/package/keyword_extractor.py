@@ -0,0 +1,332 @@
+from package.product_filter import budget_spans
+import unicodedata
+import re
+
+# 品牌字典: 輸出用的品牌名稱 -> 用戶可能的寫法(小寫)
+BRANDS = {
+    "ASUS": ["asus", "華碩", "rog"],
+    "ACER": ["acer", "宏碁", "宏基"],
+    "MSI": ["msi", "微星"],
+    "HP": ["hp", "惠普"],
+    "DELL": ["dell", "戴爾"],
+    "Lenovo": ["lenovo", "聯想"],
+    "GIGABYTE": ["gigabyte", "技嘉"],
+    "Razer": ["razer", "雷蛇"],
+    "Apple": ["apple", "蘋果"],
+    "Microsoft": ["microsoft", "微軟"],
+    "三星": ["samsung", "三星"],
+    "Sony": ["sony", "索尼"],
+    "LG": ["lg", "樂金"],
+    "Panasonic": ["panasonic", "國際牌"],
+    "Philips": ["philips", "飛利浦"],
+    "Sharp": ["sharp", "夏普"],
+    "Hitachi": ["hitachi", "日立"],
+    "小米": ["xiaomi", "小米"],
+    "OPPO": ["oppo"],
+    "vivo": ["vivo"],
+    "Google": ["google"],
+    "Canon": ["canon", "佳能"],
+    "Nikon": ["nikon", "尼康"],
+    "Fujifilm": ["fujifilm", "富士"],
+    "Dyson": ["dyson", "戴森"],
+    "iRobot": ["irobot"],
+    "Roborock": ["roborock", "石頭"],
+    "Ecovacs": ["ecovacs", "科沃斯"],
+    "Logitech": ["logitech", "羅技"],
+    "Bose": ["bose"],
+    "JBL": ["jbl"],
+    "Sennheiser": ["sennheiser", "森海塞爾"],
+    "Garmin": ["garmin"],
+}
+
+# 商品類別詞庫: 輸出用的類別 -> 用戶可能的寫法，比對時長詞優先
+CATEGORIES = {
+    "筆電": ["筆電", "筆記型電腦", "筆記本電腦", "筆記本", "laptop", "notebook"],
+    "桌機": ["桌機", "桌上型電腦", "電腦主機", "桌電"],
+    "平板": ["平板", "平板電腦", "ipad"],
+    "折疊手機": ["折疊手機", "摺疊手機", "折疊機"],
+    "手機": ["手機", "智慧型手機", "智慧手機", "iphone"],
+    "藍牙耳機": ["藍牙耳機", "無線耳機", "真無線耳機"],
+    "耳機": ["耳機", "耳罩式耳機", "頭戴式耳機"],
+    "掃地機器人": ["掃地機器人", "掃地機", "掃拖機器人"],
+    "吸塵器": ["吸塵器"],
+    "單眼相機": ["單眼相機", "單眼", "微單", "無反相機"],
+    "相機": ["相機", "數位相機"],
+    "螢幕": ["螢幕", "顯示器", "電腦螢幕"],
+    "電視": ["電視", "液晶電視"],
+    "冷氣": ["冷氣", "空調"],
+    "洗衣機": ["洗衣機"],
+    "冰箱": ["冰箱"],
+    "除濕機": ["除濕機"],
+    "空氣清淨機": ["空氣清淨機", "清淨機"],
+    "智慧手錶": ["智慧手錶", "智能手錶", "手錶"],
+    "鍵盤": ["鍵盤"],
+    "滑鼠": ["滑鼠"],
+    "喇叭": ["喇叭", "音響", "藍牙喇叭"],
+    "行動電源": ["行動電源"],
+    "印表機": ["印表機"],
+    "顯示卡": ["顯示卡"],
+    "吹風機": ["吹風機"],
+    "電鍋": ["電鍋"],
+}
+
+# 描述主要商品規格時常提到的零組件類別，有其它主要類別時不視為另一個商品
+COMPONENT_CATEGORIES = {"螢幕", "顯示卡", "鍵盤"}
+
+# 需求特徵改寫: PChome常用的描述詞 -> 用戶可能的說法
+FEATURES = {
+    "電競": ["電競", "打電動", "玩遊戲", "遊戲", "3a大作", "3a"],
+    "輕薄": ["輕薄", "方便攜帶", "好攜帶", "攜帶方便", "輕便", "輕巧"],
+    "文書": ["文書", "辦公", "上網", "瀏覽網頁"],
+    "商用": ["商用", "辦公室"],
+    "散熱": ["散熱"],
+    "獨顯": ["獨立顯卡", "獨顯"],
+    "降噪": ["降噪", "抗噪"],
+    "運動": ["運動"],
+    "防水": ["防水"],
+    "APP控制": ["遠端控制", "app控制", "app", "手機控制"],
+    "自動": ["自動倒垃圾", "自動集塵"],
+    "大螢幕": ["大螢幕", "較大的螢幕"],
+    "大電量": ["長效電池", "電池續航", "續航力", "續航", "大電量", "電池大"],
+    "快充": ["快速充電", "快充"],
+    "入門": ["初學者", "新手", "入門"],
+    "低光": ["低光源", "低光", "夜拍"],
+    "觸控": ["觸控"],
+    "變頻": ["變頻"],
+}
+
+# 規格參數: 正規表示式 -> 產生搜尋用格式的函式
+SPEC_PATTERNS = [
+    (re.compile(r"(\d{1,3})\s*g(?:b)?\s*(?:的)?\s*(?:記憶體|ram)"), lambda m: f"{m.group(1)}GB"),
+    (re.compile(r"(\d{1,2})\s*tb"), lambda m: f"{m.group(1)}TB"),
+    (re.compile(r"(?<![a-z0-9])(i[3579])(?:[-\s]?\d{4,5}[a-z]{0,2})?"), lambda m: m.group(1)),
+    (re.compile(r"(?<![a-z])ultra\s*([579])"), lambda m: f"Ultra{m.group(1)}"),
+    (re.compile(r"(?<![a-z0-9])(?:ryzen\s*|r)([579])(?![0-9])"), lambda m: f"R{m.group(1)}"),
+    (re.compile(r"(?<![a-z0-9])(?:rtx|geforce\s*rtx)\s*(\d{4})(?:\s*ti)?"), lambda m: f"RTX{m.group(1)}"),
+    (re.compile(r"(?<![a-z0-9])gtx\s*(\d{4})"), lambda m: f"GTX{m.group(1)}"),
+    (re.compile(r"(\d{2,3})\s*hz"), lambda m: f"{m.group(1)}Hz"),
+    (re.compile(r"(\d{2}(?:\.\d)?)\s*(?:吋|寸|inch|\")"), lambda m: f"{m.group(1)}吋"),
+    (re.compile(r"(ipx\d|ip6\d)"), lambda m: m.group(1).upper()),
+    (re.compile(r"(?<![a-z0-9])(oled|mini\s*led)(?![a-z])"), lambda m: m.group(1).replace(" ", "").upper()),
+    (re.compile(r"(?<![a-z0-9])(wifi\s*[67]e?)(?![a-z0-9])"), lambda m: m.group(1).replace(" ", "").upper().replace("WIFI", "WiFi")),
+]
+
+# 沒有資訊量的贅詞
+FILLER_WORDS = [
+    "我想要", "我想找", "我想買", "我需要", "我要", "想要", "想找", "想買", "需要", "請問", "請幫我", "幫我",
+    "推薦", "比較", "有沒有", "有哪些", "哪一款", "哪款", "一款", "一台", "一支", "一個", "一副", "找", "買",
+    "適合", "使用", "用的", "可以", "能夠", "希望", "最好", "主要是", "主要", "處理", "工作", "並且", "而且",
+    "還要", "要有", "要能", "的", "和", "跟", "與", "及", "或", "要", "能", "有", "是", "在", "我", "想",
+    "好的", "好", "比較好", "最新", "款式", "預算", "元", "以內", "左右", "時", "連接", "支援",
+    "處理器", "顯卡", "更新率", "刷新率", "記憶體", "硬碟", "容量", "表現", "功能",
+]
+
+# 否定用語，後面第一個品牌、類別或特徵是用戶要排除的
+NEGATION_PATTERN = re.compile(r"不想要|不要|不需要|不用|不是|不含|不考慮|除了|排除|避開")
+
+# 有否定用語時的信心倍率，排除條件無法放進搜尋關鍵字，交給Gemini判斷
+NEGATION_PENALTY = 0.5
+
+_PUNCTUATION = re.compile(r"[\s\W_]", re.UNICODE)
+
+# 沒有被詞庫、規格或預算比對到的英數詞，通常是型號、世代或容量，例如iphone 15的15、samsung s24的s24
+_MODEL_TOKEN = re.compile(r"(?<![a-z0-9])[a-z0-9]+(?:[.-][a-z0-9]+)*(?![a-z0-9])")
+# 沒有被任何規則比對到的連續非英數文字
+_UNKNOWN_TERM = re.compile(r"[^\W\da-z_]+")
+
+def _term_pattern(term):
+    """英數詞需要邊界，避免hp比對到php之類的字"""
+    escaped = re.escape(term)
+    if term.isascii():
+        return re.compile(rf"(?<![a-z0-9]){escaped}(?![a-z0-9])")
+    return re.compile(escaped)
+
+def _compile_lexicon(lexicon):
+    """把詞庫轉成(pattern, 輸出詞)列表，長詞優先"""
+    compiled = []
+    for output, aliases in lexicon.items():
+        for alias in aliases:
+            compiled.append((len(alias), _term_pattern(alias), output))
+    compiled.sort(key=lambda item: -item[0])
+    return [(pattern, output) for _, pattern, output in compiled]
+
+class KeywordExtractor:
+    """
+    規則式搜尋關鍵字產生器
+    用品牌字典、類別詞庫、需求改寫與規格正規表示式產生關鍵字，並估計信心分數。
+    信心足夠時可以省下一次Gemini呼叫
+    """
+
+    def __init__(self, max_keywords=5):
+        """
+        初始化關鍵字產生器
+
+        Args:
+            max_keywords: 最多產生的關鍵字數量
+        """
+        self.max_keywords = max_keywords
+        self._brands = _compile_lexicon(BRANDS)
+        self._categories = _compile_lexicon(CATEGORIES)
+        self._features = _compile_lexicon(FEATURES)
+        self._fillers = [_term_pattern(word) for word in sorted(FILLER_WORDS, key=len, reverse=True)]
+
+    @staticmethod
+    def _claim(text, covered, pattern):
+        """
+        找出尚未被其它詞佔用的第一個比對結果並標記為已佔用
+
+        Returns:
+            re.Match，沒有則回傳None
+        """
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if end > start and not any(covered[start:end]):
+                covered[start:end] = [True] * (end - start)
+                return match
+        return None
+
+    def _claim_negated(self, text, covered):
+        """
+        標記否定用語與其後第一個品牌、類別或特徵，被否定的詞不放入關鍵字
+
+        Returns:
+            list: 每個否定用語排除的輸出詞，找不到被否定的詞時為None
+        """
+        negated_terms = []
+        lexicons = self._brands + self._categories + self._features
+        while True:
+            match = self._claim(text, covered, NEGATION_PATTERN)
+            if match is None:
+                return negated_terms
+            # 否定的範圍到下一個標點或空白為止
+            end = match.end()
+            while end < len(text) and not _PUNCTUATION.match(text[end]):
+                end += 1
+            negated, negated_output = None, None
+            for pattern, output in lexicons:
+                found = pattern.search(text, match.end(), end)
+                if found is None or any(covered[found.start():found.end()]):
+                    continue
+                if negated is None or found.start() < negated.start():
+                    negated, negated_output = found, output
+            if negated is not None:
+                covered[negated.start():negated.end()] = [True] * (negated.end() - negated.start())
+            negated_terms.append(negated_output)
+
+    def _match_lexicon(self, text, covered, lexicon, limit=None):
+        """依序比對詞庫，回傳不重複的輸出詞，順序依照在查詢中出現的位置"""
+        positions = {}
+        for pattern, output in lexicon:
+            if limit is not None and len(positions) >= limit:
+                break
+            while True:
+                match = self._claim(text, covered, pattern)
+                if match is None:
+                    break
+                positions[output] = min(positions.get(output, match.start()), match.start())
+        return sorted(positions, key=positions.get)
+
+    def _analyze(self, user_query, brand_limit=1):
+        """
+        依序標記否定用語、品牌、規格、特徵、類別與預算，剩下的英數詞視為型號
+
+        Args:
+            user_query: 用戶的原始查詢
+            brand_limit: 最多比對的品牌數量，None則不限制
+
+        Returns:
+            tuple: (正規化後的查詢, 已佔用的字元標記, 被否定的詞, 品牌, 規格, 特徵, 類別, 型號)
+        """
+        # 全形轉半形並統一小寫，方便比對，千分位逗號與價格篩選相同先去掉
+        text = unicodedata.normalize("NFKC", user_query or "").lower()
+        text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+        covered = [False] * len(text)
+
+        # 例如「不要華碩」，華碩不能當成搜尋的品牌
+        negated = self._claim_negated(text, covered)
+
+        brands = self._match_lexicon(text, covered, self._brands, limit=brand_limit)
+
+        spec_positions = {}
+        for pattern, formatter in SPEC_PATTERNS:
+            while True:
+                match = self._claim(text, covered, pattern)
+                if match is None:
+                    break
+                spec_positions.setdefault(formatter(match), match.start())
+        specs = sorted(spec_positions, key=spec_positions.get)
+
+        features = self._match_lexicon(text, covered, self._features)
+        categories = self._match_lexicon(text, covered, self._categories)
+
+        # 預算只標記為已理解，不放入關鍵字(價格在後續篩選)，沒有預算用語或金額單位的數字不算預算
+        for start, end in budget_spans(text):
+            covered[start:end] = [True] * (end - start)
+
+        models = []
+        for match in _MODEL_TOKEN.finditer(text):
+            if not any(covered[match.start():match.end()]) and match.group() not in models:
+                models.append(match.group())
+        return text, covered, negated, brands, specs, features, categories, models
+
+    def _claim_fillers(self, text, covered):
+        """標記沒有資訊量的贅詞"""
+        for pattern in self._fillers:
+            while self._claim(text, covered, pattern):
+                pass
+
+    def extract(self, user_query):
+        """
+        從用戶查詢產生搜尋關鍵字
+
+        Args:
+            user_query: 用戶的原始查詢
+
+        Returns:
+            tuple: (以空格分隔的關鍵字, 0到1的信心分數)
+                - 找不到商品類別時關鍵字為空字串、信心為0
+                - 有「不要」「除了」等否定用語時不包含被排除的詞，信心減半
+                - 型號之類無法辨識的英數詞保留在關鍵字中，但不計入已理解的內容
+        """
+        text, covered, negated, brands, specs, features, categories, models = self._analyze(user_query)
+        if len(categories) > 1:
+            categories = [c for c in categories if c not in COMPONENT_CATEGORIES] or categories
+
+        if not categories:
+            return "", 0.0
+
+        # 贅詞只標記為已理解，不放入關鍵字
+        self._claim_fillers(text, covered)
+
+        # 信心分數: 查詢中有意義的字元被理解的比例
+        content = [i for i, char in enumerate(text) if not _PUNCTUATION.match(char)]
+        understood = sum(1 for i in content if covered[i])
+        coverage = understood / len(content) if content else 0.0
+        # 多個類別代表需求不明確
+        confidence = coverage if len(categories) == 1 else coverage * 0.5
+        if negated:
+            confidence *= NEGATION_PENALTY
+
+        # 依照[品牌] [商品種類] [型號] [需求特徵] [規格參數]的順序組合
+        keywords = (brands + categories[:1] + models + features + specs)[:self.max_keywords]
+        return " ".join(keywords), round(confidence, 4)
+
+    def signature(self, user_query):
+        """
+        取得查詢中決定是哪一種商品的詞，用來判斷兩個查詢是否可以共用搜尋結果
+
+        Args:
+            user_query: 用戶的原始查詢
+
+        Returns:
+            frozenset: 品牌、類別、特徵、規格、被否定的詞(前面加上"-")、其它英數型號詞(例如iphone 15的"15")，
+                以及詞庫外的中文詞(例如顏色、用途)，品牌與類別的不同寫法會對應到相同的詞
+        """
+        text, covered, negated, brands, specs, features, categories, models = self._analyze(user_query, brand_limit=None)
+        terms = set(brands + specs + features + categories + models)
+        terms.update(f"-{term or ''}" for term in negated)
+        # 詞庫外的內容例如「白色」「黑色」也會決定商品，去掉贅詞後剩下的連續中文字各算一個詞
+        self._claim_fillers(text, covered)
+        terms.update(match.group() for match in _UNKNOWN_TERM.finditer(
+            "".join(char if not covered[i] else " " for i, char in enumerate(text))))
+        return frozenset(terms)
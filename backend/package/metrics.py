@@ -0,0 +1,257 @@
+from contextlib import contextmanager
+import threading
+import math
+import time
+
+# 預設的延遲分組(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 回應大小分組(bytes)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """所有指標共用的標籤處理"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """回傳(名稱後綴, 標籤, 值)列表"""
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """只會增加的計數器"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """可增可減的量測值"""
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """進入時加一、離開時減一"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    """累積分組的分布統計"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """記錄with區塊的執行秒數"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self):
+        """
+        取得各標籤組合目前的觀測次數與總和
+
+        Returns:
+            dict: {標籤dict的tuple: (次數, 總和)}
+        """
+        with self._lock:
+            return {key: (state["count"], state["sum"]) for key, state in self._values.items()}
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(state["counts"]), state["sum"], state["count"]) for key, state in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", key + (("le", _format_value(bound)),), cumulative))
+            samples.append(("_sum", key, total))
+            samples.append(("_count", key, count))
+        return samples
+
+class MetricsRegistry:
+    """
+    Prometheus文字格式的指標註冊表
+    除了直接更新的指標，也可以註冊在輸出時才讀取現有統計資料的collector
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # 重複載入模組時沿用同一個指標
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """
+        註冊collector
+
+        Args:
+            collector: 無參數的函式，回傳[(指標名稱, 說明, 類型, [(標籤dict, 值)])]
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """
+        輸出所有指標
+
+        Returns:
+            Prometheus text exposition format字串
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, documentation, type_name, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# 全域的指標註冊表
+REGISTRY = MetricsRegistry()
+
+# RAG流程各階段
+RAG_STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "RAG流程各階段耗時(秒)", ["stage"])
+RAG_STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "RAG流程各階段發生的錯誤數", ["stage"])
+RAG_IN_FLIGHT = REGISTRY.gauge("rag_comparisons_in_flight", "執行中的產品比較流程數")
+
+# 商品頁面抓取
+FETCH_SECONDS = REGISTRY.histogram("pchome_fetch_seconds", "商品頁面請求耗時(秒)", ["host", "status"])
+FETCH_BYTES = REGISTRY.histogram("pchome_fetch_bytes", "商品頁面回應大小(bytes)", ["host"], buckets=SIZE_BUCKETS)
+FETCH_ERRORS = REGISTRY.counter("pchome_fetch_errors_total", "商品頁面請求失敗數", ["host", "reason"])
+
+# Gemini
+GEMINI_SECONDS = REGISTRY.histogram("gemini_request_seconds", "Gemini請求耗時(秒)", ["stage", "model"])
+GEMINI_TOKENS = REGISTRY.counter("gemini_tokens_total", "Gemini使用的token數", ["stage", "kind"])
+GEMINI_ERRORS = REGISTRY.counter("gemini_errors_total", "Gemini請求失敗數", ["stage"])
+
+class StageTracker:
+    """track_stage產生的階段，出錯時回傳None或空列表而不拋出例外的步驟用fail()計入錯誤數"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.failed = False
+
+    def fail(self):
+        """把這個階段計為失敗，重複呼叫只計一次"""
+        if not self.failed:
+            self.failed = True
+            RAG_STAGE_ERRORS.inc(stage=self.stage)
+
+@contextmanager
+def track_stage(stage):
+    """
+    記錄RAG流程一個階段的耗時，發生例外或呼叫fail()時計入錯誤數
+
+    Args:
+        stage: 階段名稱
+
+    Yields:
+        StageTracker: 可以用fail()標記階段失敗
+    """
+    tracker = StageTracker(stage)
+    start = time.perf_counter()
+    try:
+        yield tracker
+    except Exception:
+        tracker.fail()
+        raise
+    finally:
+        RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
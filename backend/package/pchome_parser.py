@@ -0,0 +1,164 @@
+from bs4 import BeautifulSoup, SoupStrainer
+import logging
+import re
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# 有安裝lxml時使用C實作的解析器，否則退回內建的html.parser
+try:
+    import lxml  # noqa: F401
+    FAST_PARSER = "lxml"
+except ImportError:
+    FAST_PARSER = "html.parser"
+
+# PChome商品網址中的商品ID，例如 https://24h.pchome.com.tw/prod/DHAF1Y-A900GXQJ2
+PRODUCT_ID_PATTERN = re.compile(r"24h\.pchome\.com\.tw/prod/([A-Za-z0-9]+-[A-Za-z0-9]+)")
+
+# 價格相關欄位，變動頻繁，其餘欄位視為規格
+PRICE_FIELDS = ("price", "original_price")
+
+# 找不到商品名稱與價格時的預設值
+MISSING_NAME = "無商品名稱"
+MISSING_PRICE = "無價格資訊"
+
+# 需要擷取的節點class，快速路徑只建立這些節點(與其子節點)的樹
+PRICE_CLASSES = ["o-prodPrice__price", "o-prodPrice__originalPrice"]
+PRODUCT_CLASSES = PRICE_CLASSES + [
+    "o-prodMainName__grayDarkest--l700",
+    "o-prodMainName__colorSecondary",
+    "c-blockCombine__list--prodSlogan",
+    "c-blockCombine__item--prodSpecification",
+    "c-tableGrid--prodSpec",
+]
+
+def _class_matcher(classes):
+    """產生class比對函式，解析階段的class可能是整串字串或已拆開的list"""
+    targets = frozenset(classes)
+
+    def match(value):
+        if not value:
+            return False
+        values = value.split() if isinstance(value, str) else value
+        return not targets.isdisjoint(values)
+
+    return match
+
+# 模組載入時建立一次，之後重複使用
+PRICE_STRAINER = SoupStrainer(["div"], class_=_class_matcher(PRICE_CLASSES))
+PRODUCT_STRAINER = SoupStrainer(["h1", "div", "span", "ul", "table"], class_=_class_matcher(PRODUCT_CLASSES))
+
+def extract_product_id(url):
+    """
+    從PChome商品網址取出商品ID
+
+    Args:
+        url: PChome商品頁面的URL
+
+    Returns:
+        商品ID，不是商品頁面則回傳None
+    """
+    match = PRODUCT_ID_PATTERN.search(url or "")
+    return match.group(1).upper() if match else None
+
+def _parse_price(soup):
+    """擷取售價與原價"""
+    price_element = soup.find('div', {'class': 'o-prodPrice__price'})
+    price = price_element.text.strip() if price_element else MISSING_PRICE
+
+    original_price_element = soup.find('div', {'class': 'o-prodPrice__originalPrice'})
+    original_price = original_price_element.text.strip() if original_price_element else "無原始價格資訊"
+
+    return {"price": price, "original_price": original_price}
+
+def parse_product_page(html, price_only=False, fast=True):
+    """
+    解析PChome商品頁面
+
+    Args:
+        html: 商品頁面的HTML
+        price_only: 只擷取價格欄位
+        fast: 使用快速路徑，只建立需要的節點；失敗時自動退回完整解析
+
+    Returns:
+        dict: 商品欄位(name、brand、price、original_price、features、specs、specs_text)
+    """
+    if fast:
+        try:
+            strainer = PRICE_STRAINER if price_only else PRODUCT_STRAINER
+            soup = BeautifulSoup(html, FAST_PARSER, parse_only=strainer)
+            return _extract_fields(soup, price_only)
+        except Exception as e:
+            logger.warning(f"快速解析失敗，改用完整解析: {e}")
+
+    soup = BeautifulSoup(html, 'html.parser')
+    return _extract_fields(soup, price_only)
+
+def is_parsed_product(fields, price_only=False):
+    """
+    判斷是否解析到商品，被擋、驗證碼或版型改變的頁面也會回應200，但只解析出預設值
+
+    Args:
+        fields: parse_product_page產生的商品欄位
+        price_only: fields是否只有價格欄位
+
+    Returns:
+        bool: 解析到商品名稱(price_only時為價格)
+    """
+    if price_only:
+        return fields.get("price", MISSING_PRICE) != MISSING_PRICE
+    return fields.get("name", MISSING_NAME) != MISSING_NAME
+
+def _extract_fields(soup, price_only):
+    """從解析後的樹擷取商品欄位"""
+    # 價格
+    fields = _parse_price(soup)
+    if price_only:
+        return fields
+
+    # 商品名稱
+    product_name_elem = soup.find('h1', {'class': 'o-prodMainName__grayDarkest--l700'})
+    fields["name"] = product_name_elem.text.strip() if product_name_elem else MISSING_NAME
+
+    # 品牌
+    brand_element = soup.find('span', {'class': 'o-prodMainName__colorSecondary'})
+    fields["brand"] = brand_element.text.strip() if brand_element else "查無品牌"
+
+    # 特色
+    features_list = soup.find('ul', {'class': 'c-blockCombine__list--prodSlogan'})
+    fields["features"] = [li.text.strip() for li in features_list.find_all('li')] if features_list else []
+
+    # 規格
+    specs_text = ""
+    spec_divs = soup.find_all('div', {'class': 'c-blockCombine__item--prodSpecification'})
+    for spec in spec_divs:
+        specs_text += spec.get_text(strip=True, separator='\n') + "\n"
+    fields["specs_text"] = specs_text
+
+    # 規格表格
+    spec_tables = soup.find_all('table', {'class': 'c-tableGrid--prodSpec'})
+    specs = {}
+
+    for table in spec_tables:
+        rows = table.find_all('tr')
+
+        for row in rows:
+            header = row.find('th')
+            data = row.find('div', {'class': 'c-tableGrid__htmlText'})
+
+            if header and data:
+                key = header.get_text(strip=True)
+                value = data.get_text(strip=True)
+
+                # 處理重複的key
+                if key in specs:
+                    # 如果key已存在，轉換為list或加到list
+                    if isinstance(specs[key], list):
+                        specs[key].append(value)
+                    else:
+                        specs[key] = [specs[key], value]
+                else:
+                    specs[key] = value
+    fields["specs"] = specs
+
+    return fields
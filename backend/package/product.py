@@ -0,0 +1,132 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+import re
+
+_PRICE_NUMBER = re.compile(r"\d[\d,]*")
+
+def parse_price(price_text):
+    """
+    把價格文字轉成整數
+
+    Args:
+        price_text: 價格文字，例如"$25,900"或"NT$1,299起"
+
+    Returns:
+        價格整數，沒有數字時回傳None
+    """
+    match = _PRICE_NUMBER.search(price_text or "")
+    return int(match.group().replace(",", "")) if match else None
+
+@dataclass(slots=True)
+class ProductRecord:
+    """
+    爬取到的PChome商品資料
+    保留頁面上的原始價格文字供顯示，另外解析出數值價格供篩選與排序
+    """
+    url: str
+    product_id: Optional[str] = None
+    name: str = "無商品名稱"
+    brand: str = "查無品牌"
+    price_text: str = "無價格資訊"
+    original_price_text: str = "無原始價格資訊"
+    price: Optional[int] = None
+    original_price: Optional[int] = None
+    features: List[str] = field(default_factory=list)
+    specs: Dict[str, Union[str, List[str]]] = field(default_factory=dict)
+    specs_text: str = ""
+    error: Optional[str] = None
+
+    @classmethod
+    def from_fields(cls, url, fields, product_id=None):
+        """
+        由parse_product_page的欄位建立商品資料
+
+        Args:
+            url: 商品頁面URL
+            fields: 商品欄位dict
+            product_id: 商品ID
+
+        Returns:
+            ProductRecord
+        """
+        return cls(
+            url=url,
+            product_id=product_id,
+            name=fields["name"],
+            brand=fields["brand"],
+            price_text=fields["price"],
+            original_price_text=fields["original_price"],
+            price=parse_price(fields["price"]),
+            original_price=parse_price(fields["original_price"]),
+            features=list(fields["features"]),
+            specs=dict(fields["specs"]),
+            specs_text=fields["specs_text"],
+        )
+
+    @classmethod
+    def from_error(cls, url, error, product_id=None):
+        """
+        建立抓取失敗的商品資料
+
+        Args:
+            url: 商品頁面URL
+            error: 錯誤訊息
+            product_id: 商品ID
+
+        Returns:
+            ProductRecord
+        """
+        return cls(url=url, product_id=product_id, error=error)
+
+    @property
+    def ok(self):
+        """是否成功取得商品資料"""
+        return self.error is None
+
+    def spec_items(self):
+        """
+        取得規格表的(名稱, 值)列表，重複的規格值以逗號合併
+
+        Returns:
+            list: (規格名稱, 規格值字串)
+        """
+        return [(key, ", ".join(value) if isinstance(value, list) else value) for key, value in self.specs.items()]
+
+    def render(self):
+        """
+        把商品資料組合成提示詞用的文字
+
+        Returns:
+            格式化的產品資訊字串，抓取失敗時回傳錯誤訊息
+        """
+        if not self.ok:
+            return self.error
+
+        # 組合所有資訊
+        info_parts = [
+            f"商品名稱: {self.name}",
+            f"品牌: {self.brand}",
+            f"售價: {self.price_text}",
+            f"購買連結: {self.url}"
+        ]
+
+        if self.original_price_text:
+            info_parts.append(f"原價: {self.original_price_text}")
+
+        if self.features:
+            info_parts.append("商品特點:")
+            for feature in self.features:
+                info_parts.append(f"- {feature}")
+
+        if self.specs:
+            info_parts.append("商品規格:")
+            for key, value in self.spec_items():
+                info_parts.append(f"{key}: {value}")
+
+        if self.specs_text:
+            info_parts.append("其它規格說明:")
+            info_parts.append(self.specs_text)
+
+        # 合併所有部分為一個字串
+        result = "\n".join(info_parts)
+        return result + "\n"
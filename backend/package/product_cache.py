@@ -0,0 +1,207 @@
+from package.cache import LRUCache, SQLiteStore
+from package.pchome_parser import PRICE_FIELDS
+import threading
+import time
+
+# 快取項目的新鮮度
+FRESH = "fresh"              # 價格與規格都在TTL內
+PRICE_STALE = "price_stale"  # 規格仍在TTL內，只需更新價格
+STALE = "stale"              # 規格也過期，需重新驗證或重新解析整頁
+
+class ProductCache:
+    """
+    PChome商品資料快取
+    以商品ID為key，分為記憶體LRU層與SQLite持久層。
+    價格與規格各有不同的TTL，過期的項目保留ETag/Last-Modified供條件式請求重新驗證
+    """
+
+    def __init__(self, db_path=None, max_entries=1000, price_ttl=600, specs_ttl=86400, stale_ttl=7 * 86400):
+        """
+        初始化商品快取
+
+        Args:
+            db_path: 持久層SQLite檔案路徑，None則只使用記憶體
+            max_entries: 記憶體層最大商品數量
+            price_ttl: 價格的存活秒數
+            specs_ttl: 規格的存活秒數
+            stale_ttl: 過期項目保留供重新驗證的秒數
+        """
+        self.price_ttl = price_ttl
+        self.specs_ttl = specs_ttl
+        self.stale_ttl = stale_ttl
+        self.memory = LRUCache(max_entries=max_entries, ttl=stale_ttl)
+        self.store = SQLiteStore(db_path, "product_cache") if db_path else None
+
+        self._lock = threading.Lock()
+        self._stats = {"disk_hits": 0, "revalidations": 0, "price_refreshes": 0, "stores": 0, "merges": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get(self, product_id):
+        """
+        取得商品快取項目，記憶體層未命中時查詢持久層
+
+        Args:
+            product_id: 商品ID
+
+        Returns:
+            dict: 快取項目(url、fields、etag、last_modified、price_fetched_at、specs_fetched_at)，沒有則回傳None
+        """
+        entry = self.memory.get(product_id)
+        if entry is None and self.store is not None:
+            entry = self.store.get(product_id)
+            if entry is not None:
+                self._count("disk_hits")
+                self.memory.set(product_id, entry)
+        return entry
+
+    def freshness(self, entry):
+        """
+        判斷快取項目的新鮮度
+
+        Args:
+            entry: 快取項目
+
+        Returns:
+            FRESH、PRICE_STALE或STALE，entry為None時回傳None
+        """
+        if entry is None:
+            return None
+        now = time.time()
+        if now - entry["specs_fetched_at"] >= self.specs_ttl:
+            return STALE
+        if now - entry["price_fetched_at"] >= self.price_ttl:
+            return PRICE_STALE
+        return FRESH
+
+    def _save(self, product_id, entry):
+        self.memory.set(product_id, entry)
+        if self.store is not None:
+            self.store.set(product_id, entry, ttl=self.stale_ttl)
+
+    def put(self, product_id, url, fields, etag=None, last_modified=None):
+        """
+        寫入完整解析的商品資料
+
+        Args:
+            product_id: 商品ID
+            url: 商品頁面URL
+            fields: 商品欄位
+            etag: 回應的ETag標頭
+            last_modified: 回應的Last-Modified標頭
+        """
+        now = time.time()
+        entry = {
+            "url": url,
+            "fields": fields,
+            "etag": etag,
+            "last_modified": last_modified,
+            "price_fetched_at": now,
+            "specs_fetched_at": now,
+        }
+        self._save(product_id, entry)
+        self._count("stores")
+
+    def update_price(self, product_id, entry, price_fields, etag=None, last_modified=None):
+        """
+        只更新價格欄位，規格維持原本的快取時間
+
+        Args:
+            product_id: 商品ID
+            entry: 原本的快取項目
+            price_fields: 新的價格欄位
+            etag: 回應的ETag標頭
+            last_modified: 回應的Last-Modified標頭
+
+        Returns:
+            更新後的商品欄位
+        """
+        fields = dict(entry["fields"])
+        fields.update({key: price_fields[key] for key in PRICE_FIELDS})
+        entry = dict(entry, fields=fields, etag=etag, last_modified=last_modified, price_fetched_at=time.time())
+        self._save(product_id, entry)
+        self._count("price_refreshes")
+        return fields
+
+    def merge(self, product_id, entry, fields, etag=None, last_modified=None):
+        """
+        以重新解析的商品欄位更新快取，只替換有變更的欄位，價格與規格的快取時間都更新
+
+        Args:
+            product_id: 商品ID
+            entry: 原本的快取項目
+            fields: 新解析的商品欄位
+            etag: 回應的ETag標頭
+            last_modified: 回應的Last-Modified標頭
+
+        Returns:
+            list: 有變更的欄位名稱
+        """
+        changed = [key for key, value in fields.items() if entry["fields"].get(key) != value]
+        merged = dict(entry["fields"])
+        merged.update({key: fields[key] for key in changed})
+        now = time.time()
+        entry = dict(entry, fields=merged, etag=etag, last_modified=last_modified, price_fetched_at=now, specs_fetched_at=now)
+        self._save(product_id, entry)
+        self._count("merges")
+        return changed
+
+    def revalidated(self, product_id, entry):
+        """
+        伺服器回應304，內容未變更，更新價格與規格的快取時間
+
+        Args:
+            product_id: 商品ID
+            entry: 原本的快取項目
+        """
+        now = time.time()
+        entry = dict(entry, price_fetched_at=now, specs_fetched_at=now)
+        self._save(product_id, entry)
+        self._count("revalidations")
+
+    def conditional_headers(self, entry):
+        """
+        產生條件式請求的標頭
+
+        Args:
+            entry: 快取項目
+
+        Returns:
+            dict: If-None-Match與If-Modified-Since標頭
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def stats(self):
+        """
+        取得快取統計資料
+
+        Returns:
+            dict: 記憶體層的命中/未命中/淘汰次數，以及持久層命中與重新驗證次數
+        """
+        stats = self.memory.stats()
+        with self._lock:
+            stats.update(self._stats)
+        return stats
+
+    def purge_expired(self):
+        """
+        清除持久層中已過期的資料
+
+        Returns:
+            刪除的筆數
+        """
+        return self.store.purge_expired() if self.store is not None else 0
+
+    def close(self):
+        """關閉持久層"""
+        if self.store is not None:
+            self.store.close()
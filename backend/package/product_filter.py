@@ -0,0 +1,285 @@
+import unicodedata
+import logging
+import re
+import numpy as np
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# 特徵矩陣的欄位
+FEATURE_COLUMNS = ("price", "memory_gb", "storage_gb", "refresh_hz", "screen_inch")
+_PRICE, _MEMORY, _STORAGE, _REFRESH, _SCREEN = range(len(FEATURE_COLUMNS))
+
+# 預算: 數字(可帶萬/千/k)加上金額單位或上下限用語
+_AMOUNT = r"(\d+(?:\.\d+)?)\s*(萬|千|k)?\s*(\d)?"
+_BUDGET_RANGE = re.compile(_AMOUNT + r"\s*(?:元|塊)?\s*(?:到|至|~|-)\s*" + _AMOUNT + r"\s*(?:元|塊)?")
+_BUDGET_BOUND = re.compile(
+    r"(預算|價格|價位|售價|不超過|低於|少於|最多|\$|nt\$?)?\s*(?:在|約|大約|大概)?\s*" + _AMOUNT +
+    r"\s*(元|塊)?\s*(以內|以下|之內|內|有找|以上|起|左右|上下)?"
+)
+
+# 查詢中的規格需求
+_QUERY_MEMORY = re.compile(r"(\d{1,3})\s*g(?:b)?\s*(?:的)?\s*(?:記憶體|ram)|(?:記憶體|ram)\s*(?:要|至少)?\s*(\d{1,3})\s*g")
+_QUERY_STORAGE = re.compile(r"(\d{1,4})\s*(tb|gb?)\s*(?:的)?\s*(?:ssd|硬碟|容量|儲存)|(?:ssd|硬碟|容量)\s*(?:要|至少)?\s*(\d{1,4})\s*(tb|gb?)")
+_QUERY_REFRESH = re.compile(r"(\d{2,3})\s*hz")
+_QUERY_SCREEN = re.compile(r"(\d{1,2}(?:\.\d)?)\s*(?:吋|寸|inch|\")")
+
+# 商品頁面中的規格數字
+_SPEC_MEMORY_KEY = re.compile(r"記憶體|ram", re.IGNORECASE)
+_SPEC_STORAGE_KEY = re.compile(r"硬碟|ssd|儲存|容量", re.IGNORECASE)
+_SPEC_SCREEN_KEY = re.compile(r"螢幕|尺寸|顯示器", re.IGNORECASE)
+_GB_VALUE = re.compile(r"(\d{1,4})\s*(tb|gb?)(?![a-z])", re.IGNORECASE)
+_TEXT_MEMORY = re.compile(r"(\d{1,3})\s*GB?\s*(?:記憶體|RAM|DDR\d|LPDDR\d)|[/(]\s*(\d{1,3})\s*GB?\s*[/)]", re.IGNORECASE)
+_TEXT_STORAGE = re.compile(r"(\d{1,4})\s*(TB|GB?)\s*(?:SSD|HDD|PCIe|M\.2|硬碟)", re.IGNORECASE)
+_TEXT_REFRESH = re.compile(r"(\d{2,3})\s*Hz", re.IGNORECASE)
+_TEXT_SCREEN = re.compile(r"(\d{1,2}(?:\.\d)?)\s*(?:吋|寸|inch|\")", re.IGNORECASE)
+
+def _amount(number, unit, trailing):
+    """把"3萬"、"2萬5"、"15k"之類的金額轉成元"""
+    value = float(number)
+    if unit == "萬":
+        value = value * 10000 + (int(trailing) * 1000 if trailing else 0)
+    elif unit in ("千", "k"):
+        value *= 1000
+    return value
+
+def _to_gb(number, unit):
+    return float(number) * (1024 if unit.lower() == "tb" else 1)
+
+def iter_budget_matches(text):
+    """
+    找出查詢中的預算金額，前後沒有預算用語、金額單位或上下限用語的數字(例如iphone 15、4k、128g)不算
+
+    Args:
+        text: NFKC正規化、轉小寫並去掉千分位逗號的查詢
+
+    Yields:
+        re.Match: _BUDGET_BOUND的比對結果，group依序為(預算用語, 數字, 單位, 萬後面的數字, 元/塊, 上下限用語)
+    """
+    for match in _BUDGET_BOUND.finditer(text):
+        context, number, unit, trailing, currency, bound = match.groups()
+        if not (context or unit or currency or bound):
+            continue
+        # "4k螢幕"之類的k不是金額
+        if unit == "k" and not (context or currency or bound):
+            continue
+        # 沒有金額單位的小數字多半是規格(例如"16以上")，不視為預算
+        if not (context or unit or currency) and float(number) < 1000:
+            continue
+        if text[match.end():match.end() + 3].lstrip()[:1] in ("g", "t", "h", "吋", "寸"):
+            continue
+        yield match
+
+def budget_spans(text):
+    """
+    查詢中預算金額與價格範圍的位置，讓關鍵字產生器標記為已理解
+
+    Args:
+        text: NFKC正規化、轉小寫並去掉千分位逗號的查詢
+
+    Returns:
+        list: (開始, 結束)位置
+    """
+    spans = [match.span() for match in _BUDGET_RANGE.finditer(text) if match.group(2) or match.group(5)]
+    spans.extend(match.span() for match in iter_budget_matches(text))
+    return spans
+
+def parse_constraints(user_query):
+    """
+    從用戶查詢解析預算與數值規格需求
+
+    Args:
+        user_query: 用戶的原始查詢
+
+    Returns:
+        dict: 可能包含max_price、min_price、memory_gb、storage_gb、refresh_hz、screen_inch
+    """
+    text = unicodedata.normalize("NFKC", user_query or "").lower()
+    # 去掉千分位逗號
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+    constraints = {}
+
+    match = _BUDGET_RANGE.search(text)
+    if match and (match.group(2) or match.group(5)):
+        # "2到3萬"的單位只寫在後面
+        low = _amount(match.group(1), match.group(2) or match.group(5), match.group(3))
+        high = _amount(match.group(4), match.group(5), match.group(6))
+        constraints["min_price"], constraints["max_price"] = min(low, high), max(low, high)
+    else:
+        for match in iter_budget_matches(text):
+            _, number, unit, trailing, _, bound = match.groups()
+            value = _amount(number, unit, trailing)
+            if bound in ("以上", "起"):
+                constraints["min_price"] = value
+            elif bound in ("左右", "上下"):
+                constraints["min_price"], constraints["max_price"] = value * 0.8, value * 1.1
+            else:
+                constraints["max_price"] = value
+            break
+
+    match = _QUERY_MEMORY.search(text)
+    if match:
+        constraints["memory_gb"] = float(match.group(1) or match.group(2))
+    match = _QUERY_STORAGE.search(text)
+    if match:
+        constraints["storage_gb"] = _to_gb(match.group(1) or match.group(3), match.group(2) or match.group(4))
+    match = _QUERY_REFRESH.search(text)
+    if match:
+        constraints["refresh_hz"] = float(match.group(1))
+    match = _QUERY_SCREEN.search(text)
+    if match:
+        constraints["screen_inch"] = float(match.group(1))
+    return constraints
+
+def _spec_value(product, key_pattern, value_pattern):
+    """從規格表中名稱符合key_pattern的欄位取出第一個數值比對結果"""
+    for key, value in product.spec_items():
+        if key_pattern.search(key):
+            match = value_pattern.search(value)
+            if match:
+                return match
+    return None
+
+def product_features(product):
+    """
+    從商品資料解析價格與規格數字
+
+    Args:
+        product: ProductRecord
+
+    Returns:
+        list: 依FEATURE_COLUMNS排列的數值，找不到時為nan
+    """
+    text = "\n".join([product.name, *product.features, product.specs_text])
+    values = [np.nan] * len(FEATURE_COLUMNS)
+
+    if product.price is not None:
+        values[_PRICE] = product.price
+
+    match = _spec_value(product, _SPEC_MEMORY_KEY, _GB_VALUE)
+    if match:
+        values[_MEMORY] = _to_gb(*match.groups())
+    else:
+        match = _TEXT_MEMORY.search(text)
+        if match and int(match.group(1) or match.group(2)) <= 128:
+            values[_MEMORY] = float(match.group(1) or match.group(2))
+
+    match = _spec_value(product, _SPEC_STORAGE_KEY, _GB_VALUE) or _TEXT_STORAGE.search(text)
+    if match:
+        values[_STORAGE] = _to_gb(*match.groups())
+
+    # 可切換更新率的螢幕取最高值
+    rates = [int(rate) for rate in _TEXT_REFRESH.findall(text)]
+    rates += [int(rate) for _, value in product.spec_items() for rate in _TEXT_REFRESH.findall(value)]
+    if rates:
+        values[_REFRESH] = max(rates)
+
+    match = _spec_value(product, _SPEC_SCREEN_KEY, _TEXT_SCREEN) or _TEXT_SCREEN.search(text)
+    if match:
+        values[_SCREEN] = float(match.group(1))
+    return values
+
+class ProductFilter:
+    """
+    送進LLM前的商品篩選與排序
+    依查詢中的預算與規格需求建立特徵矩陣，以向量運算排除超出預算的商品，
+    並依符合的規格數量與搜尋排名選出前top_k個商品
+    """
+
+    def __init__(self, top_k=8, screen_tolerance=1.0):
+        """
+        初始化商品篩選器
+
+        Args:
+            top_k: 最多保留的商品數量，0則不限制數量，與SearchReranker的top_n相同時抓取的商品都會用到
+            screen_tolerance: 螢幕尺寸與需求相差幾吋內視為符合
+        """
+        self.top_k = top_k
+        self.screen_tolerance = screen_tolerance
+
+    def feature_matrix(self, products):
+        """
+        建立商品特徵矩陣
+
+        Args:
+            products: ProductRecord列表
+
+        Returns:
+            numpy.ndarray: 形狀為(商品數, len(FEATURE_COLUMNS))，缺少的數值為nan
+        """
+        if not products:
+            return np.empty((0, len(FEATURE_COLUMNS)))
+        return np.array([product_features(product) for product in products], dtype=float)
+
+    def score(self, matrix, constraints):
+        """
+        計算每個商品是否在預算內與規格符合程度
+
+        Args:
+            matrix: feature_matrix產生的特徵矩陣
+            constraints: parse_constraints產生的需求
+
+        Returns:
+            tuple: (是否在預算內的布林陣列, 分數陣列)
+                - 沒有價格的商品視為在預算內，但分數較低
+        """
+        count = matrix.shape[0]
+        within_budget = np.ones(count, dtype=bool)
+        scores = np.zeros(count)
+
+        price = matrix[:, _PRICE]
+        if "max_price" in constraints or "min_price" in constraints:
+            known = ~np.isnan(price)
+            if "max_price" in constraints:
+                within_budget &= ~known | (price <= constraints["max_price"])
+            if "min_price" in constraints:
+                within_budget &= ~known | (price >= constraints["min_price"])
+            scores -= 0.5 * ~known
+
+        # 規格: 符合+1、不符合-1、無法判斷0
+        for column, key in ((_MEMORY, "memory_gb"), (_STORAGE, "storage_gb"), (_REFRESH, "refresh_hz")):
+            if key in constraints:
+                values = matrix[:, column]
+                scores += np.where(np.isnan(values), 0.0, np.where(values >= constraints[key], 1.0, -1.0))
+        if "screen_inch" in constraints:
+            values = matrix[:, _SCREEN]
+            close = np.abs(values - constraints["screen_inch"]) <= self.screen_tolerance
+            scores += np.where(np.isnan(values), 0.0, np.where(close, 1.0, -1.0))
+
+        # 分數相同時維持搜尋排名
+        scores -= np.arange(count) / max(count, 1) * 0.5
+        return within_budget, scores
+
+    def select(self, user_query, products):
+        """
+        篩選並排序要送進LLM的商品
+
+        Args:
+            user_query: 用戶的原始查詢
+            products: 依搜尋排名排序的ProductRecord列表
+
+        Returns:
+            篩選後的ProductRecord列表，抓取失敗的商品排在最後
+        """
+        available = [product for product in products if product.ok]
+        failed = [product for product in products if not product.ok]
+        constraints = parse_constraints(user_query)
+        if not available or (not constraints and not self.top_k):
+            return products
+
+        matrix = self.feature_matrix(available)
+        within_budget, scores = self.score(matrix, constraints)
+        candidates = np.flatnonzero(within_budget)
+        if candidates.size == 0:
+            # 沒有商品在預算內時改送最便宜的商品，讓LLM說明預算不足
+            logger.warning(f"沒有商品符合預算 {constraints}，改用價格最低的商品")
+            candidates = np.argsort(np.nan_to_num(matrix[:, _PRICE], nan=np.inf), kind="stable")
+        else:
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        if self.top_k:
+            candidates = candidates[:self.top_k]
+
+        selected = [available[index] for index in candidates]
+        logger.info(f"商品篩選: 需求 {constraints}，{len(available)} 個商品中預算內 {int(within_budget.sum())} 個，"
+                    f"保留 {len(selected)} 個")
+        return selected + failed
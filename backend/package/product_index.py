@@ -0,0 +1,267 @@
+from package.reranker import tokenize
+import unicodedata
+import threading
+import logging
+import sqlite3
+import time
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+class ProductIndex:
+    """
+    爬取過的PChome商品的本地全文索引
+    使用SQLite FTS5，中文在寫入前先切成二字詞再交給unicode61分詞器，
+    可以用搜尋關鍵字直接查詢本地商品，取代部分Google Custom Search請求。
+    另外記錄每組關鍵字最後一次使用Google搜尋的時間，讓熱門關鍵字仍會定期用Google搜尋以發現新商品
+    """
+
+    def __init__(self, db_path, table="product_index"):
+        """
+        初始化商品全文索引
+
+        Args:
+            db_path: SQLite資料庫檔案路徑
+            table: FTS5資料表名稱，商品資料另存於{table}_docs，關鍵字的Google搜尋時間存於{table}_queries
+        """
+        self.db_path = db_path
+        self.table = table
+        self._lock = threading.Lock()
+        self._stats = {"searches": 0, "hits": 0, "misses": 0, "writes": 0, "search_seconds": 0.0}
+        self._conn = None
+        try:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}_docs ("
+                "id INTEGER PRIMARY KEY, product_id TEXT NOT NULL UNIQUE, url TEXT NOT NULL, "
+                "title TEXT NOT NULL, snippet TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(title, body, tokenize='unicode61')")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_queries (key TEXT PRIMARY KEY, searched_at REAL NOT NULL)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # 索引只是加速用，無法使用(例如SQLite沒有FTS5)時一律改用Google搜尋
+            logger.error(f"無法建立商品全文索引 {db_path}: {e}")
+            self._conn = None
+
+    @property
+    def available(self):
+        return self._conn is not None
+
+    @staticmethod
+    def _index_text(text):
+        """把文字轉成以空白分隔的詞，中文為二字詞"""
+        return " ".join(tokenize(text))
+
+    def add(self, product_id, url, fields):
+        """
+        寫入或更新商品
+
+        Args:
+            product_id: 商品ID
+            url: 商品頁面URL
+            fields: parse_product_page產生的商品欄位
+        """
+        if self._conn is None:
+            return
+        specs = " ".join(f"{key} {' '.join(value) if isinstance(value, list) else value}" for key, value in fields["specs"].items())
+        title = fields["name"]
+        body = " ".join([fields["brand"], *fields["features"], specs, fields["specs_text"]])
+        snippet = " / ".join(fields["features"][:3]) or fields["specs_text"][:120]
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(f"SELECT id FROM {self.table}_docs WHERE product_id = ?", (product_id,)).fetchone()
+                if row is None:
+                    cursor = self._conn.execute(
+                        f"INSERT INTO {self.table}_docs (product_id, url, title, snippet, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (product_id, url, title, snippet, now)
+                    )
+                    doc_id = cursor.lastrowid
+                else:
+                    doc_id = row[0]
+                    self._conn.execute(
+                        f"UPDATE {self.table}_docs SET url = ?, title = ?, snippet = ?, updated_at = ? WHERE id = ?",
+                        (url, title, snippet, now, doc_id)
+                    )
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE rowid = ?", (doc_id,))
+                self._conn.execute(
+                    f"INSERT INTO {self.table} (rowid, title, body) VALUES (?, ?, ?)",
+                    (doc_id, self._index_text(title), self._index_text(body))
+                )
+                self._conn.commit()
+                self._stats["writes"] += 1
+        except sqlite3.Error as e:
+            logger.error(f"寫入商品全文索引時發生錯誤: {e}")
+
+    def touch(self, product_id):
+        """
+        商品內容沒有變更(例如回應304)時只更新索引時間
+
+        Args:
+            product_id: 商品ID
+        """
+        if self._conn is None:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(f"UPDATE {self.table}_docs SET updated_at = ? WHERE product_id = ?", (time.time(), product_id))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"更新商品全文索引時發生錯誤: {e}")
+
+    @staticmethod
+    def build_match_query(keywords):
+        """
+        把搜尋關鍵字轉成FTS5查詢，每個關鍵字是一個詞組，所有關鍵字都要符合
+
+        Args:
+            keywords: 以空格分隔的搜尋關鍵字
+
+        Returns:
+            FTS5 MATCH字串，沒有可用的詞時回傳空字串
+        """
+        phrases = []
+        for keyword in (keywords or "").split():
+            tokens = tokenize(keyword)
+            if tokens:
+                phrases.append('"' + " ".join(tokens) + '"')
+        return " AND ".join(phrases)
+
+    def search(self, keywords, limit=10, max_age=None, min_hits=1):
+        """
+        以搜尋關鍵字查詢本地商品
+
+        Args:
+            keywords: 以空格分隔的搜尋關鍵字
+            limit: 最多回傳的商品數量
+            max_age: 只使用幾秒內更新過的商品，None則不限制
+            min_hits: 少於這個數量視為未命中
+
+        Returns:
+            與google_search相同格式的結果列表，依BM25排序；未命中時回傳None
+        """
+        match_query = self.build_match_query(keywords)
+        if self._conn is None or not match_query:
+            return None
+        oldest = time.time() - max_age if max_age else 0
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT d.url, d.title, d.snippet FROM {self.table} JOIN {self.table}_docs d ON d.id = {self.table}.rowid "
+                    f"WHERE {self.table} MATCH ? AND d.updated_at >= ? ORDER BY bm25({self.table}, 5.0, 1.0) LIMIT ?",
+                    (match_query, oldest, limit)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"查詢商品全文索引時發生錯誤: {e}")
+            rows = []
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["search_seconds"] += elapsed
+            self._stats["hits" if len(rows) >= min_hits else "misses"] += 1
+        if len(rows) < min_hits:
+            return None
+        return [
+            {"標題": title, "連結": url, "摘要": snippet, "來源": "24h.pchome.com.tw"}
+            for url, title, snippet in rows
+        ]
+
+    @staticmethod
+    def _query_key(keywords):
+        """全形轉半形並統一大小寫，關鍵字去重後排序"""
+        normalized = unicodedata.normalize("NFKC", keywords or "").casefold()
+        return " ".join(sorted(set(normalized.split())))
+
+    def record_search(self, keywords):
+        """
+        記錄這組關鍵字剛用Google搜尋過
+
+        Args:
+            keywords: 以空格分隔的搜尋關鍵字
+        """
+        if self._conn is None:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table}_queries (key, searched_at) VALUES (?, ?)",
+                    (self._query_key(keywords), time.time())
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"寫入關鍵字搜尋時間時發生錯誤: {e}")
+
+    def last_search(self, keywords):
+        """
+        取得這組關鍵字最後一次用Google搜尋的時間
+
+        Args:
+            keywords: 以空格分隔的搜尋關鍵字
+
+        Returns:
+            time.time()格式的時間，沒有記錄時回傳None
+        """
+        if self._conn is None:
+            return None
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    f"SELECT searched_at FROM {self.table}_queries WHERE key = ?", (self._query_key(keywords),)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"查詢關鍵字搜尋時間時發生錯誤: {e}")
+            return None
+        return row[0] if row else None
+
+    def purge_searches(self, max_age):
+        """
+        清除超過max_age秒沒有用Google搜尋的關鍵字記錄
+
+        Returns:
+            刪除的筆數
+        """
+        if self._conn is None:
+            return 0
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"DELETE FROM {self.table}_queries WHERE searched_at <= ?", (time.time() - max_age,)
+                )
+                self._conn.commit()
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"清除關鍵字搜尋時間時發生錯誤: {e}")
+            return 0
+
+    def stats(self):
+        """
+        取得索引統計資料
+
+        Returns:
+            dict: 商品數量、查詢/命中/未命中/寫入次數與平均查詢毫秒數
+        """
+        documents = 0
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    documents = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}_docs").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            stats = dict(self._stats)
+        searches = stats.pop("searches")
+        search_seconds = stats.pop("search_seconds")
+        stats["documents"] = documents
+        stats["searches"] = searches
+        stats["hit_rate"] = round(stats["hits"] / searches, 4) if searches else 0.0
+        stats["avg_search_ms"] = round(search_seconds / searches * 1000, 3) if searches else 0.0
+        return stats
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
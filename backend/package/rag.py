@@ -1,20 +1,120 @@
 import google.generativeai as genai 
 from googleapiclient.discovery import build 
-import requests
-from bs4 import BeautifulSoup
+from googleapiclient.http import build_http
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import functools
+import inspect
+import threading
+import asyncio
 import logging
 import json
+import time
+from package.fetcher import ConcurrentFetcher
+from package.http_client import HTTPClient
+from package.pchome_parser import extract_product_id, parse_product_page, is_parsed_product, PRICE_FIELDS
+from package.product import ProductRecord
+from package.product_cache import ProductCache, FRESH, PRICE_STALE
+from package.search_cache import SearchCache
+from package.keyword_extractor import KeywordExtractor
+from package.result_cache import ResultCache
+from package.context_builder import ContextBuilder
+from package.product_filter import ProductFilter
+from package.reranker import SearchReranker
+from package.semantic_cache import SemanticCache
+from package.product_index import ProductIndex
+from package.refresher import ProductRefresher
+from package.json_output import build_response_schema, extract_json_text, loads_tolerant, schema_problems
+from package.metrics import track_stage, RAG_IN_FLIGHT, GEMINI_SECONDS, GEMINI_TOKENS, GEMINI_ERRORS
 
 # 設定日誌
 logger = logging.getLogger(__name__)
 
+# 限制Google搜尋只找PChome商品頁面
+PCHOME_SEARCH_PREFIX = "inurl:24h.pchome.com.tw/prod"
+
+# 產品比較流程需要外部API的步驟，執行者依name呼叫同步或非同步的方法後把結果送回流程
+_StageCall = namedtuple("_StageCall", ["name", "args"])
+
+# 商品搜尋來源: google只用Custom Search，hybrid先查本地全文索引，結果不足時才用Custom Search
+RETRIEVER_MODES = ("google", "hybrid")
+
+# 設置生成參數，提高輸出品質
+GENERATION_CONFIG = {
+    "temperature": 0.2,  # softmax中logit/t
+    "top_p": 0.95,       # token機率總和
+    "top_k": 40,         # 前k個token
+    "max_output_tokens": 4096  # 輸出最多幾個token
+}
+
+# 關鍵字只有幾個詞，用確定性的輸出並限制長度
+KEYWORD_GENERATION_CONFIG = {
+    "temperature": 0.0,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 64
+}
+
+# 呼叫Gemini的階段，repair為用便宜模型修正格式錯誤的比較結果
+LLM_STAGES = ("keywords", "comparison", "repair")
+
+# 產品比較結果的JSON結構，用於提示詞與Gemini的response_schema
+COMPARISON_SPEC = {
+    "comparison_results": {
+        "best_choice": "最佳商品名稱",
+        "best_value": "最高性價比商品",
+        "best_quality": "最佳品質商品",
+        "most_features": "功能最齊全商品"
+    },
+    "product_comparisons": [
+        {
+            "product_name": "商品名稱",
+            "brand": "品牌名稱",
+            "price": "價格",
+            "pros": ["優點 1", "優點 2", "..."],
+            "cons": ["缺點 1", "缺點 2", "..."],
+            "key_features": ["特色 1", "特色 2", "..."],
+            "suitable_scenarios": ["適用場景 1", "適用場景 2", "..."],
+            "rating": 8.5,
+            "link": "直接從產品資訊中複製完整的購買連結，不要修改或創造連結"
+        },
+        {
+            "product_name": "商品名稱",
+            "brand": "品牌名稱",
+            "price": "價格",
+            "pros": ["優點 1", "優點 2", "..."],
+            "cons": ["缺點 1", "缺點 2", "..."],
+            "key_features": ["特色 1", "特色 2", "..."],
+            "suitable_scenarios": ["適用場景 1", "適用場景 2", "..."],
+            "rating": 7.8,
+            "link": "直接從產品資訊中複製完整的購買連結，不要修改或創造連結"
+        }
+    ],
+    "analysis": "整體比較分析和建議"
+}
+COMPARISON_SCHEMA = build_response_schema(COMPARISON_SPEC)
+
 class RAGService:
     """
     RAG (Retrieval-Augmented Generation) 服務類
     整合了關鍵字生成、Google搜尋、網頁爬蟲和LLM回應生成功能
     """
     
-    def __init__(self, gemini_api_key, google_search_api_key, google_cse_id, model_name="gemini-2.0-flash"):
+    def __init__(self, gemini_api_key, google_search_api_key, google_cse_id, model_name="gemini-2.0-flash",
+                 fetch_max_workers=8, fetch_per_host_limit=4, fetch_timeout=None,
+                 http_connect_timeout=3.05, http_read_timeout=10, http_max_retries=3,
+                 cache_db_path=None, product_cache_size=1000, price_ttl=600, specs_ttl=86400,
+                 search_cache_ttl=3600, search_cache_size=500, search_cache_persist=True,
+                 keyword_min_confidence=0.8, blocking_workers=16,
+                 result_cache_ttl=900, result_cache_size=256, context_max_tokens=6000,
+                 product_top_k=8, search_rerank_top_n=8,
+                 semantic_cache_ttl=900, semantic_cache_size=512,
+                 semantic_result_threshold=0.9, semantic_stage_threshold=0.75,
+                 retriever_mode="hybrid", local_min_hits=5, local_max_age=3 * 86400, local_query_ttl=86400,
+                 refresh_interval=60, refresh_max_per_cycle=20, refresh_rate=1.0,
+                 keyword_model_name=None, comparison_model_name=None,
+                 keyword_max_output_tokens=64, comparison_max_output_tokens=4096,
+                 structured_output=True, json_repair=True):
         """
         初始化RAG服務
         
@@ -23,15 +123,246 @@ class RAGService:
             google_search_api_key: Google Search API金鑰
             google_cse_id: Google Custom Search Engine ID
             model_name: Gemini模型名稱，預設為"gemini-1.5-flash"
+            fetch_max_workers: 商品頁面全域最大併發抓取數
+            fetch_per_host_limit: 同一主機最大併發抓取數
+            fetch_timeout: 整批商品頁面抓取的最長等待秒數，None為不限制
+            http_connect_timeout: 商品頁面建立連線的超時秒數
+            http_read_timeout: 商品頁面讀取回應的超時秒數
+            http_max_retries: 商品頁面5xx或連線錯誤時的最大重試次數
+            cache_db_path: 快取持久層的SQLite檔案路徑，None則只使用記憶體快取
+            product_cache_size: 商品快取記憶體層的最大商品數量
+            price_ttl: 商品價格的快取秒數
+            specs_ttl: 商品規格的快取秒數
+            search_cache_ttl: Google搜尋結果的快取秒數
+            search_cache_size: 搜尋結果快取記憶體層的最大項目數量
+            search_cache_persist: 搜尋結果是否也寫入快取持久層
+            keyword_min_confidence: 規則式關鍵字的最低信心分數，低於此值改用Gemini產生，大於1則停用規則式
+            blocking_workers: 非同步API中執行同步步驟的執行緒數量上限
+            result_cache_ttl: 產品比較結果的快取秒數，0則停用
+            result_cache_size: 產品比較結果快取的最大項目數量
+            context_max_tokens: 比較提示詞中商品資訊的token預算
+            product_top_k: 依預算與規格篩選後送進比較提示詞的商品數量，0則不限制
+            search_rerank_top_n: 搜尋結果重新排序並去除重複商品後抓取的商品數量，0則不限制
+            semantic_cache_ttl: 近似查詢快取的存活秒數，0則停用
+            semantic_cache_size: 近似查詢快取的最大項目數量
+            semantic_result_threshold: 重用近似查詢比較結果的最低相似度
+            semantic_stage_threshold: 重用近似查詢關鍵字與搜尋結果的最低相似度
+            retriever_mode: 商品搜尋來源，"google"或"hybrid"
+            local_min_hits: hybrid模式下本地索引至少要找到的商品數量，不足時改用Google搜尋
+            local_max_age: hybrid模式下只使用幾秒內更新過的本地商品
+            local_query_ttl: hybrid模式下同一組關鍵字至少每隔幾秒用Google搜尋一次，才能發現新上架的商品
+            refresh_interval: 熱門商品背景更新的間隔秒數，0則停用
+            refresh_max_per_cycle: 每輪背景更新最多抓取的商品數量
+            refresh_rate: 背景更新每秒最多抓取的商品數量
+            keyword_model_name: 產生搜尋關鍵字的模型，None則使用model_name
+            comparison_model_name: 產生產品比較的模型，None則使用model_name
+            keyword_max_output_tokens: 關鍵字階段最多輸出的token數量
+            comparison_max_output_tokens: 產品比較階段最多輸出的token數量
+            structured_output: 產品比較是否要求Gemini依COMPARISON_SCHEMA輸出JSON
+            json_repair: 比較結果無法解析時是否用關鍵字模型修正一次
         """
+        if retriever_mode not in RETRIEVER_MODES:
+            raise ValueError(f"retriever_mode必須是{RETRIEVER_MODES}其中之一: {retriever_mode}")
         self.gemini_api_key = gemini_api_key
         self.google_search_api_key = google_search_api_key
         self.google_cse_id = google_cse_id
         self.model_name = model_name
         
+        # 各階段使用的模型與生成參數，關鍵字用便宜快速的模型，比較用較強的模型
+        self.stage_models = {
+            "keywords": keyword_model_name or model_name,
+            "comparison": comparison_model_name or model_name,
+            "repair": keyword_model_name or model_name,
+        }
+        # structured_output=False時比較與修正都不要求固定結構的JSON
+        json_config = {"response_mime_type": "application/json", "response_schema": COMPARISON_SCHEMA} if structured_output else {}
+        self.stage_configs = {
+            "keywords": dict(KEYWORD_GENERATION_CONFIG, max_output_tokens=keyword_max_output_tokens),
+            "comparison": dict(GENERATION_CONFIG, max_output_tokens=comparison_max_output_tokens, **json_config),
+            "repair": dict(KEYWORD_GENERATION_CONFIG, max_output_tokens=comparison_max_output_tokens, **json_config),
+        }
+        self.json_repair = json_repair
+        self._parse_stats = {"parsed": 0, "repaired": 0, "failed": 0}
+        self._llm_lock = threading.Lock()
+        self._llm_stats = {
+            stage: {"calls": 0, "errors": 0, "seconds": 0.0, "prompt_tokens": 0, "output_tokens": 0}
+            for stage in LLM_STAGES
+        }
+        self.fetch_timeout = fetch_timeout
+        
+        # 商品頁面併發抓取器
+        self.fetcher = ConcurrentFetcher(max_workers=fetch_max_workers, per_host_limit=fetch_per_host_limit)
+        
+        # 共用的HTTP客戶端，連線池大小配合併發抓取數
+        self.http_client = HTTPClient(
+            pool_maxsize=fetch_max_workers,
+            connect_timeout=http_connect_timeout,
+            read_timeout=http_read_timeout,
+            max_retries=http_max_retries
+        )
+        
+        # 商品資料快取，以商品ID為key
+        self.product_cache = ProductCache(
+            db_path=cache_db_path,
+            max_entries=product_cache_size,
+            price_ttl=price_ttl,
+            specs_ttl=specs_ttl
+        )
+        
+        # Google搜尋結果快取，以正規化後的關鍵字為key
+        self.search_cache = SearchCache(
+            ttl=search_cache_ttl,
+            max_entries=search_cache_size,
+            db_path=cache_db_path if search_cache_persist else None
+        )
+        
+        # 規則式關鍵字產生器，常見查詢不必呼叫Gemini
+        self.keyword_extractor = KeywordExtractor()
+        self.keyword_min_confidence = keyword_min_confidence
+        
+        # 有token預算的檢索內容產生器
+        self.context_builder = ContextBuilder(max_tokens=context_max_tokens)
+        
+        # 送進LLM前依預算與規格篩選商品
+        self.product_filter = ProductFilter(top_k=product_top_k)
+        if product_top_k and (not search_rerank_top_n or search_rerank_top_n > product_top_k):
+            logger.warning(f"search_rerank_top_n({search_rerank_top_n})大於product_top_k({product_top_k})，"
+                           f"部分抓取的商品頁面不會送進比較提示詞")
+        
+        # 抓取商品頁面前先依標題與摘要重新排序搜尋結果
+        self.search_reranker = SearchReranker(top_n=search_rerank_top_n)
+        
+        # 產品比較結果快取，相同查詢的併發請求只執行一次流程
+        self.result_cache = ResultCache(ttl=result_cache_ttl, max_entries=result_cache_size) if result_cache_ttl > 0 else None
+        
+        # 近似查詢快取，換句話說的查詢也能重用比較結果或搜尋結果
+        self.semantic_cache = SemanticCache(
+            ttl=semantic_cache_ttl,
+            max_entries=semantic_cache_size,
+            result_threshold=semantic_result_threshold,
+            stage_threshold=semantic_stage_threshold
+        ) if semantic_cache_ttl > 0 else None
+        
+        # 爬取過的商品寫入本地全文索引，hybrid模式下優先用索引回答搜尋
+        self.product_index = ProductIndex(cache_db_path) if cache_db_path else None
+        self.retriever_mode = retriever_mode
+        self.local_min_hits = local_min_hits
+        self.local_max_age = local_max_age
+        self.local_query_ttl = local_query_ttl
+        
+        # 非同步API中無法非同步化的步驟(Custom Search、爬蟲)交給有上限的執行緒池
+        self._blocking_executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="rag")
+        
+        # 熱門商品背景更新，價格過期前先重新抓取，由FastAPI lifespan啟動
+        self.refresher = ProductRefresher(
+            self.refresh_product,
+            self.product_age,
+            executor=self._blocking_executor,
+            interval=refresh_interval,
+            max_per_cycle=refresh_max_per_cycle,
+            rate=refresh_rate,
+            due_after=price_ttl * 0.8,
+            purge_func=self.purge_expired
+        ) if refresh_interval > 0 else None
+        
         # 設定Gemini API
         genai.configure(api_key=self.gemini_api_key)
         
+        # 長期存活的API客戶端，於startup或第一次使用時建立
+        self._models = {}
+        self._search_service = None
+        self._client_lock = threading.Lock()
+        self._thread_local = threading.local()
+        self.client_init_timings = {}
+    
+    def startup(self, warm_up=True):
+        """
+        建立Gemini與Custom Search客戶端並預熱，並清除過期的快取資料，供FastAPI lifespan呼叫
+        
+        Args:
+            warm_up: 是否發送一次輕量請求建立連線
+            
+        Returns:
+            dict: 各客戶端建立與預熱的耗時(秒)
+        """
+        models = [self._get_model(model_name) for model_name in dict.fromkeys(self.stage_models.values())]
+        self._get_search_service()
+        self.purge_expired()
+        
+        if warm_up:
+            start = time.perf_counter()
+            try:
+                # count_tokens不產生內容，只用來建立連線，所有模型共用同一個連線
+                models[0].count_tokens("warm up")
+            except Exception as e:
+                logger.warning(f"Gemini預熱失敗: {e}")
+            self.client_init_timings["gemini_warm_up"] = time.perf_counter() - start
+        
+        logger.info(f"API客戶端建立耗時: {self.client_init_timings}")
+        return self.client_init_timings
+    
+    def _get_model(self, model_name):
+        """取得共用的GenerativeModel，不存在時建立"""
+        model = self._models.get(model_name)
+        if model is None:
+            with self._client_lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    start = time.perf_counter()
+                    model = genai.GenerativeModel(model_name=model_name)
+                    self._models[model_name] = model
+                    self.client_init_timings[f"gemini:{model_name}"] = time.perf_counter() - start
+        return model
+    
+    def _get_search_service(self):
+        """取得共用的Custom Search服務物件，只讀取一次discovery文件"""
+        if self._search_service is None:
+            with self._client_lock:
+                if self._search_service is None:
+                    start = time.perf_counter()
+                    self._search_service = build(
+                        "customsearch", "v1",
+                        developerKey=self.google_search_api_key,
+                        cache_discovery=False
+                    )
+                    self.client_init_timings["customsearch"] = time.perf_counter() - start
+        return self._search_service
+    
+    def _get_thread_http(self):
+        """httplib2.Http不是執行緒安全的，每個執行緒各自使用一個"""
+        http = getattr(self._thread_local, "http", None)
+        if http is None:
+            http = build_http()
+            self._thread_local.http = http
+        return http
+    
+    def purge_expired(self):
+        """
+        清除快取持久層中已過期的商品與搜尋結果，避免快取資料庫無限制成長
+        
+        Returns:
+            dict: 各快取刪除的筆數
+        """
+        purged = {
+            "product_cache": self.product_cache.purge_expired(),
+            "search_cache": self.search_cache.purge_expired(),
+        }
+        if self.product_index is not None:
+            purged["product_index_queries"] = self.product_index.purge_searches(self.local_query_ttl)
+        if any(purged.values()):
+            logger.info(f"清除過期快取: {purged}")
+        return purged
+    
+    def close(self):
+        """釋放執行緒池、HTTP連線池與快取資料庫"""
+        self._blocking_executor.shutdown(wait=False, cancel_futures=True)
+        self.fetcher.shutdown()
+        self.http_client.close()
+        self.product_cache.close()
+        self.search_cache.close()
+        if self.product_index is not None:
+            self.product_index.close()
+        
     def create_search_keywords_prompt(self, user_query):
         """
         根據用戶query，產生關鍵字用於google search
@@ -195,35 +526,283 @@ class RAGService:
                 用戶需求: {user_query}
                 """
 
-    def get_gemini_response(self, llm_input):
+    def _rule_keywords(self, user_query):
         """
-        調整生成回應參數，並使用 Google Gemini API 生成回應。
+        產生規則式關鍵字並判斷信心是否足夠
+        
+        Args:
+            user_query: 用戶的原始查詢
+            
+        Returns:
+            tuple: (規則式關鍵字, 是否可以直接使用)
+        """
+        keywords, confidence = self.keyword_extractor.extract(user_query)
+        if keywords and confidence >= self.keyword_min_confidence:
+            logger.info(f"使用規則式關鍵字(信心 {confidence}): {keywords}")
+            return keywords, True
+        logger.info(f"規則式關鍵字信心不足({confidence})，改用Gemini產生")
+        return keywords, False
+
+    def generate_search_keywords(self, user_query):
+        """
+        產生搜尋關鍵字，規則式結果信心足夠時直接使用，否則交給Gemini
+        
+        Args:
+            user_query: 用戶的原始查詢
+            
+        Returns:
+            以空格分隔的搜尋關鍵字
+        """
+        keywords, confident = self._rule_keywords(user_query)
+        if confident:
+            return keywords
+        response = self.get_gemini_response(self.create_search_keywords_prompt(user_query), stage="keywords")
+        return self._clean_keywords(response, keywords, user_query)
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """在執行緒池中執行同步函式，不阻塞事件迴圈"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._blocking_executor, functools.partial(func, *args, **kwargs))
+
+    async def agenerate_search_keywords(self, user_query):
+        """
+        generate_search_keywords的非同步版本
+        
+        Args:
+            user_query: 用戶的原始查詢
+            
+        Returns:
+            以空格分隔的搜尋關鍵字
+        """
+        keywords, confident = self._rule_keywords(user_query)
+        if confident:
+            return keywords
+        response = await self.aget_gemini_response(self.create_search_keywords_prompt(user_query), stage="keywords")
+        return self._clean_keywords(response, keywords, user_query)
 
+    @staticmethod
+    def _clean_keywords(response, fallback_keywords, user_query):
+        """
+        整理Gemini產生的關鍵字，模型寫出思考過程時只取最終關鍵字
+        
+        Args:
+            response: Gemini的回應，錯誤時為None
+            fallback_keywords: 規則式關鍵字
+            user_query: 用戶的原始查詢
+            
+        Returns:
+            以空格分隔的搜尋關鍵字，Gemini沒有回應時改用規則式關鍵字或原始查詢
+        """
+        if not response or not response.strip():
+            return fallback_keywords or user_query
+        if "最終關鍵字" in response:
+            response = response.rsplit("最終關鍵字", 1)[1].lstrip(":： ")
+        return response.strip().splitlines()[0].strip()
+
+    async def aget_gemini_response(self, llm_input, stage="comparison"):
+        """
+        get_gemini_response的非同步版本，使用Gemini的非同步API
+        
         Args:
             llm_input: 用戶輸入（包含問題和檢索的資料）。
+            stage: 呼叫的階段，決定使用的模型與生成參數
             
         Returns:
             Gemini 生成的回應。
         """
-        model = genai.GenerativeModel(model_name=self.model_name)
+        model = self._get_model(self.stage_models[stage])
+        start = time.perf_counter()
         try:
-            # 設置生成參數，提高輸出品質
-            generation_config = {
-                "temperature": 0.2,  # softmax中logit/t
-                "top_p": 0.95,       # token機率總和
-                "top_k": 40,         # 前k個token
-                "max_output_tokens": 4096  # 輸出最多幾個token
-            }
+            response = await model.generate_content_async(
+                llm_input,
+                generation_config=self.stage_configs[stage]
+            )
+            self._record_llm_call(stage, start, response)
+            return response.text
+        except Exception as e:
+            self._record_llm_call(stage, start, None)
+            logger.error(f"Gemini回應生成錯誤: {e}")
+            return None
+
+    async def asearch_products(self, query, num_results=10):
+        """
+        search_products的非同步版本，在執行緒池中執行
+        
+        Args:
+            query: 搜尋關鍵字
+            num_results: 返回的搜尋結果數量
+            
+        Returns:
+            搜尋結果的列表
+        """
+        return await self._run_blocking(self.search_products, query, num_results=num_results)
+
+    async def agoogle_search(self, query, num_results=10):
+        """
+        google_search的非同步版本，Custom Search客戶端只有同步API，在執行緒池中執行
+        
+        Args:
+            query: 用戶的搜尋查詢。
+            num_results: 返回的搜尋結果數量。
+            
+        Returns:
+            搜尋結果的列表。
+        """
+        return await self._run_blocking(self.google_search, query, num_results=num_results)
+
+    async def apchome_search(self, search_results, user_query=None):
+        """
+        pchome_search的非同步版本，在執行緒池中交給併發抓取器處理
+        
+        Args:
+            search_results: Google搜尋結果列表
+            user_query: 用戶的查詢字串，提供時依預算與規格篩選商品
+            
+        Returns:
+            整合後的商品資訊字串
+        """
+        return await self._run_blocking(self.pchome_search, search_results, user_query)
+
+    def get_gemini_response(self, llm_input, stage="comparison"):
+        """
+        調整生成回應參數，並使用 Google Gemini API 生成回應。
+
+        Args:
+            llm_input: 用戶輸入（包含問題和檢索的資料）。
+            stage: 呼叫的階段，決定使用的模型與生成參數
             
+        Returns:
+            Gemini 生成的回應。
+        """
+        model = self._get_model(self.stage_models[stage])
+        start = time.perf_counter()
+        try:
             response = model.generate_content(
                 llm_input,
-                generation_config=generation_config  # 如有需求再做設定
+                generation_config=self.stage_configs[stage]
             )
+            self._record_llm_call(stage, start, response)
             return response.text  # 只取回應，其它暫且沒用到
         except Exception as e:
+            self._record_llm_call(stage, start, None)
             logger.error(f"Gemini回應生成錯誤: {e}")
             return None
 
+    def stream_gemini_response(self, llm_input, stage="comparison"):
+        """
+        以串流方式使用 Google Gemini API 生成回應。
+
+        Args:
+            llm_input: 用戶輸入（包含問題和檢索的資料）。
+            stage: 呼叫的階段，決定使用的模型與生成參數
+            
+        Yields:
+            Gemini 生成的文字片段。
+        """
+        model = self._get_model(self.stage_models[stage])
+        start = time.perf_counter()
+        chunk = None
+        try:
+            response = model.generate_content(
+                llm_input,
+                generation_config=self.stage_configs[stage],
+                stream=True
+            )
+            for chunk in response:
+                # 被安全機制擋下等情況時chunk沒有文字
+                if chunk.parts:
+                    yield chunk.text
+        except Exception:
+            self._record_llm_call(stage, start, None)
+            raise
+        # 用量資料在最後一個chunk
+        self._record_llm_call(stage, start, chunk)
+
+    def _record_llm_call(self, stage, start, response):
+        """
+        記錄一次Gemini呼叫的耗時與token用量
+        
+        Args:
+            stage: 呼叫的階段
+            start: 開始時間(time.perf_counter)
+            response: Gemini的回應，失敗時為None
+        """
+        elapsed = time.perf_counter() - start
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        with self._llm_lock:
+            stats = self._llm_stats[stage]
+            stats["calls"] += 1
+            stats["errors"] += response is None
+            stats["seconds"] += elapsed
+            stats["prompt_tokens"] += prompt_tokens
+            stats["output_tokens"] += output_tokens
+        GEMINI_SECONDS.observe(elapsed, stage=stage, model=self.stage_models[stage])
+        GEMINI_TOKENS.inc(prompt_tokens, stage=stage, kind="prompt")
+        GEMINI_TOKENS.inc(output_tokens, stage=stage, kind="output")
+        if response is None:
+            GEMINI_ERRORS.inc(stage=stage)
+        logger.info(f"Gemini[{stage}] 模型: {self.stage_models[stage]}，耗時: {elapsed:.2f}秒，"
+                    f"輸入: {prompt_tokens} tokens，輸出: {output_tokens} tokens")
+
+    def llm_stats(self):
+        """
+        取得各階段的Gemini呼叫統計
+        
+        Returns:
+            dict: 各階段的模型、呼叫/錯誤次數、平均耗時與token用量
+        """
+        with self._llm_lock:
+            snapshot = {stage: dict(stats) for stage, stats in self._llm_stats.items()}
+        result = {}
+        for stage, stats in snapshot.items():
+            calls = stats.pop("calls")
+            seconds = stats.pop("seconds")
+            result[stage] = {
+                "model": self.stage_models[stage],
+                "max_output_tokens": self.stage_configs[stage]["max_output_tokens"],
+                "calls": calls,
+                "avg_seconds": round(seconds / calls, 3) if calls else 0.0,
+                **stats,
+            }
+        with self._llm_lock:
+            result["parsing"] = dict(self._parse_stats)
+        return result
+
+    def search_products(self, query, num_results=10):
+        """
+        依retriever_mode搜尋商品，hybrid模式下關鍵字在local_query_ttl內用Google搜尋過時先查本地全文索引，
+        找到的新鮮商品不足時才使用Google搜尋
+        
+        Args:
+            query: 搜尋關鍵字
+            num_results: 返回的搜尋結果數量
+            
+        Returns:
+            與google_search相同格式的搜尋結果列表
+        """
+        if self.retriever_mode != "hybrid" or self.product_index is None:
+            return self.google_search(query, num_results=num_results)
+        
+        # 本地索引只有爬取過的商品，關鍵字太久沒用Google搜尋時就算本地命中也要重新搜尋
+        last_search = self.product_index.last_search(query)
+        if last_search is not None and time.time() - last_search < self.local_query_ttl:
+            results = self.product_index.search(
+                query,
+                limit=num_results,
+                max_age=self.local_max_age,
+                min_hits=min(self.local_min_hits, num_results)
+            )
+            if results is not None:
+                logger.info(f"使用本地商品索引，關鍵字: {query}，結果數量: {len(results)}")
+                return results
+        
+        results = self.google_search(query, num_results=num_results)
+        if results:
+            self.product_index.record_search(query)
+        return results
+
     def google_search(self, query, num_results=10):
         """
         使用 Google Custom Search API 進行搜尋。
@@ -235,8 +814,16 @@ class RAGService:
         Returns:
             搜尋結果的列表，每個結果包含 title、link 和 snippet。
         """
-        pchome_query = f"inurl:24h.pchome.com.tw/prod {query}"  # 用inurl限制搜尋結果
-        service = build("customsearch", "v1", developerKey=self.google_search_api_key)
+        pchome_query = f"{PCHOME_SEARCH_PREFIX} {query}"  # 用inurl限制搜尋結果
+        
+        # 相同關鍵字集合直接使用快取，節省CSE配額
+        cache_key = self.search_cache.make_key(PCHOME_SEARCH_PREFIX, query, num_results)
+        cached_results = self.search_cache.get(cache_key)
+        if cached_results is not None:
+            logger.info(f"使用快取的搜尋結果，關鍵字: {query}")
+            return cached_results
+        
+        service = self._get_search_service()
         try:
             # 優化檢索參數
             search_params = {
@@ -249,7 +836,7 @@ class RAGService:
             }
             
             logger.info(f"執行Google搜尋，關鍵字: {query}")
-            response = service.cse().list(**search_params).execute()
+            response = service.cse().list(**search_params).execute(http=self._get_thread_http())
             
             results = response.get("items", [])  # 需要的內容都在items(key)，value為array裡面是dict
             logger.info(f"搜尋返回結果數量: {len(results)}")
@@ -262,6 +849,9 @@ class RAGService:
                     "摘要": item.get("snippet", ""),
                     "來源": item.get("displayLink", "")
                 })
+            
+            if formatted_results:
+                self.search_cache.set(cache_key, formatted_results)
             return formatted_results
         
         except Exception as e:
@@ -279,45 +869,12 @@ class RAGService:
         Returns:
             最終的產品比較提示詞
         """
-        print(retrival_info)
-        spec = {
-            "comparison_results": {
-                "best_choice": "最佳商品名稱",
-                "best_value": "最高性價比商品",
-                "best_quality": "最佳品質商品",
-                "most_features": "功能最齊全商品"
-            },
-            "product_comparisons": [
-                {
-                    "product_name": "商品名稱",
-                    "brand": "品牌名稱",
-                    "price": "價格",
-                    "pros": ["優點 1", "優點 2", "..."],
-                    "cons": ["缺點 1", "缺點 2", "..."],
-                    "key_features": ["特色 1", "特色 2", "..."],
-                    "suitable_scenarios": ["適用場景 1", "適用場景 2", "..."],
-                    "rating": 8.5,
-                    "link": "直接從產品資訊中複製完整的購買連結，不要修改或創造連結"
-                },
-                {
-                    "product_name": "商品名稱",
-                    "brand": "品牌名稱",
-                    "price": "價格",
-                    "pros": ["優點 1", "優點 2", "..."],
-                    "cons": ["缺點 1", "缺點 2", "..."],
-                    "key_features": ["特色 1", "特色 2", "..."],
-                    "suitable_scenarios": ["適用場景 1", "適用場景 2", "..."],
-                    "rating": 7.8,
-                    "link": "直接從產品資訊中複製完整的購買連結，不要修改或創造連結"
-                }
-            ],
-            "analysis": "整體比較分析和建議"
-        }
+        logger.debug(f"檢索內容: {retrival_info}")
         
         # 創建比較產品的提示詞
         prompt = f"""
         你是專業的產品顧問，專門幫助用戶做出最佳購買決策。請用繁體中文回答並根據用戶需求和提供的產品資訊，進行全面的分析並以JSON格式回答結構如以下所示，商品的部分不只兩個，只是舉例而已，如果有超過4種產品，請至少比較4種最相關的，並把參考的產品資料中的連結填入JSON結構，特別注意商品購買連結，key使用對應的英文，內容使用繁體中文，不用附加額外訊息，也不要使用markdown格式:
-        {spec}
+        {COMPARISON_SPEC}
 
         # 用戶需求
         {user_query}
@@ -353,21 +910,77 @@ class RAGService:
         """
         return prompt
 
-    def pchome_search(self, search_results):
+    def pchome_search(self, search_results, user_query=None):
         """
         在pchome商品搜尋google search回傳的連結，並把商品資訊整合在一起
         
         Args:
             search_results: Google搜尋結果列表
+            user_query: 用戶的查詢字串，提供時依預算與規格篩選商品
             
         Returns:
-            整合後的商品資訊字串
+            整合後的商品資訊字串，長度受context_max_tokens限制
+        """
+        return self.build_retrieval_context(self.fetch_products(search_results), user_query)
+
+    def fetch_products(self, search_results):
+        """
+        併發抓取搜尋結果中的所有商品
+        
+        Args:
+            search_results: Google搜尋結果列表
+            
+        Returns:
+            依搜尋排名排序的ProductRecord列表，抓取失敗的商品帶有錯誤訊息
+        """
+        urls = [search_result.get('連結') for search_result in search_results]
+        
+        # 併發抓取，結果維持搜尋排名順序
+        return self.fetcher.map(
+            self.get_pchome_product_record,
+            urls,
+            on_error=self._product_fetch_error,
+            timeout=self.fetch_timeout
+        )
+
+    def iter_pchome_search(self, search_results):
         """
-        s = ""
-        for search_result in search_results:
-            s += f"{self.get_pchome_product_info(search_result.get('連結'))}\n"
+        與fetch_products相同，但每抓完一個商品就回報一次進度
+        
+        Args:
+            search_results: Google搜尋結果列表
             
-        return s
+        Yields:
+            tuple: (搜尋結果索引, ProductRecord)，依完成順序產生
+        """
+        urls = [search_result.get('連結') for search_result in search_results]
+        yield from self.fetcher.iter_completed(
+            self.get_pchome_product_record,
+            urls,
+            on_error=self._product_fetch_error,
+            timeout=self.fetch_timeout
+        )
+
+    def build_retrieval_context(self, products, user_query=None):
+        """
+        在token預算內把商品資訊整合成一個字串
+        
+        Args:
+            products: 依搜尋排名排序的ProductRecord列表
+            user_query: 用戶的查詢字串，提供時先依預算與規格篩選商品
+            
+        Returns:
+            整合後的商品資訊字串
+        """
+        if user_query is not None:
+            products = self.product_filter.select(user_query, products)
+        context, _ = self.context_builder.build(products)
+        return context
+
+    @staticmethod
+    def _product_fetch_error(url, e):
+        """抓取超時等未預期錯誤的商品以錯誤資料取代"""
+        return ProductRecord.from_error(url, f"爬取商品資訊時發生錯誤: {str(e)}", extract_product_id(url))
 
     def get_pchome_product_info(self, url):
         """
@@ -379,97 +992,154 @@ class RAGService:
         Returns:
             格式化的產品資訊字串
         """
+        return self.get_pchome_product_record(url).render()
+
+    def get_pchome_product_record(self, url):
+        """
+        從 PChome 商品網址提取產品資料
+        
+        Args:
+            url: PChome 商品頁面的 URL
+            
+        Returns:
+            ProductRecord，發生錯誤時帶有錯誤訊息
+        """
+        product_id = extract_product_id(url)
+        if self.refresher is not None:
+            self.refresher.record_access(product_id, url)
         try:
-            # 取得網頁內容
-            response = requests.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 清理資料
-            # 商品名稱
-            product_name_elem = soup.find('h1', {'class': 'o-prodMainName__grayDarkest--l700'})
-            product_name = product_name_elem.text.strip() if product_name_elem else "無商品名稱"
-           
-            # 價格
-            price_element = soup.find('div', {'class': 'o-prodPrice__price'})
-            price = price_element.text.strip() if price_element else "無價格資訊"
-           
-            original_price_element = soup.find('div', {'class': 'o-prodPrice__originalPrice'})
-            original_price = original_price_element.text.strip() if original_price_element else "無原始價格資訊"
-           
-            # 品牌
-            brand_element = soup.find('span', {'class': 'o-prodMainName__colorSecondary'})
-            brand = brand_element.text.strip() if brand_element else "查無品牌"
-           
-            # 特色
-            features_list = soup.find('ul', {'class': 'c-blockCombine__list--prodSlogan'})
-            features = [li.text.strip() for li in features_list.find_all('li')] if features_list else []
-           
-            # 規格
-            specs_text = ""
-            spec_divs = soup.find_all('div', {'class': 'c-blockCombine__item--prodSpecification'})
-            for spec in spec_divs:
-                specs_text += spec.get_text(strip=True, separator='\n') + "\n"
-           
-            # 規格表格
-            spec_tables = soup.find_all('table', {'class': 'c-tableGrid--prodSpec'})
-            specs = {}
-           
-            for table in spec_tables:
-                rows = table.find_all('tr')
-               
-                for row in rows:
-                    header = row.find('th')
-                    data = row.find('div', {'class': 'c-tableGrid__htmlText'})
-                   
-                    if header and data:
-                        key = header.get_text(strip=True)
-                        value = data.get_text(strip=True)
-                       
-                        # 處理重複的key
-                        if key in specs:
-                            # 如果key已存在，轉換為list或加到list
-                            if isinstance(specs[key], list):
-                                specs[key].append(value)
-                            else:
-                                specs[key] = [specs[key], value]
-                        else:
-                            specs[key] = value
-           
-            # 組合所有資訊
-            info_parts = [
-                f"商品名稱: {product_name}",
-                f"品牌: {brand}",
-                f"售價: {price}",
-                f"購買連結: {url}"
-            ]
-           
-            if original_price:
-                info_parts.append(f"原價: {original_price}")
-           
-            if features:
-                info_parts.append("商品特點:")
-                for feature in features:
-                    info_parts.append(f"- {feature}")
-           
-            if specs:
-                info_parts.append("商品規格:")
-                for key, value in specs.items():
-                    if isinstance(value, list):
-                        info_parts.append(f"{key}: {', '.join(value)}")
-                    else:
-                        info_parts.append(f"{key}: {value}")
-           
-            if specs_text:
-                info_parts.append("其它規格說明:")
-                info_parts.append(specs_text)
-           
-            # 合併所有部分為一個字串
-            result = "\n".join(info_parts)
-            return result + "\n"
-       
+            fields = self.get_pchome_product_fields(url)
+            return ProductRecord.from_fields(url, fields, product_id)
         except Exception as e:
-            return f"爬取商品資訊時發生錯誤: {str(e)}"
+            return ProductRecord.from_error(url, f"爬取商品資訊時發生錯誤: {str(e)}", product_id)
+
+    def get_pchome_product_fields(self, url):
+        """
+        取得 PChome 商品欄位，優先使用快取，過期時以條件式請求重新驗證
+        
+        Args:
+            url: PChome 商品頁面的 URL
+            
+        Returns:
+            商品欄位dict
+            
+        Raises:
+            RuntimeError: 回應不是200/304或無法解析商品頁面，且沒有快取資料可用
+        """
+        product_id = extract_product_id(url)
+        if product_id is None:
+            # 非商品頁面無法快取，直接抓取
+            response = self.http_client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP狀態碼 {response.status_code}")
+            return parse_product_page(response.text)
+        
+        entry = self.product_cache.get(product_id)
+        state = self.product_cache.freshness(entry)
+        if state == FRESH:
+            return entry["fields"]
+        
+        # 取得網頁內容，有快取時帶上ETag/Last-Modified
+        response = self.http_client.get(url, headers=self.product_cache.conditional_headers(entry))
+        if response.status_code == 304 and entry is not None:
+            self.product_cache.revalidated(product_id, entry)
+            if self.product_index is not None:
+                self.product_index.touch(product_id)
+            return entry["fields"]
+        if response.status_code != 200:
+            # 重試後仍是5xx或商品已下架(404)，有快取時沿用且不更新快取時間，沒有時交給呼叫者記錄錯誤
+            logger.warning(f"商品頁面回應HTTP {response.status_code}: {url}")
+            if entry is not None:
+                return entry["fields"]
+            raise RuntimeError(f"HTTP狀態碼 {response.status_code}")
+        
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        
+        # 規格還在TTL內只需解析價格
+        if state == PRICE_STALE:
+            price_fields = parse_product_page(response.text, price_only=True)
+            if not is_parsed_product(price_fields, price_only=True):
+                # 沿用快取的資料且不更新快取時間，下次請求再重新抓取
+                logger.warning(f"無法解析商品頁面的價格，沿用快取資料: {url}")
+                return entry["fields"]
+            fields = self.product_cache.update_price(product_id, entry, price_fields, etag, last_modified)
+            if self.product_index is not None:
+                self.product_index.touch(product_id)
+            return fields
+        
+        fields = parse_product_page(response.text)
+        # 頁面改版或被擋時解析不到商品名稱，不要把預設值寫入快取與索引
+        if not is_parsed_product(fields):
+            logger.warning(f"無法解析商品頁面，不寫入快取: {url}")
+            if entry is not None:
+                return entry["fields"]
+            raise RuntimeError("無法解析商品頁面")
+        self.product_cache.put(product_id, url, fields, etag, last_modified)
+        if self.product_index is not None:
+            self.product_index.add(product_id, url, fields)
+        return fields
+        
+    def refresh_product(self, product_id, url):
+        """
+        背景更新用，不論快取是否過期都以條件式請求重新抓取商品，只更新有變更的欄位
+        
+        Args:
+            product_id: 商品ID
+            url: PChome 商品頁面的 URL
+            
+        Returns:
+            list: 有變更的欄位名稱，內容未變更時為空列表
+            
+        Raises:
+            RuntimeError: 回應不是200/304或無法解析商品頁面
+        """
+        entry = self.product_cache.get(product_id)
+        response = self.http_client.get(url, headers=self.product_cache.conditional_headers(entry))
+        if response.status_code == 304 and entry is not None:
+            self.product_cache.revalidated(product_id, entry)
+            if self.product_index is not None:
+                self.product_index.touch(product_id)
+            return []
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP狀態碼 {response.status_code}")
+        
+        fields = parse_product_page(response.text)
+        # 頁面改版或被擋時解析不到商品名稱，不要用預設值覆蓋原本的資料
+        if not is_parsed_product(fields):
+            raise RuntimeError("無法解析商品頁面")
+        
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if entry is None:
+            self.product_cache.put(product_id, url, fields, etag, last_modified)
+            changed = list(fields)
+        else:
+            changed = self.product_cache.merge(product_id, entry, fields, etag, last_modified)
+        
+        if self.product_index is not None:
+            # 只有價格變更時索引內容不變
+            if set(changed) - set(PRICE_FIELDS):
+                self.product_index.add(product_id, url, fields)
+            else:
+                self.product_index.touch(product_id)
+        return changed
+
+    def product_age(self, product_id):
+        """
+        取得商品快取價格資料的年齡
         
+        Args:
+            product_id: 商品ID
+            
+        Returns:
+            秒數，沒有快取時回傳None
+        """
+        entry = self.product_cache.get(product_id)
+        if entry is None:
+            return None
+        return time.time() - entry["price_fetched_at"]
+
     def extract_json_from_response(self, response):
         """從回應中提取JSON格式的內容
         
@@ -479,66 +1149,381 @@ class RAGService:
         Returns:
             JSON字串，如果找不到則返回None
         """
-        if "```json" in response:
-            parts = response.split("```json")
-            if len(parts) > 1:
-                json_part = parts[1].split("```")[0].strip()
-                return json_part
-        return None
+        return extract_json_text(response)
 
-    def process_product_comparison(self, user_query):
+    def create_repair_prompt(self, final_response):
         """
-        處理用戶產品比較請求的完整流程，提供結構化JSON回應
+        修正比較結果格式的提示詞
+        
+        Args:
+            final_response: 無法解析的產品比較回應
+            
+        Returns:
+            修正用的提示詞
+        """
+        return f"""
+        以下是產品比較的回應，但JSON格式有錯誤或內容被截斷。請只輸出修正後、符合以下結構的JSON，
+        不要新增、刪除或改寫任何商品資訊與連結，被截斷的部分直接省略:
+        {COMPARISON_SPEC}
+
+        # 回應
+        {final_response}
+        """
+
+    def _parse_comparison_json(self, text):
+        """寬鬆解析比較結果，沒有product_comparisons列表時視為失敗並回傳None"""
+        data = loads_tolerant(text)
+        if not isinstance(data, dict) or not isinstance(data.get("product_comparisons"), list):
+            return None
+        problems = schema_problems(data, COMPARISON_SCHEMA)
+        if problems:
+            logger.warning(f"比較結果不完全符合格式: {problems[:5]}")
+        return data
+
+    def _count_parse(self, key):
+        with self._llm_lock:
+            self._parse_stats[key] += 1
+
+    def _unparsed_result(self, final_response):
+        """修正後仍無法解析時的回傳值"""
+        self._count_parse("failed")
+        if self.extract_json_from_response(final_response) is None:
+            # 如果找不到JSON，返回原始回應和一個包含原始回應的字典
+            return final_response, {"response": final_response}
+        logger.error("JSON解析錯誤，修正後仍無法解析")
+        return final_response, {"error": "無法解析LLM回應的JSON格式", "response": final_response}
+
+    def _parse_without_repair(self, final_response):
+        """
+        解析比較結果，需要修正時不呼叫Gemini而是回傳修正用的提示詞
+        
+        Returns:
+            tuple: (結果, 修正提示詞)
+                - 不需要修正時修正提示詞為None
+                - 需要修正時結果為None，修正後的回應交給_repaired_result
+        """
+        if not final_response:
+            return ("Gemini沒有回應", {"error": "Gemini沒有回應"}), None
+        data = self._parse_comparison_json(final_response)
+        if data is not None:
+            self._count_parse("parsed")
+            return (final_response, data), None
+        if not self.json_repair:
+            return self._unparsed_result(final_response), None
+        logger.info("比較結果無法解析，嘗試修正格式")
+        return None, self.create_repair_prompt(final_response)
+
+    def _repaired_result(self, final_response, repaired):
+        """解析修正後的回應，仍無法解析時回傳原始回應"""
+        data = self._parse_comparison_json(repaired)
+        if data is not None:
+            self._count_parse("repaired")
+            return repaired, data
+        return self._unparsed_result(final_response)
+
+    def parse_comparison_response(self, final_response):
+        """
+        從產品比較回應中提取並解析JSON，無法解析時用便宜的模型修正一次
+        
+        Args:
+            final_response: Gemini生成的產品比較回應
+            
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)，經過修正時原始回應為修正後的文字
+        """
+        result, repair_prompt = self._parse_without_repair(final_response)
+        if repair_prompt is None:
+            return result
+        return self._repaired_result(final_response, self.get_gemini_response(repair_prompt, stage="repair"))
+
+    async def aparse_comparison_response(self, final_response):
+        """
+        parse_comparison_response的非同步版本，修正時不阻塞事件迴圈
+        
+        Args:
+            final_response: Gemini生成的產品比較回應
+            
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)
+        """
+        result, repair_prompt = self._parse_without_repair(final_response)
+        if repair_prompt is None:
+            return result
+        return self._repaired_result(final_response, await self.aget_gemini_response(repair_prompt, stage="repair"))
+
+    def _semantic_lookup(self, user_query):
+        """
+        在近似查詢快取中找相似的舊查詢
+        
+        Returns:
+            tuple: (快取種類"result"、"stages"或None, 快取內容)
+        """
+        if self.semantic_cache is None:
+            return None, None
+        kind, cached, similarity = self.semantic_cache.lookup(user_query)
+        if kind == "result":
+            logger.info(f"使用近似查詢的比較結果(相似度 {similarity:.3f})")
+        elif kind == "stages":
+            logger.info(f"使用近似查詢的關鍵字與搜尋結果(相似度 {similarity:.3f}): {cached[0]}")
+        return kind, cached
+
+    def _remember_search_stages(self, user_query, search_keywords, search_results):
+        """把關鍵字與搜尋結果寫入近似查詢快取"""
+        if self.semantic_cache is not None:
+            self.semantic_cache.put_stages(user_query, search_keywords, search_results)
+
+    def _remember_result(self, user_query, result):
+        """把比較結果寫入近似查詢快取"""
+        if self.semantic_cache is not None:
+            self.semantic_cache.put_result(user_query, result)
+
+    def _comparison_steps(self, user_query):
+        """
+        產品比較流程的各個步驟，同步、非同步與串流版本共用
+        需要外部API的步驟產生_StageCall，由執行者(_run_steps或_arun_steps)呼叫對應的方法後把結果送回，
+        其它產生(事件名稱, 資料)供串流回報進度
         
         Args:
             user_query: 用戶的查詢字串
             
         Returns:
             tuple: (原始回應文字, 解析後的JSON字典)
-                - 第一個是原始回應文字，用於儲存到資料庫
-                - 第二個是解析後的JSON字典，傳給前端
         """
-        try:
+        # 近似的查詢可以重用比較結果，或至少重用關鍵字與搜尋結果
+        kind, cached = self._semantic_lookup(user_query)
+        if kind == "result":
+            return cached
+        if kind == "stages":
+            search_keywords, search_results = cached
+            yield "keywords", {"keywords": search_keywords}
+        else:
             # 步驟1: 生成搜尋關鍵詞
             logger.info("步驟1: 生成搜尋關鍵詞")
-            keywords_prompt = self.create_search_keywords_prompt(user_query)
-            search_keywords = self.get_gemini_response(keywords_prompt)
+            with track_stage("keywords"):
+                search_keywords = yield _StageCall("keywords", (user_query,))
             logger.info(f"生成的搜尋關鍵詞: {search_keywords}")
+            yield "keywords", {"keywords": search_keywords}
             
             # 步驟2: 執行Google搜尋
             logger.info("步驟2: 執行Google搜尋")
-            search_results = self.google_search(search_keywords, num_results=10)
-            
-            # 步驟3: 整理PChome產品資訊
-            logger.info("步驟3: 整理PChome產品資訊")
-            retrival_info = self.pchome_search(search_results)
+            with track_stage("search") as stage:
+                search_results = yield _StageCall("search", (search_keywords,))
+                if not search_results:
+                    # google_search出錯時回傳空列表，沒有商品可比較也視為這個階段失敗
+                    stage.fail()
+                search_results = self.search_reranker.rerank(user_query, search_results, search_keywords)
+        self._remember_search_stages(user_query, search_keywords, search_results)
+        yield "search_results", {
+            "count": len(search_results),
+            "results": [{"title": r.get("標題", ""), "link": r.get("連結", "")} for r in search_results]
+        }
+        
+        # 步驟3: 整理PChome產品資訊
+        logger.info("步驟3: 整理PChome產品資訊")
+        with track_stage("fetch"):
+            retrival_info = yield _StageCall("fetch", (search_results, user_query))
+        
+        # 步驟4: 生成產品比較和分析
+        logger.info("步驟4: 生成產品比較和分析")
+        final_prompt = self.create_comparison_prompt(user_query, retrival_info)
+        with track_stage("compare") as stage:
+            final_response = yield _StageCall("compare", (final_prompt,))
+            if not final_response:
+                # get_gemini_response出錯時回傳None
+                stage.fail()
+        
+        # 步驟5: 處理回應，提取JSON，無法解析時修正一次
+        with track_stage("parse") as stage:
+            result, repair_prompt = self._parse_without_repair(final_response)
+            if repair_prompt is not None:
+                result = self._repaired_result(final_response, (yield _StageCall("repair", (repair_prompt,))))
+            if final_response and "error" in result[1]:
+                stage.fail()
+        self._remember_result(user_query, result)
+        return result
+
+    def _sync_calls(self):
+        """_comparison_steps各個_StageCall對應的同步方法"""
+        return {
+            "keywords": self.generate_search_keywords,
+            "search": functools.partial(self.search_products, num_results=10),
+            "fetch": self.pchome_search,
+            "compare": self.get_gemini_response,
+            "repair": functools.partial(self.get_gemini_response, stage="repair"),
+        }
+
+    def _async_calls(self):
+        """_comparison_steps各個_StageCall對應的非同步方法"""
+        return {
+            "keywords": self.agenerate_search_keywords,
+            "search": functools.partial(self.asearch_products, num_results=10),
+            "fetch": self.apchome_search,
+            "compare": self.aget_gemini_response,
+            "repair": functools.partial(self.aget_gemini_response, stage="repair"),
+        }
+
+    def _stream_calls(self):
+        """與_sync_calls相同，但抓取商品與產生比較時逐步產生進度事件"""
+        return dict(self._sync_calls(), fetch=self._stream_fetch, compare=self._stream_compare)
+
+    def _stream_fetch(self, search_results, user_query):
+        """pchome_search的串流版本，每抓完一個商品產生一次product事件"""
+        products = [None] * len(search_results)
+        for completed, (index, product) in enumerate(self.iter_pchome_search(search_results), start=1):
+            products[index] = product
+            yield "product", {"index": index, "completed": completed, "total": len(search_results)}
+        return self.build_retrieval_context(products, user_query)
+
+    def _stream_compare(self, final_prompt):
+        """get_gemini_response的串流版本，每收到一段文字產生一次token事件"""
+        chunks = []
+        for text in self.stream_gemini_response(final_prompt):
+            chunks.append(text)
+            yield "token", {"text": text}
+        return "".join(chunks)
+
+    @staticmethod
+    def _error_result(e):
+        logger.error(f"處理產品比較時發生錯誤: {str(e)}")
+        return str(e), {"error": f"處理產品比較時發生錯誤: {str(e)}"}
+
+    def _run_steps(self, steps, calls):
+        """
+        以同步方法執行流程步驟，呼叫回傳產生器時一併轉發其事件
+        
+        Args:
+            steps: _comparison_steps產生器
+            calls: _StageCall名稱對應的同步方法
             
-            # 步驟4: 生成產品比較和分析
-            logger.info("步驟4: 生成產品比較和分析")
-            final_prompt = self.create_comparison_prompt(user_query, retrival_info)
-            final_response = self.get_gemini_response(final_prompt)
+        Yields:
+            tuple: (事件名稱, 資料)
             
-            # 步驟5: 處理回應，提取JSON
-            json_str = self.extract_json_from_response(final_response)
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)，發生錯誤時為錯誤結果
+        """
+        try:
+            request = next(steps)
+            while True:
+                if not isinstance(request, _StageCall):
+                    yield request
+                    request = next(steps)
+                    continue
+                try:
+                    value = calls[request.name](*request.args)
+                    if inspect.isgenerator(value):
+                        value = yield from value
+                except Exception as e:
+                    # 例外交回流程，讓track_stage記錄是哪個階段出錯
+                    request = steps.throw(e)
+                    continue
+                request = steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        except Exception as e:
+            return self._error_result(e)
+        finally:
+            steps.close()
+
+    async def _arun_steps(self, steps, calls):
+        """
+        以非同步方法執行流程步驟，不需要回報進度，事件直接略過
+        
+        Args:
+            steps: _comparison_steps產生器
+            calls: _StageCall名稱對應的協程函式
             
-            # 解析JSON字串為Python字典
-            if json_str:
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)，發生錯誤時為錯誤結果
+        """
+        try:
+            request = next(steps)
+            while True:
+                if not isinstance(request, _StageCall):
+                    request = next(steps)
+                    continue
                 try:
-                    json_data = json.loads(json_str)
-                    # 返回原始回應和解析後的JSON
-                    return final_response, json_data
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON解析錯誤: {e}")
-                    # 如果JSON無法解析，返回原始回應和一個包含錯誤信息的字典
-                    return final_response, {"error": "無法解析LLM回應的JSON格式", "response": final_response}
-            else:
-                # 如果找不到JSON，返回原始回應和一個包含原始回應的字典
-                return final_response, {"response": final_response}
-                
+                    value = await calls[request.name](*request.args)
+                except Exception as e:
+                    request = steps.throw(e)
+                    continue
+                request = steps.send(value)
+        except StopIteration as stop:
+            return stop.value
         except Exception as e:
-            logger.error(f"處理產品比較時發生錯誤: {str(e)}")
-            # 返回錯誤信息
-            return str(e), {"error": f"處理產品比較時發生錯誤: {str(e)}"}
+            return self._error_result(e)
+        finally:
+            steps.close()
 
+    def process_product_comparison(self, user_query):
+        """
+        處理用戶產品比較請求的完整流程，提供結構化JSON回應
+        相同查詢優先使用快取結果，併發的相同查詢只執行一次流程
+        
+        Args:
+            user_query: 用戶的查詢字串
+            
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)
+                - 第一個是原始回應文字，用於儲存到資料庫
+                - 第二個是解析後的JSON字典，傳給前端
+        """
+        if self.result_cache is None:
+            return self._process_product_comparison(user_query)
+        return self.result_cache.get_or_compute(user_query, lambda: self._process_product_comparison(user_query))
+
+    def _process_product_comparison(self, user_query):
+        """process_product_comparison不經過快取的完整流程"""
+        with RAG_IN_FLIGHT.track_inprogress():
+            events = self._run_steps(self._comparison_steps(user_query), self._sync_calls())
+            while True:
+                try:
+                    next(events)
+                except StopIteration as stop:
+                    return stop.value
+
+    async def aprocess_product_comparison(self, user_query):
+        """
+        process_product_comparison的非同步版本，等待外部API時不阻塞事件迴圈
+        
+        Args:
+            user_query: 用戶的查詢字串
+            
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)
+        """
+        if self.result_cache is None:
+            return await self._aprocess_product_comparison(user_query)
+        return await self.result_cache.aget_or_compute(user_query, lambda: self._aprocess_product_comparison(user_query))
 
+    async def _aprocess_product_comparison(self, user_query):
+        """aprocess_product_comparison不經過快取的完整流程"""
+        with RAG_IN_FLIGHT.track_inprogress():
+            return await self._arun_steps(self._comparison_steps(user_query), self._async_calls())
+
+    def stream_product_comparison(self, user_query):
+        """
+        以串流方式處理用戶產品比較請求，每個步驟完成時立即回報
+        相同查詢優先使用快取結果，正在執行相同查詢時等待其結果
+        
+        Args:
+            user_query: 用戶的查詢字串
+            
+        Yields:
+            tuple: (事件名稱, 資料)
+                - ("keywords", {"keywords": 關鍵字})
+                - ("search_results", {"count": 數量, "results": [{"title", "link"}]})
+                - ("product", {"index": 排名, "completed": 已完成數, "total": 總數})
+                - ("token", {"text": 比較結果的文字片段})
+                - ("result", (原始回應文字, 解析後的JSON字典))，一定是最後一個事件
+            快取命中或等待其它請求的結果時只產生result事件
+        """
+        if self.result_cache is None:
+            result = yield from self._stream_product_comparison(user_query)
+        else:
+            result = yield from self.result_cache.iter_or_compute(user_query, lambda: self._stream_product_comparison(user_query))
+        yield "result", result
 
+    def _stream_product_comparison(self, user_query):
+        """stream_product_comparison不經過快取的完整流程，產生進度事件並回傳結果"""
+        with RAG_IN_FLIGHT.track_inprogress():
+            return (yield from self._run_steps(self._comparison_steps(user_query), self._stream_calls()))
@@ -0,0 +1,195 @@
+import threading
+import asyncio
+import logging
+import math
+import time
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+class ProductRefresher:
+    """
+    熱門商品背景更新器
+    記錄每個商品ID的存取頻率(隨時間衰減)，定期在背景以有上限的速率重新抓取最常被存取、
+    且快取即將過期的商品，讓用戶請求幾乎都能直接使用新鮮的快取資料
+    """
+
+    def __init__(self, refresh_func, age_func, executor=None, interval=60, max_per_cycle=20, rate=1.0,
+                 due_after=480, min_score=2.0, half_life=3600, max_tracked=5000, purge_func=None, purge_interval=3600):
+        """
+        初始化背景更新器
+
+        Args:
+            refresh_func: 重新抓取商品的同步函式，參數為(商品ID, URL)，回傳有變更的欄位名稱列表
+            age_func: 回傳商品快取資料年齡秒數的函式，參數為商品ID，沒有快取時回傳None
+            executor: 執行refresh_func的執行緒池，None則使用事件迴圈預設的執行緒池
+            interval: 每輪更新間隔秒數
+            max_per_cycle: 每輪最多更新的商品數量
+            rate: 每秒最多抓取的商品數量
+            due_after: 快取資料超過幾秒就需要更新，通常略小於價格TTL
+            min_score: 存取分數至少要多少才視為熱門商品
+            half_life: 存取分數的半衰期秒數
+            max_tracked: 最多記錄的商品數量
+            purge_func: 清除過期快取的同步函式，None則不清除
+            purge_interval: 清除過期快取的間隔秒數
+        """
+        self.refresh_func = refresh_func
+        self.age_func = age_func
+        self.executor = executor
+        self.interval = interval
+        self.max_per_cycle = max_per_cycle
+        self.rate = rate
+        self.due_after = due_after
+        self.min_score = min_score
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self.purge_func = purge_func
+        self.purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._access = {}
+        self._task = None
+        self._stats = {
+            "cycles": 0,
+            "refreshed": 0,
+            "changed": 0,
+            "unchanged": 0,
+            "failed": 0,
+            "last_cycle_at": None,
+            "last_cycle_seconds": 0.0,
+        }
+        self._field_changes = {}
+
+    def _decayed(self, score, last_access, now):
+        return score * math.pow(0.5, (now - last_access) / self.half_life)
+
+    def record_access(self, product_id, url):
+        """
+        記錄一次商品存取
+
+        Args:
+            product_id: 商品ID
+            url: 商品頁面URL
+        """
+        if product_id is None:
+            return
+        now = time.time()
+        with self._lock:
+            score, _, last_access = self._access.get(product_id, (0.0, url, now))
+            self._access[product_id] = (self._decayed(score, last_access, now) + 1, url, now)
+            if len(self._access) > self.max_tracked:
+                # 超過上限時只保留分數較高的八成
+                ranked = sorted(self._access.items(), key=lambda item: -self._decayed(item[1][0], item[1][2], now))
+                self._access = dict(ranked[:int(self.max_tracked * 0.8)])
+
+    def hot_products(self, limit=None):
+        """
+        取得熱門商品
+
+        Args:
+            limit: 最多回傳的商品數量，None則不限制
+
+        Returns:
+            list: (商品ID, URL, 目前的存取分數)，依分數由高到低排序
+        """
+        now = time.time()
+        with self._lock:
+            scored = [
+                (product_id, url, self._decayed(score, last_access, now))
+                for product_id, (score, url, last_access) in self._access.items()
+            ]
+        hot = sorted((item for item in scored if item[2] >= self.min_score), key=lambda item: -item[2])
+        return hot[:limit] if limit is not None else hot
+
+    def start(self):
+        """啟動背景更新，需在事件迴圈中呼叫"""
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"熱門商品背景更新啟動，間隔: {self.interval}秒，每輪上限: {self.max_per_cycle}，速率: {self.rate}/秒")
+
+    async def stop(self):
+        """停止背景更新"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_cycle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"熱門商品背景更新時發生錯誤: {e}")
+            if self.purge_func is not None and time.monotonic() - self._last_purge >= self.purge_interval:
+                self._last_purge = time.monotonic()
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, self.purge_func)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"清除過期快取時發生錯誤: {e}")
+
+    async def run_cycle(self):
+        """
+        執行一輪更新，依存取分數由高到低更新快取即將過期的熱門商品
+
+        Returns:
+            int: 這一輪更新的商品數量
+        """
+        start = time.monotonic()
+        due = []
+        for product_id, url, _ in self.hot_products():
+            age = self.age_func(product_id)
+            if age is None or age >= self.due_after:
+                due.append((product_id, url))
+            if len(due) >= self.max_per_cycle:
+                break
+
+        loop = asyncio.get_running_loop()
+        for index, (product_id, url) in enumerate(due):
+            if index:
+                # 限制抓取速率，避免對PChome造成負擔
+                await asyncio.sleep(1 / self.rate)
+            try:
+                changed = await loop.run_in_executor(self.executor, self.refresh_func, product_id, url)
+            except Exception as e:
+                logger.warning(f"背景更新商品 {product_id} 失敗: {e}")
+                with self._lock:
+                    self._stats["failed"] += 1
+                continue
+            with self._lock:
+                self._stats["refreshed"] += 1
+                self._stats["changed" if changed else "unchanged"] += 1
+                for field in changed:
+                    self._field_changes[field] = self._field_changes.get(field, 0) + 1
+
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["last_cycle_at"] = time.time()
+            self._stats["last_cycle_seconds"] = round(time.monotonic() - start, 3)
+        if due:
+            logger.info(f"背景更新 {len(due)} 個熱門商品，耗時 {time.monotonic() - start:.2f}秒")
+        return len(due)
+
+    def stats(self):
+        """
+        取得背景更新統計資料
+
+        Returns:
+            dict: 記錄與熱門商品數量、更新/變更/失敗次數、各欄位變更次數，以及熱門商品快取資料的平均與最大年齡
+        """
+        hot = self.hot_products()
+        ages = [age for age in (self.age_func(product_id) for product_id, _, _ in hot) if age is not None]
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked"] = len(self._access)
+            stats["field_changes"] = dict(self._field_changes)
+        stats["hot"] = len(hot)
+        stats["hot_cached"] = len(ages)
+        stats["avg_lag_seconds"] = round(sum(ages) / len(ages), 1) if ages else 0.0
+        stats["max_lag_seconds"] = round(max(ages), 1) if ages else 0.0
+        stats["stale_hot"] = sum(1 for age in ages if age >= self.due_after)
+        return stats
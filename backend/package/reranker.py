@@ -0,0 +1,144 @@
+from collections import Counter
+from package.pchome_parser import extract_product_id
+import unicodedata
+import logging
+import math
+import re
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# 英數詞整個當成一個詞，中日韓文字切成二字詞
+_ASCII_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+
+# 配件頁面常見的詞，查詢沒有提到時降低分數
+ACCESSORY_TERMS = [
+    "保護貼", "保護殼", "保護套", "玻璃貼", "包膜", "鍵盤膜", "螢幕貼", "充電線", "傳輸線", "轉接頭", "轉接器",
+    "充電器", "變壓器", "支架", "散熱墊", "收納包", "電腦包", "筆電包", "收納袋", "貼紙", "替換", "耗材", "濾網", "配件",
+]
+
+def tokenize(text):
+    """
+    把文字切成BM25用的詞
+
+    Args:
+        text: 要切詞的文字
+
+    Returns:
+        list: 英數詞與中日韓文字二字詞
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = _ASCII_WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class SearchReranker:
+    """
+    Google搜尋結果重新排序
+    以BM25比對搜尋結果的標題與摘要和用戶查詢，降低配件頁面的分數，
+    並依PChome商品ID去除重複商品，只保留前top_n個相關商品再抓取頁面
+    """
+
+    def __init__(self, top_n=8, k1=1.5, b=0.75, title_weight=2, accessory_penalty=0.3):
+        """
+        初始化搜尋結果重新排序器
+
+        Args:
+            top_n: 保留的搜尋結果數量，0則不限制數量
+            k1: BM25的詞頻飽和參數
+            b: BM25的文件長度正規化參數
+            title_weight: 標題的詞重複計入的次數
+            accessory_penalty: 配件頁面的分數倍率
+        """
+        self.top_n = top_n
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.accessory_penalty = accessory_penalty
+
+    def score(self, query_tokens, search_results):
+        """
+        計算每個搜尋結果的BM25分數
+
+        Args:
+            query_tokens: 查詢的詞列表
+            search_results: Google搜尋結果列表
+
+        Returns:
+            list: 與search_results順序相同的分數
+        """
+        documents = [
+            Counter(tokenize(result.get("標題", "")) * self.title_weight + tokenize(result.get("摘要", "")))
+            for result in search_results
+        ]
+        if not documents:
+            return []
+        lengths = [sum(document.values()) for document in documents]
+        average_length = sum(lengths) / len(lengths) or 1
+
+        scores = []
+        for document, length in zip(documents, lengths):
+            score = 0.0
+            for token in set(query_tokens):
+                frequency = document.get(token, 0)
+                if not frequency:
+                    continue
+                containing = sum(1 for other in documents if token in other)
+                idf = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+                score += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+            scores.append(score)
+        return scores
+
+    def rerank(self, user_query, search_results, keywords=""):
+        """
+        重新排序並去除重複的搜尋結果
+
+        Args:
+            user_query: 用戶的原始查詢
+            search_results: Google搜尋結果列表
+            keywords: 產生的搜尋關鍵字，一起用來比對
+
+        Returns:
+            依相關程度排序、沒有重複商品的搜尋結果列表
+        """
+        if not search_results:
+            return search_results
+
+        query_text = f"{user_query} {keywords}"
+        scores = self.score(tokenize(query_text), search_results)
+
+        normalized_query = unicodedata.normalize("NFKC", query_text).lower()
+        for index, result in enumerate(search_results):
+            title = unicodedata.normalize("NFKC", result.get("標題", "")).lower()
+            if any(term in title and term not in normalized_query for term in ACCESSORY_TERMS):
+                scores[index] *= self.accessory_penalty
+
+        # 分數相同時維持Google的排名
+        order = sorted(range(len(search_results)), key=lambda index: -scores[index])
+        # 有任何結果比對到時去掉完全不相關的結果
+        relevant = [index for index in order if scores[index] > 0]
+        if relevant:
+            order = relevant
+
+        reranked = []
+        seen = set()
+        duplicates = 0
+        for index in order:
+            link = search_results[index].get("連結", "")
+            key = extract_product_id(link) or link
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            reranked.append(search_results[index])
+            if self.top_n and len(reranked) >= self.top_n:
+                break
+
+        logger.info(f"搜尋結果重新排序: {len(search_results)} 筆中保留 {len(reranked)} 筆，"
+                    f"重複商品 {duplicates} 筆")
+        return reranked
@@ -0,0 +1,167 @@
+from package.cache import LRUCache, SingleFlight
+import unicodedata
+import re
+
+# 查詢結尾常見的標點符號，不影響語意
+_TRAILING_PUNCTUATION = re.compile(r"[\s。．.！!？?~～]+$")
+
+def normalize_query(user_query):
+    """
+    正規化用戶查詢，作為比較結果快取的key
+
+    Args:
+        user_query: 用戶的原始查詢
+
+    Returns:
+        全形轉半形、統一大小寫、合併空白並去除結尾標點後的字串
+    """
+    text = unicodedata.normalize("NFKC", user_query or "").casefold()
+    text = " ".join(text.split())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+def is_cacheable_result(result):
+    """
+    判斷比較結果是否可以快取
+
+    Args:
+        result: (原始回應文字, 解析後的JSON字典)
+
+    Returns:
+        bool: 含有非空product_comparisons列表時為True，錯誤或無法解析時的{"response": ...}為False
+    """
+    _, json_data = result
+    if not isinstance(json_data, dict) or "error" in json_data:
+        return False
+    comparisons = json_data.get("product_comparisons")
+    return isinstance(comparisons, list) and len(comparisons) > 0
+
+class ResultCache:
+    """
+    產品比較結果快取
+    以正規化後的查詢為key保存(原始回應文字, 解析後的JSON)，並合併相同查詢的併發請求
+    """
+
+    def __init__(self, ttl=900, max_entries=256):
+        """
+        初始化比較結果快取
+
+        Args:
+            ttl: 比較結果的存活秒數
+            max_entries: 最大項目數量
+        """
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.single_flight = SingleFlight()
+
+    def get(self, user_query):
+        """
+        取得快取的比較結果
+
+        Args:
+            user_query: 用戶的原始查詢
+
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)，沒有則回傳None
+        """
+        return self.memory.get(normalize_query(user_query))
+
+    def set(self, user_query, result):
+        """
+        寫入比較結果，失敗或沒有商品比較的結果不快取
+
+        Args:
+            user_query: 用戶的原始查詢
+            result: (原始回應文字, 解析後的JSON字典)
+        """
+        if is_cacheable_result(result):
+            self.memory.set(normalize_query(user_query), result)
+
+    def get_or_compute(self, user_query, func):
+        """
+        取得快取結果，沒有時執行func，相同查詢的併發呼叫只執行一次
+
+        Args:
+            user_query: 用戶的原始查詢
+            func: 無參數的函式，回傳(原始回應文字, 解析後的JSON字典)
+
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)
+        """
+        result = self.get(user_query)
+        if result is not None:
+            return result
+
+        def compute():
+            computed = func()
+            self.set(user_query, computed)
+            return computed
+
+        return self.single_flight.do(normalize_query(user_query), compute)
+
+    async def aget_or_compute(self, user_query, coro_func):
+        """
+        get_or_compute的非同步版本
+
+        Args:
+            user_query: 用戶的原始查詢
+            coro_func: 無參數的協程函式，回傳(原始回應文字, 解析後的JSON字典)
+
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)
+        """
+        result = self.get(user_query)
+        if result is not None:
+            return result
+
+        async def compute():
+            computed = await coro_func()
+            self.set(user_query, computed)
+            return computed
+
+        return await self.single_flight.ado(normalize_query(user_query), compute)
+
+    def iter_or_compute(self, user_query, events_func):
+        """
+        get_or_compute的串流版本，執行者轉發events_func產生的事件，快取命中或等待其它請求時不產生事件
+
+        Args:
+            user_query: 用戶的原始查詢
+            events_func: 無參數的函式，回傳產生進度事件、最後回傳(原始回應文字, 解析後的JSON字典)的產生器
+
+        Yields:
+            events_func產生的事件
+
+        Returns:
+            tuple: (原始回應文字, 解析後的JSON字典)
+        """
+        result = self.get(user_query)
+        if result is not None:
+            return result
+
+        key = normalize_query(user_query)
+        leader, value = self.single_flight.join(key)
+        if not leader:
+            return value
+
+        try:
+            result = yield from events_func()
+        except GeneratorExit:
+            # 串流被中斷時讓等待者自己執行
+            self.single_flight.abandon(key, value)
+            raise
+        except BaseException as e:
+            self.single_flight.finish(key, value, exception=e)
+            raise
+        self.set(user_query, result)
+        self.single_flight.finish(key, value, result)
+        return result
+
+    def stats(self):
+        """
+        取得快取統計資料
+
+        Returns:
+            dict: 命中/未命中/淘汰次數與合併的併發請求數
+        """
+        stats = self.memory.stats()
+        stats["coalesced"] = self.single_flight.coalesced
+        return stats
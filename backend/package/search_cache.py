@@ -0,0 +1,101 @@
+from package.cache import LRUCache, SQLiteStore
+import unicodedata
+import threading
+
+class SearchCache:
+    """
+    Google搜尋結果快取
+    以正規化後的關鍵字集合為key(忽略順序、空白與大小寫)，包含inurl前綴與結果數量
+    """
+
+    def __init__(self, ttl=3600, max_entries=500, db_path=None):
+        """
+        初始化搜尋結果快取
+
+        Args:
+            ttl: 搜尋結果的存活秒數
+            max_entries: 記憶體層最大項目數量
+            db_path: 持久層SQLite檔案路徑，None則只使用記憶體
+        """
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.store = SQLiteStore(db_path, "search_cache") if db_path else None
+
+        self._lock = threading.Lock()
+        self._disk_hits = 0
+
+    @staticmethod
+    def make_key(prefix, query, num_results):
+        """
+        產生快取key
+
+        Args:
+            prefix: 搜尋前綴，例如inurl限制
+            query: 搜尋關鍵字
+            num_results: 搜尋結果數量
+
+        Returns:
+            正規化後的key字串
+        """
+        # 全形轉半形並統一大小寫，關鍵字去重後排序
+        normalized = unicodedata.normalize("NFKC", query or "").casefold()
+        tokens = sorted(set(normalized.split()))
+        return f"{prefix}|{num_results}|{' '.join(tokens)}"
+
+    def get(self, key):
+        """
+        取得搜尋結果，記憶體層未命中時查詢持久層
+
+        Args:
+            key: make_key產生的key
+
+        Returns:
+            搜尋結果列表，沒有則回傳None
+        """
+        results = self.memory.get(key)
+        if results is None and self.store is not None:
+            results, remaining_ttl = self.store.get(key, with_ttl=True)
+            if results is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                # 記憶體層沿用持久層剩餘的存活時間
+                self.memory.set(key, results, ttl=remaining_ttl)
+        return results
+
+    def set(self, key, results):
+        """
+        寫入搜尋結果
+
+        Args:
+            key: make_key產生的key
+            results: 搜尋結果列表
+        """
+        self.memory.set(key, results)
+        if self.store is not None:
+            self.store.set(key, results, ttl=self.ttl)
+
+    def stats(self):
+        """
+        取得快取統計資料
+
+        Returns:
+            dict: 記憶體層的命中/未命中/淘汰次數，以及持久層命中次數
+        """
+        stats = self.memory.stats()
+        with self._lock:
+            stats["disk_hits"] = self._disk_hits
+        return stats
+
+    def purge_expired(self):
+        """
+        清除持久層中已過期的資料
+
+        Returns:
+            刪除的筆數
+        """
+        return self.store.purge_expired() if self.store is not None else 0
+
+    def close(self):
+        """關閉持久層"""
+        if self.store is not None:
+            self.store.close()
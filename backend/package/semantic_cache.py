@@ -0,0 +1,203 @@
+from package.keyword_extractor import FILLER_WORDS, KeywordExtractor
+from package.product_filter import parse_constraints
+from package.result_cache import normalize_query, is_cacheable_result
+import threading
+import time
+import zlib
+import re
+import numpy as np
+
+# 不影響商品需求的詞，例如「推薦」「比較」「想買」，向量化前先移除
+_FILLER_PATTERN = re.compile("|".join(re.escape(word) for word in sorted(FILLER_WORDS, key=len, reverse=True) if len(word) > 1))
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+
+# 相似度統計的分組
+_SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0)
+
+class SemanticCache:
+    """
+    近似查詢快取
+    以字元n-gram的雜湊向量表示查詢，存放在固定大小的NumPy矩陣中，用餘弦相似度找最接近的舊查詢。
+    只比對品牌、類別、規格與型號詞完全相同的查詢(例如ASUS與MSI、iphone 15與14的字元相似度很高，但不能共用)，
+    相似度夠高且預算與規格需求相同時直接重用比較結果，較低但仍相近時只重用關鍵字與搜尋結果
+    """
+
+    def __init__(self, ttl=900, max_entries=512, result_threshold=0.9, stage_threshold=0.75, dim=2048, ngram_sizes=(1, 2, 3)):
+        """
+        初始化近似查詢快取
+
+        Args:
+            ttl: 項目的存活秒數
+            max_entries: 最大項目數量，決定矩陣的列數
+            result_threshold: 重用完整比較結果的最低相似度
+            stage_threshold: 重用關鍵字與搜尋結果的最低相似度
+            dim: 雜湊向量的維度
+            ngram_sizes: 使用的字元n-gram長度
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.result_threshold = result_threshold
+        self.stage_threshold = stage_threshold
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+        self._extractor = KeywordExtractor()
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._signatures = np.zeros(max_entries, dtype=np.int64)
+        self._expires_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._entries = [None] * max_entries
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._stats = {"result_hits": 0, "stage_hits": 0, "misses": 0, "evictions": 0}
+        self._similarity_counts = [0] * len(_SIMILARITY_BUCKETS)
+
+    def vectorize(self, user_query):
+        """
+        把查詢轉成L2正規化的字元n-gram雜湊向量
+
+        Args:
+            user_query: 用戶的原始查詢
+
+        Returns:
+            numpy.ndarray: 長度為dim的向量，查詢沒有內容時為零向量
+        """
+        text = _FILLER_PATTERN.sub("", normalize_query(user_query))
+        text = _PUNCTUATION.sub("", text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for size in self.ngram_sizes:
+            for i in range(len(text) - size + 1):
+                # 長的n-gram權重較高
+                vector[zlib.crc32(text[i:i + size].encode("utf-8")) % self.dim] += size
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _nearest(self, vector, signature, now):
+        """找出商品詞相同、最相似且未過期的項目，回傳(slot, 相似度)"""
+        valid = (self._expires_at > now) & (self._signatures == hash(signature))
+        if not valid.any() or not vector.any():
+            return None, 0.0
+        similarities = self._vectors @ vector
+        similarities[~valid] = -1.0
+        slot = int(np.argmax(similarities))
+        return slot, float(similarities[slot])
+
+    def _record_similarity(self, similarity):
+        for index, bound in enumerate(_SIMILARITY_BUCKETS):
+            if similarity <= bound:
+                self._similarity_counts[index] += 1
+                return
+
+    def lookup(self, user_query):
+        """
+        查詢最接近的快取項目，只比對品牌、類別、規格與型號詞相同的項目
+
+        Args:
+            user_query: 用戶的原始查詢
+
+        Returns:
+            tuple: (使用的快取種類"result"、"stages"或None, 快取內容, 相似度)
+                - "result": 快取內容為(原始回應文字, 解析後的JSON字典)
+                - "stages": 快取內容為(搜尋關鍵字, 搜尋結果列表)
+        """
+        vector = self.vectorize(user_query)
+        signature = self._extractor.signature(user_query)
+        now = time.time()
+        with self._lock:
+            slot, similarity = self._nearest(vector, signature, now)
+            self._record_similarity(similarity)
+            # 雜湊值相同時再確認一次商品詞
+            if slot is None or similarity < self.stage_threshold or self._entries[slot]["signature"] != signature:
+                self._stats["misses"] += 1
+                return None, None, similarity
+
+            entry = self._entries[slot]
+            self._last_used[slot] = now
+            # 預算或規格不同時比較結果不同，但關鍵字與搜尋結果仍可重用
+            if (entry["result"] is not None and similarity >= self.result_threshold
+                    and entry["constraints"] == parse_constraints(user_query)):
+                self._stats["result_hits"] += 1
+                return "result", entry["result"], similarity
+            self._stats["stage_hits"] += 1
+            return "stages", (entry["keywords"], entry["search_results"]), similarity
+
+    def _slot_for(self, key, now):
+        """取得key使用的矩陣列，沒有時分配新的列，已滿時先淘汰過期項目再淘汰最久未使用的項目"""
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        if len(self._slots) < self.max_entries:
+            slot = next(index for index, entry in enumerate(self._entries) if entry is None)
+        else:
+            expired = np.flatnonzero(self._expires_at <= now)
+            slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+            del self._slots[self._entries[slot]["key"]]
+            self._stats["evictions"] += 1
+        self._slots[key] = slot
+        return slot
+
+    def put_stages(self, user_query, keywords, search_results):
+        """
+        寫入查詢的關鍵字與搜尋結果
+
+        Args:
+            user_query: 用戶的原始查詢
+            keywords: 搜尋關鍵字
+            search_results: 搜尋結果列表
+        """
+        if not search_results:
+            return
+        key = normalize_query(user_query)
+        vector = self.vectorize(user_query)
+        if not vector.any():
+            return
+        signature = self._extractor.signature(user_query)
+        now = time.time()
+        with self._lock:
+            slot = self._slot_for(key, now)
+            self._vectors[slot] = vector
+            self._signatures[slot] = hash(signature)
+            self._expires_at[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._entries[slot] = {
+                "key": key,
+                "signature": signature,
+                "constraints": parse_constraints(user_query),
+                "keywords": keywords,
+                "search_results": search_results,
+                "result": None,
+            }
+
+    def put_result(self, user_query, result):
+        """
+        為已寫入關鍵字與搜尋結果的查詢加上比較結果，失敗或沒有商品比較的結果不快取
+
+        Args:
+            user_query: 用戶的原始查詢
+            result: (原始回應文字, 解析後的JSON字典)
+        """
+        if not is_cacheable_result(result):
+            return
+        with self._lock:
+            slot = self._slots.get(normalize_query(user_query))
+            if slot is not None:
+                self._entries[slot]["result"] = result
+
+    def stats(self):
+        """
+        取得快取統計資料
+
+        Returns:
+            dict: 重用結果/重用搜尋/未命中次數、命中率、項目數量與最高相似度的分布
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = int((self._expires_at > time.time()).sum())
+            counts = list(self._similarity_counts)
+        lookups = stats["result_hits"] + stats["stage_hits"] + stats["misses"]
+        stats["result_hit_rate"] = round(stats["result_hits"] / lookups, 4) if lookups else 0.0
+        stats["stage_hit_rate"] = round(stats["stage_hits"] / lookups, 4) if lookups else 0.0
+        stats["result_threshold"] = self.result_threshold
+        stats["stage_threshold"] = self.stage_threshold
+        stats["similarity_histogram"] = {f"<={bound}": count for bound, count in zip(_SIMILARITY_BUCKETS, counts)}
+        return stats
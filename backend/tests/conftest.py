@@ -0,0 +1,81 @@
+from bench.fakes import render_product_page
+from package.http_client import HTTPResult
+import pytest
+
+PRODUCT_URL = "https://24h.pchome.com.tw/prod/DHAF1Y-A900GXQJ2"
+
+def product_page(name="ASUS Vivobook 15 筆電", price="$25,900", brand="ASUS", original_price="$29,900",
+                 features=("輕薄機身",), specs=(("記憶體", "16GB"),), specs_text=("Intel Core i5",)):
+    """產生與PChome商品頁面結構相同的HTML，name為None時模擬被擋或改版的頁面"""
+    if name is None:
+        return "<html><body><div class='captcha'>請證明您不是機器人</div></body></html>"
+    return render_product_page({
+        "name": name,
+        "brand": brand,
+        "price": price,
+        "original_price": original_price,
+        "features": list(features),
+        "specs": list(specs),
+        "specs_text": list(specs_text),
+    }, padding_bytes=0)
+
+class FakeHTTP:
+    """依序回傳預先設定的回應，並記錄請求標頭"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append((url, dict(headers or {})))
+        status_code, html, response_headers = self.responses.pop(0)
+        return HTTPResult(url, status_code, response_headers or {}, html.encode("utf-8"), "utf-8", 0.0)
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def make_rag(tmp_path):
+    """建立不連線外部服務的RAGService，測試結束時關閉"""
+    from package.rag import RAGService
+    services = []
+
+    def make(**kwargs):
+        options = dict(
+            gemini_api_key="test",
+            google_search_api_key="test",
+            google_cse_id="test",
+            cache_db_path=str(tmp_path / "cache.db"),
+            retriever_mode="google",
+            refresh_interval=0,
+        )
+        options.update(kwargs)
+        service = RAGService(**options)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.close()
+
+@pytest.fixture(scope="session")
+def main_app(tmp_path_factory):
+    """載入app.main，資料庫與快取放在暫存目錄，不啟動背景更新"""
+    import os
+    workdir = tmp_path_factory.mktemp("app")
+    defaults = {
+        "database_file": str(workdir / "database.db"),
+        "cache_db_path": str(workdir / "cache.db"),
+        "gemini_api_key": "test",
+        "google_search_api_key": "test",
+        "google_cse_id": "test",
+        "model_name": "gemini-2.0-flash",
+        "secret_key": "test",
+        "refresh_interval": "0",
+        "retriever_mode": "google",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    import app.main as main
+    main.creat_db()
+    return main
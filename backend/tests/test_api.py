@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+import asyncio
+import pytest
+
+@pytest.fixture
+def loop_queries(main_app):
+    """記錄在事件迴圈執行緒上執行的SQL，這些查詢會阻塞所有請求"""
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        queries.append(statement)
+
+    event.listen(main_app.engine, "before_cursor_execute", before_cursor_execute)
+    yield queries
+    event.remove(main_app.engine, "before_cursor_execute", before_cursor_execute)
+
+def test_database_access_stays_off_the_event_loop(main_app, monkeypatch, loop_queries):
+    submitted = []
+    monkeypatch.setattr(main_app.job_queue, "submit", submitted.append)
+
+    def stream_product_comparison(user_query):
+        yield "keywords", {"keywords": "筆電"}
+        yield "result", ("回應", {"product_comparisons": [{"name": "A"}]})
+    monkeypatch.setattr(main_app.rag_service, "stream_product_comparison", stream_product_comparison)
+
+    # 不進入with區塊，不執行lifespan的背景服務
+    client = TestClient(main_app.app)
+    user_name = f"api-{main_app.uuid4().hex[:8]}"
+    assert client.post("/api/register", json={"user_name": user_name, "email": f"{user_name}@example.com",
+                                              "password": "secret"}).status_code == 200
+    token = client.post("/api/token", data={"username": user_name, "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/users/me", headers=headers).json()["user_name"] == user_name
+    job = client.post("/api/jobs", json={"content": "筆電"}, headers=headers).json()
+    assert submitted == [job["job_id"]]
+    assert client.get(f"/api/jobs/{job['job_id']}", headers=headers).json()["status"] == "queued"
+    stream = client.post("/api/search/stream", json={"content": "筆電"}, headers=headers).text
+    assert "event: result" in stream
+    assert client.get("/api/history", headers=headers).json()["total"] == 1
+
+    assert loop_queries == []
@@ -0,0 +1,67 @@
+from package.cache import LRUCache, SQLiteStore
+import time
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_expires_items():
+    cache = LRUCache(ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_sqlite_store_round_trip(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.db"), "items")
+    store.set("a", {"value": [1, "二"]}, ttl=60)
+    value, remaining = store.get("a", with_ttl=True)
+    assert value == {"value": [1, "二"]}
+    assert 0 < remaining <= 60
+    store.close()
+
+    reopened = SQLiteStore(str(tmp_path / "cache.db"), "items")
+    assert reopened.get("a") == {"value": [1, "二"]}
+    reopened.close()
+
+def test_sqlite_store_expired_and_purge(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.db"), "items")
+    store.set("old", 1, ttl=-1)
+    store.set("other", 2, ttl=-1)
+    store.set("forever", 3)
+    assert store.get("old") is None
+    assert store.purge_expired() == 1
+    assert store.get("forever") == 3
+    store.close()
+
+def test_sqlite_store_unavailable_falls_back(tmp_path):
+    store = SQLiteStore(str(tmp_path / "missing" / "cache.db"), "items")
+    assert not store.available
+    store.set("a", 1)
+    assert store.get("a") is None
+    assert store.purge_expired() == 0
+
+def test_caches_purge_expired_rows(tmp_path):
+    from package.product_cache import ProductCache
+    from package.search_cache import SearchCache
+    db_path = str(tmp_path / "cache.db")
+    products = ProductCache(db_path=db_path, stale_ttl=-1)
+    searches = SearchCache(ttl=-1, db_path=db_path)
+    products.put("P1", "url", {"name": "筆電", "brand": "ASUS", "price": "$1", "original_price": "$2",
+                               "features": [], "specs": {}, "specs_text": ""})
+    searches.set("筆電", [{"link": "url"}])
+    assert products.purge_expired() == 1
+    assert searches.purge_expired() == 1
+    assert ProductCache().purge_expired() == 0
+    products.close()
+    searches.close()
@@ -0,0 +1,58 @@
+from package.context_builder import ContextBuilder, estimate_tokens
+from package.product import ProductRecord
+
+def product(index, specs_text="", extra_specs=0):
+    specs = {"處理器": "Intel Core i5", "記憶體": "16GB", "顏色": "銀色"}
+    specs.update({f"其它{i}": "很長的規格說明文字" * 3 for i in range(extra_specs)})
+    return ProductRecord(
+        url=f"https://24h.pchome.com.tw/prod/P{index}",
+        name=f"筆電{index}",
+        brand="ASUS",
+        price_text="$25,900",
+        original_price_text="$29,900",
+        features=["輕薄機身"],
+        specs=specs,
+        specs_text=specs_text,
+    )
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("筆電") == 2
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("筆電abcd") == 3
+
+def test_build_keeps_everything_within_budget():
+    text, report = ContextBuilder(max_tokens=6000).build([product(1)])
+    for line in ("商品名稱: 筆電1", "售價: $25,900", "原價: $29,900", "- 輕薄機身", "處理器: Intel Core i5", "顏色: 銀色"):
+        assert line in text
+    assert report[0]["dropped_lines"] == 0
+    assert report[0]["tokens"] == report[0]["full_tokens"]
+
+def test_specs_text_duplicating_spec_table_is_dropped():
+    text, _ = ContextBuilder().build([product(1, specs_text="Intel Core i5\n記憶體：16GB\n支援Wi-Fi 6E")])
+    assert "其它規格說明:" in text
+    assert "支援Wi-Fi 6E" in text
+    assert text.count("Intel Core i5") == 1
+    assert text.count("16GB") == 1
+
+def test_long_spec_lines_are_truncated():
+    text, _ = ContextBuilder(max_line_chars=10).build([product(1, specs_text="x" * 50)])
+    assert "x" * 10 + "…" in text
+    assert "x" * 11 not in text
+
+def test_tight_budget_drops_less_important_lines_first():
+    products = [product(i, extra_specs=20) for i in range(3)]
+    text, report = ContextBuilder(max_tokens=300).build(products)
+    assert sum(item["tokens"] for item in report) <= 300
+    for i in range(3):
+        # 必要欄位與主要規格一定保留
+        assert f"商品名稱: 筆電{i}" in text
+        assert text.count("處理器: Intel Core i5") == 3
+    assert all(item["dropped_lines"] > 0 for item in report)
+
+def test_failed_products_are_not_in_context():
+    failed = ProductRecord.from_error("https://24h.pchome.com.tw/prod/BAD", "抓取失敗: timeout")
+    text, report = ContextBuilder().build([failed, product(1)])
+    assert "timeout" not in text
+    assert report[0] == {"url": failed.url, "error": "抓取失敗: timeout", "tokens": 0, "full_tokens": 0, "dropped_lines": 0}
+    assert report[1]["name"] == "筆電1"
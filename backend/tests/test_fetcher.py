@@ -0,0 +1,78 @@
+from package.fetcher import ConcurrentFetcher
+import threading
+import time
+import pytest
+
+@pytest.fixture
+def fetcher():
+    fetcher = ConcurrentFetcher(max_workers=4, per_host_limit=2)
+    yield fetcher
+    fetcher.shutdown()
+
+class Recorder:
+    """記錄每個主機同時執行的最大數量，可以用event暫停抓取"""
+
+    def __init__(self, release=None):
+        self.release = release
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.started = []
+
+    def __call__(self, url):
+        host = url.split("/")[2]
+        with self.lock:
+            self.started.append(url)
+            self.running[host] = self.running.get(host, 0) + 1
+            self.max_running[host] = max(self.max_running.get(host, 0), self.running[host])
+        try:
+            if self.release is not None:
+                self.release.wait(5)
+            else:
+                time.sleep(0.01)
+            return url
+        finally:
+            with self.lock:
+                self.running[host] -= 1
+
+def test_map_keeps_input_order(fetcher):
+    urls = [f"https://a.example/{i}" for i in range(10)]
+    assert fetcher.map(Recorder(), urls) == urls
+
+def test_per_host_limit(fetcher):
+    recorder = Recorder()
+    fetcher.map(recorder, [f"https://a.example/{i}" for i in range(10)])
+    assert recorder.max_running["a.example"] == 2
+
+def test_waiting_urls_do_not_block_other_hosts(fetcher):
+    # 舊版在執行緒中等待主機名額，a.example的4個網址會佔滿4個執行緒
+    release = threading.Event()
+    recorder = Recorder(release)
+    slow = [fetcher._submit(recorder, f"https://a.example/{i}", lambda url, e: None) for i in range(4)]
+    other = fetcher._submit(lambda url: "ok", "https://b.example/1", lambda url, e: None)
+    assert other.result(timeout=2) == "ok"
+    assert len(recorder.started) == 2
+    release.set()
+    assert [future.result(timeout=2) for future in slow] == [f"https://a.example/{i}" for i in range(4)]
+
+def test_errors_use_on_error(fetcher):
+    def fetch(url):
+        raise ValueError(url)
+    results = fetcher.map(fetch, ["https://a.example/1"], on_error=lambda url, e: f"error: {e}")
+    assert results == ["error: https://a.example/1"]
+
+def test_timeout_cancels_queued_urls(fetcher):
+    release = threading.Event()
+    recorder = Recorder(release)
+    urls = [f"https://a.example/{i}" for i in range(4)]
+    results = fetcher.map(recorder, urls, on_error=lambda url, e: "timeout", timeout=0.2)
+    assert results == ["timeout"] * 4
+    release.set()
+    time.sleep(0.1)
+    # 還在佇列中的網址被取消，不會在背景執行
+    assert len(recorder.started) == 2
+
+def test_iter_completed_yields_every_index(fetcher):
+    urls = [f"https://a.example/{i}" for i in range(5)]
+    results = dict(fetcher.iter_completed(Recorder(), urls))
+    assert results == dict(enumerate(urls))
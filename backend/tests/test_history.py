@@ -0,0 +1,59 @@
+from fastapi import HTTPException
+from datetime import datetime, timedelta
+import pytest
+
+@pytest.fixture
+def history(main_app):
+    """建立一個用戶與7筆問答記錄，其中3筆建立時間相同，回傳(用戶ID, 由新到舊的記錄ID)"""
+    from sqlmodel import Session
+    with Session(main_app.engine) as session:
+        user = main_app.User(user_name=f"history-{main_app.uuid4().hex[:8]}", hashed_password="x")
+        session.add(user)
+        session.commit()
+        base = datetime(2025, 1, 1)
+        times = [base, base + timedelta(minutes=1), base + timedelta(minutes=2), base + timedelta(minutes=2),
+                 base + timedelta(minutes=2), base + timedelta(minutes=3), base + timedelta(minutes=4)]
+        records = [main_app.QueryRecord(user_id=user.id, query=f"q{i}", response="r", created_at=t)
+                   for i, t in enumerate(times)]
+        session.add_all(records)
+        session.commit()
+        ordered = sorted(records, key=lambda r: (r.created_at, r.id), reverse=True)
+        return user.id, [r.id for r in ordered]
+
+def read_page(main_app, statement):
+    from sqlmodel import Session
+    with Session(main_app.engine) as session:
+        return session.exec(statement).all()
+
+def test_cursor_round_trip(main_app):
+    record = main_app.QueryRecord(id=42, user_id=1, query="q", response="r", created_at=datetime(2025, 1, 1, 12, 30, 5, 123))
+    cursor = main_app.encode_history_cursor(record)
+    assert "=" not in cursor
+    assert main_app.decode_history_cursor(cursor) == (record.created_at, 42)
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "bnVsbA", "WyJ4IiwgMV0"])
+def test_invalid_cursor_is_400(main_app, cursor):
+    with pytest.raises(HTTPException) as error:
+        main_app.decode_history_cursor(cursor)
+    assert error.value.status_code == 400
+
+def test_cursor_pages_cover_every_record_once(main_app, history):
+    user_id, expected = history
+    seen = []
+    after = None
+    while True:
+        page = read_page(main_app, main_app.history_page_statement(user_id, 2, after=after))
+        seen.extend(row.id for row in page)
+        if len(page) < 2:
+            break
+        after = main_app.decode_history_cursor(main_app.encode_history_cursor(page[-1]))
+    assert seen == expected
+
+def test_offset_pages_match_cursor_order(main_app, history):
+    user_id, expected = history
+    page = read_page(main_app, main_app.history_page_statement(user_id, 3, skip=2))
+    assert [row.id for row in page] == expected[2:5]
+    # 使用cursor時忽略skip
+    after = read_page(main_app, main_app.history_page_statement(user_id, 1))[0]
+    page = read_page(main_app, main_app.history_page_statement(user_id, 2, skip=5, after=(after.created_at, after.id)))
+    assert [row.id for row in page] == expected[1:3]
@@ -0,0 +1,112 @@
+from app.jobs import JobQueue
+import asyncio
+import pytest
+
+def run_queue(handler, job_ids, workers=2, max_size=10):
+    """啟動佇列、排入工作並等待全部處理完成，回傳統計資料"""
+    async def main():
+        queue = JobQueue(handler, workers=workers, max_size=max_size)
+        queue.start()
+        for job_id in job_ids:
+            queue.submit(job_id)
+        await queue._queue.join()
+        await queue.stop()
+        return queue.metrics()
+    return asyncio.run(main())
+
+def test_jobs_run_and_failures_are_counted():
+    handled = []
+
+    async def handler(job_id):
+        handled.append(job_id)
+        if job_id == "bad":
+            raise RuntimeError("boom")
+
+    metrics = run_queue(handler, ["a", "bad", "b"])
+    assert sorted(handled) == ["a", "b", "bad"]
+    assert metrics["submitted"] == 3
+    assert metrics["completed"] == 2
+    assert metrics["failed"] == 1
+    assert metrics["in_flight"] == 0 and metrics["queue_depth"] == 0
+
+def test_workers_limit_concurrency():
+    running = []
+    peak = []
+
+    async def handler(job_id):
+        running.append(job_id)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(job_id)
+
+    run_queue(handler, [str(i) for i in range(6)], workers=2)
+    assert max(peak) == 2
+
+def test_full_queue_rejects():
+    async def main():
+        queue = JobQueue(None, workers=0, max_size=1)
+        queue.start()
+        queue.submit("a")
+        with pytest.raises(asyncio.QueueFull):
+            queue.submit("b")
+        return queue.metrics()
+
+    metrics = asyncio.run(main())
+    assert metrics["rejected"] == 1
+    assert metrics["queue_depth"] == 1
+
+def create_job(main, query="筆電"):
+    from sqlmodel import Session
+    with Session(main.engine) as session:
+        user = main.User(user_name=f"job-{main.uuid4().hex[:8]}", hashed_password="x")
+        session.add(user)
+        session.commit()
+        job = main.ComparisonJob(user_id=user.id, query=query)
+        session.add(job)
+        session.commit()
+        return job.id, user.id
+
+def load_job(main, job_id):
+    from sqlmodel import Session, select
+    with Session(main.engine) as session:
+        job = session.get(main.ComparisonJob, job_id)
+        records = session.exec(select(main.QueryRecord).where(main.QueryRecord.user_id == job.user_id)).all()
+        return job, records
+
+def test_comparison_job_done(main_app, monkeypatch):
+    async def aprocess(query):
+        return "回應", {"product_comparisons": [{"name": "A"}]}
+    monkeypatch.setattr(main_app.rag_service, "aprocess_product_comparison", aprocess)
+
+    job_id, _ = create_job(main_app)
+    asyncio.run(main_app.run_comparison_job(job_id))
+    job, records = load_job(main_app, job_id)
+    assert job.status == "done"
+    assert job.record_id == records[0].id
+    assert records[0].response == "回應"
+
+def test_comparison_job_error_result_fails(main_app, monkeypatch):
+    async def aprocess(query):
+        return "timeout", {"error": "處理產品比較時發生錯誤: timeout"}
+    monkeypatch.setattr(main_app.rag_service, "aprocess_product_comparison", aprocess)
+
+    job_id, _ = create_job(main_app)
+    with pytest.raises(RuntimeError):
+        asyncio.run(main_app.run_comparison_job(job_id))
+    job, records = load_job(main_app, job_id)
+    assert job.status == "failed"
+    assert job.error == "處理產品比較時發生錯誤: timeout"
+    assert job.result is None and records == []
+
+def test_finished_job_is_not_rerun(main_app, monkeypatch):
+    calls = []
+
+    async def aprocess(query):
+        calls.append(query)
+        return "回應", {"product_comparisons": [{"name": "A"}]}
+    monkeypatch.setattr(main_app.rag_service, "aprocess_product_comparison", aprocess)
+
+    job_id, _ = create_job(main_app)
+    asyncio.run(main_app.run_comparison_job(job_id))
+    asyncio.run(main_app.run_comparison_job(job_id))
+    assert len(calls) == 1
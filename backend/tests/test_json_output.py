@@ -0,0 +1,61 @@
+from package.json_output import build_response_schema, extract_json_text, complete_partial_json, loads_tolerant, schema_problems
+import json
+import pytest
+
+SCHEMA = build_response_schema({"items": [{"name": "", "score": 0}], "ok": True})
+
+def test_build_response_schema():
+    assert SCHEMA == {
+        "type": "object",
+        "properties": {
+            "items": {"type": "array", "items": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}, "score": {"type": "number"}},
+                "required": ["name", "score"],
+            }},
+            "ok": {"type": "boolean"},
+        },
+        "required": ["items", "ok"],
+    }
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', '{"a": 1}'),
+    ('以下是結果:\n{"a": [1]}\n謝謝', '{"a": [1]}'),
+    ('```json\n{"a": [1, 2', '{"a": [1, 2'),
+    ("沒有JSON", None),
+    ("", None),
+])
+def test_extract_json_text(text, expected):
+    assert extract_json_text(text) == expected
+
+@pytest.mark.parametrize("text", [
+    '{"a": [1, 2',
+    '{"a": "截斷的字',
+    '{"a": 1, "b',
+    '{"a": 1, "b": ',
+])
+def test_complete_partial_json_is_valid(text):
+    json.loads(complete_partial_json(text))
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('{"a": [1, 2,],}', {"a": [1, 2]}),
+    ('{“a”: 1}', {"a": 1}),
+    ("{'a': 1, 'b': True}", {"a": 1, "b": True}),
+    # 截斷在最後一個商品中間時只保留完整的商品
+    ('```json\n{"items": [{"name": "A"}, {"name": "B', {"items": [{"name": "A"}]}),
+    ("完全不是JSON", None),
+    ("{not json at all", None),
+])
+def test_loads_tolerant(text, expected):
+    assert loads_tolerant(text) == expected
+
+@pytest.mark.parametrize("data, problems", [
+    ({"items": [{"name": "A", "score": 9}], "ok": False}, []),
+    ({"items": [{"name": 1}], "ok": True}, ["$.items[0].score 缺少", "$.items[0].name 應為字串"]),
+    ({"items": [{"name": "A", "score": True}], "ok": True}, ["$.items[0].score 應為數字"]),
+    ({"items": {}, "ok": True}, ["$.items 應為陣列"]),
+    ([], ["$ 應為物件"]),
+])
+def test_schema_problems(data, problems):
+    assert schema_problems(data, SCHEMA) == problems
@@ -0,0 +1,87 @@
+from package.keyword_extractor import KeywordExtractor
+import pytest
+
+# RAGService預設的規則式關鍵字信心門檻
+MIN_CONFIDENCE = 0.8
+
+@pytest.fixture(scope="module")
+def extractor():
+    return KeywordExtractor()
+
+@pytest.mark.parametrize("query, keywords", [
+    ("想找一台MSI的電競筆電，需要有i9處理器和RTX 4080顯卡", "MSI 筆電 電競 i9 RTX4080"),
+    ("我想買一台華碩筆電", "ASUS 筆電"),
+    ("推薦一款可以遠端控制的掃地機器人，要能連接APP並能自動倒垃圾，預算10000元左右。", "掃地機器人 APP控制 自動"),
+    ("ｈｐ　筆電", "HP 筆電"),
+    ("27吋 165hz 電競螢幕", "螢幕 電競 27吋 165Hz"),
+])
+def test_confident_keywords(extractor, query, keywords):
+    result, confidence = extractor.extract(query)
+    assert result == keywords
+    assert confidence >= MIN_CONFIDENCE
+
+def test_no_category(extractor):
+    assert extractor.extract("有沒有php教學") == ("", 0.0)
+    assert extractor.extract("") == ("", 0.0)
+
+def test_multiple_categories_are_ambiguous(extractor):
+    _, confidence = extractor.extract("筆電還是平板")
+    assert confidence < MIN_CONFIDENCE
+
+def test_component_category_is_not_main_product(extractor):
+    keywords, _ = extractor.extract("15吋螢幕的輕薄筆電")
+    assert keywords.split()[0] == "筆電"
+
+def test_unknown_words_lower_confidence(extractor):
+    _, confidence = extractor.extract("筆電 要可以跑stable diffusion的")
+    assert confidence < MIN_CONFIDENCE
+
+@pytest.mark.parametrize("query, excluded, kept", [
+    ("筆電 不要華碩", "ASUS", "筆電"),
+    ("除了華碩以外的筆電", "ASUS", "筆電"),
+    ("不要蘋果的平板", "Apple", "平板"),
+    ("不需要獨顯的文書筆電", "獨顯", "筆電"),
+    ("耳機 排除sony", "Sony", "耳機"),
+])
+def test_negated_terms_are_excluded(extractor, query, excluded, kept):
+    keywords, confidence = extractor.extract(query)
+    assert excluded not in keywords.split()
+    assert kept in keywords.split()
+    # 排除條件要交給Gemini處理
+    assert confidence < MIN_CONFIDENCE
+
+@pytest.mark.parametrize("query, signature", [
+    ("iphone 15 pro 推薦", {"手機", "15", "pro"}),
+    ("預算3萬的RTX4060筆電", {"筆電", "RTX4060"}),
+    ("$30000以內的Sony耳機", {"Sony", "耳機"}),
+    ("不要華碩的筆電", {"-ASUS", "筆電"}),
+    ("ASUS或MSI的筆電", {"ASUS", "MSI", "筆電"}),
+])
+def test_signature(extractor, query, signature):
+    assert extractor.signature(query) == frozenset(signature)
+
+@pytest.mark.parametrize("query, kept", [
+    ("iphone 15", ["15"]),
+    ("4k 電視", ["4k"]),
+    ("iphone 15 128g", ["15", "128g"]),
+    ("samsung s24 手機", ["s24"]),
+])
+def test_model_numbers_are_not_budget(extractor, query, kept):
+    keywords, confidence = extractor.extract(query)
+    # 型號與容量不能被當成預算拿掉，無法辨識時交給Gemini
+    for token in kept:
+        assert token in keywords.split()
+    assert confidence < MIN_CONFIDENCE
+
+@pytest.mark.parametrize("query, keywords", [
+    ("預算3萬的RTX4060筆電", "筆電 RTX4060"),
+    ("$30,000以內的Sony耳機", "Sony 耳機"),
+    ("筆電 2到3萬", "筆電"),
+    ("15000元左右的掃地機器人", "掃地機器人"),
+])
+def test_budget_is_understood(extractor, query, keywords):
+    assert extractor.extract(query) == (keywords, 1.0)
+
+def test_signature_keeps_unknown_words(extractor):
+    assert extractor.signature("白色的藍牙耳機") == frozenset({"白色", "藍牙耳機"})
+    assert extractor.signature("我想買白色藍牙耳機！") == extractor.signature("白色的藍牙耳機")
@@ -0,0 +1,63 @@
+from package.metrics import track_stage, RAG_STAGE_ERRORS, RAG_STAGE_SECONDS
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+import time
+import pytest
+
+def stage_errors(stage):
+    return RAG_STAGE_ERRORS._values.get((("stage", stage),), 0)
+
+def test_track_stage_counts_exceptions_and_fail_once():
+    with pytest.raises(RuntimeError):
+        with track_stage("test_raise") as stage:
+            stage.fail()
+            raise RuntimeError("boom")
+    assert stage_errors("test_raise") == 1
+
+    with track_stage("test_fail") as stage:
+        stage.fail()
+        stage.fail()
+    with track_stage("test_fail"):
+        pass
+    assert stage_errors("test_fail") == 1
+    assert RAG_STAGE_SECONDS.totals()[(("stage", "test_fail"),)][0] == 2
+
+def test_streaming_latency_includes_body(main_app):
+    app = FastAPI()
+    app.middleware("http")(main_app.record_request_metrics)
+
+    @app.get("/slow-stream")
+    def slow_stream():
+        def body():
+            yield "data: start\n\n"
+            time.sleep(0.2)
+            yield "data: end\n\n"
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    in_flight = main_app.http_requests_in_flight._values.get((), 0)
+    with TestClient(app) as client:
+        assert client.get("/slow-stream").text == "data: start\n\ndata: end\n\n"
+
+    key = (("method", "GET"), ("route", "/slow-stream"), ("status", "200"))
+    count, total = main_app.http_request_seconds.totals()[key]
+    assert count == 1 and total >= 0.2
+    assert main_app.http_requests_in_flight._values.get((), 0) == in_flight
+
+@pytest.mark.parametrize("token, public, authorization, status_code", [
+    (None, False, None, 403),
+    (None, True, None, 200),
+    ("secret", False, None, 401),
+    ("secret", False, "Bearer wrong", 401),
+    ("secret", False, "Bearer secret", 200),
+])
+def test_metrics_requires_token(main_app, monkeypatch, token, public, authorization, status_code):
+    monkeypatch.setattr(main_app, "metrics_token", token)
+    monkeypatch.setattr(main_app, "metrics_public", public)
+    # 不進入with區塊，不執行lifespan的背景服務
+    client = TestClient(main_app.app)
+    headers = {"Authorization": authorization} if authorization else {}
+    response = client.get("/metrics", headers=headers)
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert "rag_stage_seconds" in response.text
@@ -0,0 +1,58 @@
+from package.pchome_parser import extract_product_id, parse_product_page, is_parsed_product
+import pytest
+
+# 手寫的商品頁面，class與PChome相同，另外夾雜不需要的節點
+PAGE = """<!DOCTYPE html><html><head><title>商品</title><script>var state = {"price": "$1"};</script></head>
+<body>
+<ul class="c-menu"><li><a href="/region/DHAF">筆記型電腦</a></li></ul>
+<span class="o-prodMainName__colorSecondary">ASUS</span>
+<h1 class="o-prodMainName o-prodMainName__grayDarkest--l700"> ASUS Vivobook 15 筆電 </h1>
+<ul class="c-blockCombine__list--prodSlogan"><li>輕薄機身</li><li> 長效電池 </li></ul>
+<div class="o-prodPrice"><div class="o-prodPrice__price">$25,900</div>
+<div class="o-prodPrice__originalPrice">$29,900</div></div>
+<div class="c-blockCombine__item--prodSpecification"><p>Intel Core i5</p><p>16GB RAM</p></div>
+<table class="c-tableGrid--prodSpec">
+<tr><th>記憶體</th><td><div class="c-tableGrid__htmlText">16GB</div></td></tr>
+<tr><th>連接埠</th><td><div class="c-tableGrid__htmlText">USB-C</div></td></tr>
+<tr><th>連接埠</th><td><div class="c-tableGrid__htmlText">HDMI</div></td></tr>
+<tr><th>連接埠</th><td><div class="c-tableGrid__htmlText">USB-A</div></td></tr>
+</table>
+</body></html>"""
+
+EXPECTED = {
+    "price": "$25,900",
+    "original_price": "$29,900",
+    "name": "ASUS Vivobook 15 筆電",
+    "brand": "ASUS",
+    "features": ["輕薄機身", "長效電池"],
+    "specs_text": "Intel Core i5\n16GB RAM\n",
+    "specs": {"記憶體": "16GB", "連接埠": ["USB-C", "HDMI", "USB-A"]},
+}
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://24h.pchome.com.tw/prod/dhaf1y-a900gxqj2", "DHAF1Y-A900GXQJ2"),
+    ("https://24h.pchome.com.tw/prod/DHAF1Y-A900GXQJ2?fq=/S/DHAF1Y", "DHAF1Y-A900GXQJ2"),
+    ("https://24h.pchome.com.tw/store/DHAF1Y", None),
+    (None, None),
+])
+def test_extract_product_id(url, expected):
+    assert extract_product_id(url) == expected
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_parse_product_page(fast):
+    assert parse_product_page(PAGE, fast=fast) == EXPECTED
+
+def test_price_only():
+    assert parse_product_page(PAGE, price_only=True) == {"price": "$25,900", "original_price": "$29,900"}
+
+def test_missing_nodes_fall_back_to_defaults():
+    fields = parse_product_page("<html><body><p>請證明您不是機器人</p></body></html>")
+    assert fields["name"] == "無商品名稱"
+    assert fields["price"] == "無價格資訊"
+    assert fields["features"] == [] and fields["specs"] == {}
+    assert not is_parsed_product(fields)
+    assert not is_parsed_product({"price": "無價格資訊", "original_price": "無原始價格資訊"}, price_only=True)
+
+def test_is_parsed_product():
+    assert is_parsed_product(parse_product_page(PAGE))
+    assert is_parsed_product(parse_product_page(PAGE, price_only=True), price_only=True)
@@ -0,0 +1,51 @@
+from package.product_cache import ProductCache, FRESH, PRICE_STALE, STALE
+import time
+
+FIELDS = {
+    "name": "筆電", "brand": "ASUS", "price": "$25,900", "original_price": "$29,900",
+    "features": [], "specs": {}, "specs_text": "",
+}
+
+def test_freshness_follows_price_and_specs_ttl():
+    cache = ProductCache(price_ttl=10, specs_ttl=100)
+    cache.put("P1", "url", FIELDS, etag='"v1"')
+    entry = cache.get("P1")
+    assert cache.freshness(entry) == FRESH
+    assert cache.freshness(dict(entry, price_fetched_at=time.time() - 20)) == PRICE_STALE
+    assert cache.freshness(dict(entry, specs_fetched_at=time.time() - 200)) == STALE
+    assert cache.freshness(None) is None
+
+def test_conditional_headers():
+    cache = ProductCache()
+    cache.put("P1", "url", FIELDS, etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    assert cache.conditional_headers(cache.get("P1")) == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert cache.conditional_headers(None) == {}
+
+def test_update_price_keeps_specs_time():
+    cache = ProductCache()
+    cache.put("P1", "url", FIELDS)
+    entry = dict(cache.get("P1"), specs_fetched_at=1.0)
+    fields = cache.update_price("P1", entry, {"price": "$19,900", "original_price": "$29,900"})
+    assert fields["price"] == "$19,900"
+    assert fields["name"] == "筆電"
+    assert cache.get("P1")["specs_fetched_at"] == 1.0
+
+def test_merge_reports_changed_fields():
+    cache = ProductCache()
+    cache.put("P1", "url", FIELDS)
+    changed = cache.merge("P1", cache.get("P1"), dict(FIELDS, price="$19,900", brand="ASUS"))
+    assert changed == ["price"]
+
+def test_persistent_tier(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ProductCache(db_path=path)
+    cache.put("P1", "url", FIELDS)
+    cache.close()
+
+    reopened = ProductCache(db_path=path)
+    assert reopened.get("P1")["fields"] == FIELDS
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
@@ -0,0 +1,62 @@
+from package.product import ProductRecord
+from package.product_filter import ProductFilter, parse_constraints, product_features
+import math
+import pytest
+
+@pytest.mark.parametrize("query, expected", [
+    ("預算3萬以內的筆電", {"max_price": 30000}),
+    ("2到3萬的筆電", {"min_price": 20000, "max_price": 30000}),
+    ("2萬5左右的平板", {"min_price": 20000, "max_price": 27500}),
+    ("價格不超過15,000元", {"max_price": 15000}),
+    ("4k螢幕", {}),
+    ("16GB記憶體、1TB SSD的筆電", {"memory_gb": 16, "storage_gb": 1024}),
+    ("27吋 165hz 電競螢幕", {"refresh_hz": 165, "screen_inch": 27}),
+    ("筆電推薦", {}),
+])
+def test_parse_constraints(query, expected):
+    assert parse_constraints(query) == pytest.approx(expected)
+
+def laptop(index, price, memory="16GB", screen="15.6吋"):
+    return ProductRecord(
+        url=f"https://24h.pchome.com.tw/prod/P{index}",
+        name=f"筆電{index}",
+        price_text=f"${price:,}" if price else "無價格資訊",
+        price=price,
+        specs={"記憶體": memory, "螢幕尺寸": screen},
+    )
+
+def test_product_features():
+    price, memory, storage, refresh, screen = product_features(laptop(1, 25900))
+    assert (price, memory, screen) == (25900, 16, 15.6)
+    assert math.isnan(storage) and math.isnan(refresh)
+
+def test_select_drops_products_over_budget():
+    products = [laptop(1, 35000), laptop(2, 28000), laptop(3, None), laptop(4, 22000)]
+    selected = ProductFilter(top_k=8).select("預算3萬以內的筆電", products)
+    # 沒有價格的商品保留但排在後面
+    assert [product.name for product in selected] == ["筆電2", "筆電4", "筆電3"]
+
+def test_select_prefers_matching_specs():
+    products = [laptop(1, 25000, memory="8GB"), laptop(2, 26000, memory="32GB")]
+    selected = ProductFilter().select("32GB記憶體的筆電", products)
+    assert [product.name for product in selected] == ["筆電2", "筆電1"]
+
+def test_select_falls_back_to_cheapest_when_nothing_fits():
+    products = [laptop(1, 50000), laptop(2, 40000)]
+    selected = ProductFilter().select("預算1萬以內的筆電", products)
+    assert [product.name for product in selected] == ["筆電2", "筆電1"]
+
+def test_select_truncates_to_top_k_and_keeps_failed_last():
+    failed = ProductRecord.from_error("https://24h.pchome.com.tw/prod/BAD", "抓取失敗")
+    products = [failed] + [laptop(i, 20000 + i) for i in range(5)]
+    selected = ProductFilter(top_k=3).select("筆電", products)
+    assert [product.name for product in selected[:3]] == ["筆電0", "筆電1", "筆電2"]
+    assert selected[-1] is failed
+
+def test_select_without_constraints_or_limit_keeps_order():
+    products = [laptop(i, 20000 + i) for i in range(10)]
+    assert ProductFilter(top_k=0).select("筆電", products) == products
+
+def test_default_top_k_keeps_every_reranked_result():
+    from package.reranker import SearchReranker
+    assert ProductFilter().top_k == SearchReranker().top_n
@@ -0,0 +1,51 @@
+from package.product_index import ProductIndex
+import time
+
+FIELDS = {
+    "name": "ASUS Vivobook 15 筆電", "brand": "ASUS", "price": "$25,900", "original_price": "$29,900",
+    "features": ["輕薄機身"], "specs": {"記憶體": "16GB"}, "specs_text": "Intel Core i5",
+}
+GOOGLE_RESULTS = [{"標題": "Google商品", "連結": "https://24h.pchome.com.tw/prod/G-000000001", "摘要": "", "來源": ""}]
+
+def test_search_local_products(tmp_path):
+    index = ProductIndex(str(tmp_path / "cache.db"))
+    index.add("A-000000001", "https://24h.pchome.com.tw/prod/A-000000001", FIELDS)
+    results = index.search("ASUS 筆電")
+    assert [result["連結"] for result in results] == ["https://24h.pchome.com.tw/prod/A-000000001"]
+    assert results[0]["摘要"] == "輕薄機身"
+    assert index.search("MSI 筆電") is None
+    assert index.search("ASUS 筆電", min_hits=2) is None
+    assert index.stats()["hits"] == 1 and index.stats()["misses"] == 2
+    index.close()
+
+def test_record_and_purge_searches(tmp_path):
+    index = ProductIndex(str(tmp_path / "cache.db"))
+    assert index.last_search("ASUS 筆電") is None
+    index.record_search("筆電  ASUS")
+    # 關鍵字順序與大小寫不影響
+    assert time.time() - index.last_search("asus 筆電") < 5
+    assert index.purge_searches(3600) == 0
+    assert index.purge_searches(-1) == 1
+    assert index.last_search("ASUS 筆電") is None
+    index.close()
+
+def test_hybrid_uses_local_index_only_after_recent_google_search(make_rag, monkeypatch):
+    rag = make_rag(retriever_mode="hybrid", local_min_hits=1, local_query_ttl=3600)
+    rag.product_index.add("A-000000001", "https://24h.pchome.com.tw/prod/A-000000001", FIELDS)
+    google_calls = []
+
+    def google_search(query, num_results=10):
+        google_calls.append(query)
+        return GOOGLE_RESULTS
+    monkeypatch.setattr(rag, "google_search", google_search)
+
+    # 本地有符合的商品，但這組關鍵字沒有用Google搜尋過
+    assert rag.search_products("ASUS 筆電") == GOOGLE_RESULTS
+    local = rag.search_products("ASUS 筆電")
+    assert local[0]["連結"] == "https://24h.pchome.com.tw/prod/A-000000001"
+    assert google_calls == ["ASUS 筆電"]
+
+    # 超過local_query_ttl後重新使用Google搜尋
+    rag.local_query_ttl = 0
+    assert rag.search_products("ASUS 筆電") == GOOGLE_RESULTS
+    assert len(google_calls) == 2
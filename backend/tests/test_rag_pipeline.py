@@ -0,0 +1,212 @@
+from package.metrics import RAG_STAGE_ERRORS
+from package.product import ProductRecord
+import asyncio
+import json
+import threading
+import pytest
+
+QUERY = "華碩筆電"
+SEARCH_RESULTS = [
+    {"標題": f"ASUS 筆電 {i}", "連結": f"https://24h.pchome.com.tw/prod/A-00000000{i}", "摘要": ""} for i in range(2)
+]
+COMPARISON = {"product_comparisons": [{"name": "ASUS 筆電 0"}], "summary": "推薦"}
+RESPONSE = json.dumps(COMPARISON, ensure_ascii=False)
+
+def stage_errors(stage):
+    return RAG_STAGE_ERRORS._values.get((("stage", stage),), 0)
+
+@pytest.fixture
+def rag(make_rag, monkeypatch):
+    """外部API都換成假的RAGService，回傳(服務, 各階段呼叫記錄)"""
+    service = make_rag(keyword_min_confidence=0, semantic_cache_ttl=0)
+    calls = {"search": [], "compare": []}
+
+    def search_products(keywords, num_results=10):
+        calls["search"].append(keywords)
+        return SEARCH_RESULTS
+
+    def get_record(url):
+        return ProductRecord(url=url, name=url[-1], brand="ASUS", price_text="$25,900", price=25900)
+
+    def compare(prompt, stage="comparison"):
+        calls["compare"].append(stage)
+        return RESPONSE
+
+    async def acompare(prompt, stage="comparison"):
+        return compare(prompt, stage)
+
+    def stream_compare(prompt, stage="comparison"):
+        calls["compare"].append(stage)
+        yield RESPONSE[:10]
+        yield RESPONSE[10:]
+
+    monkeypatch.setattr(service, "search_products", search_products)
+    monkeypatch.setattr(service, "get_pchome_product_record", get_record)
+    monkeypatch.setattr(service, "get_gemini_response", compare)
+    monkeypatch.setattr(service, "aget_gemini_response", acompare)
+    monkeypatch.setattr(service, "stream_gemini_response", stream_compare)
+    return service, calls
+
+def test_sync_and_stream_share_the_pipeline(rag):
+    service, calls = rag
+    service.result_cache = None
+    expected = (RESPONSE, COMPARISON)
+    assert service.process_product_comparison(QUERY) == expected
+
+    events = list(service.stream_product_comparison(QUERY))
+    names = [event for event, _ in events]
+    assert names == ["keywords", "search_results", "product", "product", "token", "token", "result"]
+    assert events[0][1] == {"keywords": "ASUS 筆電"}
+    assert events[1][1]["count"] == 2
+    assert events[-1][1] == expected
+    assert calls["search"] == ["ASUS 筆電"] * 2
+
+def test_invalid_json_is_repaired_once(rag, monkeypatch):
+    service, calls = rag
+    responses = iter(["這不是JSON", RESPONSE])
+    monkeypatch.setattr(service, "get_gemini_response", lambda prompt, stage="comparison": calls["compare"].append(stage) or next(responses))
+
+    assert service.process_product_comparison(QUERY) == (RESPONSE, COMPARISON)
+    assert calls["compare"] == ["comparison", "repair"]
+    assert service.llm_stats()["parsing"]["repaired"] == 1
+
+def test_async_parse_repairs_with_async_call(rag, monkeypatch):
+    service, _ = rag
+    stages = []
+
+    async def acompare(prompt, stage="comparison"):
+        stages.append(stage)
+        return RESPONSE
+    monkeypatch.setattr(service, "aget_gemini_response", acompare)
+
+    assert asyncio.run(service.aparse_comparison_response("這不是JSON")) == (RESPONSE, COMPARISON)
+    assert stages == ["repair"]
+
+def test_stage_exception_becomes_error_result(rag, monkeypatch):
+    service, _ = rag
+
+    def broken_search(keywords, num_results=10):
+        raise RuntimeError("quota exceeded")
+    monkeypatch.setattr(service, "search_products", broken_search)
+
+    before = stage_errors("search")
+    original_response, response_json = service.process_product_comparison(QUERY)
+    assert original_response == "quota exceeded"
+    assert response_json == {"error": "處理產品比較時發生錯誤: quota exceeded"}
+    assert stage_errors("search") == before + 1
+    # 失敗的結果不快取
+    assert service.result_cache.get(QUERY) is None
+
+def test_stream_result_is_cached(rag):
+    service, calls = rag
+    assert list(service.stream_product_comparison(QUERY))[-1][1] == (RESPONSE, COMPARISON)
+    assert list(service.stream_product_comparison(QUERY)) == [("result", (RESPONSE, COMPARISON))]
+    assert len(calls["compare"]) == 1
+
+def test_async_path_matches_sync(rag, monkeypatch):
+    service, calls = rag
+    service.result_cache = None
+    assert asyncio.run(service.aprocess_product_comparison(QUERY)) == service.process_product_comparison(QUERY)
+    assert calls["search"] == ["ASUS 筆電"] * 2
+
+    async def broken_fetch(search_results, user_query=None):
+        raise RuntimeError("timeout")
+    monkeypatch.setattr(service, "apchome_search", broken_fetch)
+    before = stage_errors("fetch")
+    assert asyncio.run(service.aprocess_product_comparison(QUERY)) == ("timeout", {"error": "處理產品比較時發生錯誤: timeout"})
+    assert stage_errors("fetch") == before + 1
+
+def test_concurrent_streams_run_the_pipeline_once(rag, monkeypatch):
+    service, calls = rag
+    release = threading.Event()
+    original_stream = service.stream_gemini_response
+
+    def slow_stream(prompt, stage="comparison"):
+        release.wait(5)
+        yield from original_stream(prompt, stage)
+    monkeypatch.setattr(service, "stream_gemini_response", slow_stream)
+
+    follower_events = []
+    leader = service.stream_product_comparison(QUERY)
+    # 執行者停在產生比較之前
+    assert next(leader)[0] == "keywords"
+    follower = threading.Thread(target=lambda: follower_events.extend(service.stream_product_comparison(QUERY)))
+    follower.start()
+    while service.result_cache.single_flight.coalesced == 0:
+        follower.join(0.001)
+    release.set()
+    leader_events = list(leader)
+    follower.join(5)
+
+    assert leader_events[-1] == ("result", (RESPONSE, COMPARISON))
+    assert follower_events == [("result", (RESPONSE, COMPARISON))]
+    assert len(calls["compare"]) == 1
+
+def test_abandoned_stream_lets_follower_run(rag):
+    service, calls = rag
+    leader = service.stream_product_comparison(QUERY)
+    next(leader)
+    follower_events = []
+    follower = threading.Thread(target=lambda: follower_events.extend(service.stream_product_comparison(QUERY)))
+    follower.start()
+    while service.result_cache.single_flight.coalesced == 0:
+        follower.join(0.001)
+    # 用戶中斷串流
+    leader.close()
+    follower.join(5)
+
+    assert [event for event, _ in follower_events][-1] == "result"
+    assert follower_events[-1][1] == (RESPONSE, COMPARISON)
+    # 執行者在搜尋前就被中斷，搜尋與比較都由等待者完成
+    assert calls["search"] == ["ASUS 筆電"]
+    assert calls["compare"] == ["comparison"]
+
+@pytest.mark.parametrize("stage, patch", [
+    ("search", {"search_products": lambda keywords, num_results=10: []}),
+    ("compare", {"get_gemini_response": lambda prompt, stage="comparison": None}),
+    ("parse", {"get_gemini_response": lambda prompt, stage="comparison": "{\"product_comparisons\": "}),
+])
+def test_sentinel_results_count_as_stage_errors(rag, monkeypatch, stage, patch):
+    service, _ = rag
+    service.json_repair = False
+    for name, func in patch.items():
+        monkeypatch.setattr(service, name, func)
+
+    before = stage_errors(stage)
+    service.process_product_comparison(QUERY)
+    assert stage_errors(stage) == before + 1
+
+def test_async_request_joins_running_stream(rag, monkeypatch):
+    service, calls = rag
+    started = threading.Event()
+    release = threading.Event()
+    original_stream = service.stream_gemini_response
+
+    def slow_stream(prompt, stage="comparison"):
+        started.set()
+        release.wait(5)
+        yield from original_stream(prompt, stage)
+    monkeypatch.setattr(service, "stream_gemini_response", slow_stream)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        stream = loop.run_in_executor(None, lambda: list(service.stream_product_comparison(QUERY)))
+        await loop.run_in_executor(None, started.wait, 5)
+        follower = asyncio.ensure_future(service.aprocess_product_comparison(QUERY))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(stream, follower)
+
+    events, result = asyncio.run(main())
+    assert events[-1] == ("result", (RESPONSE, COMPARISON))
+    assert result == (RESPONSE, COMPARISON)
+    assert calls["search"] == ["ASUS 筆電"]
+    assert calls["compare"] == ["comparison"]
+
+@pytest.mark.parametrize("structured_output", [True, False])
+def test_structured_output_applies_to_comparison_and_repair(make_rag, structured_output):
+    service = make_rag(structured_output=structured_output)
+    for stage in ("comparison", "repair"):
+        assert ("response_schema" in service.stage_configs[stage]) is structured_output
+        assert ("response_mime_type" in service.stage_configs[stage]) is structured_output
+    assert "response_schema" not in service.stage_configs["keywords"]
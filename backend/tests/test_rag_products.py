@@ -0,0 +1,80 @@
+from tests.conftest import FakeHTTP, product_page, PRODUCT_URL
+from package.pchome_parser import extract_product_id
+import time
+import pytest
+
+PRODUCT_ID = extract_product_id(PRODUCT_URL)
+
+def test_product_is_cached_and_indexed(make_rag):
+    rag = make_rag()
+    rag.http_client = FakeHTTP((200, product_page(), {"ETag": '"v1"'}))
+    record = rag.get_pchome_product_record(PRODUCT_URL)
+    assert record.ok and record.price == 25900
+    # 第二次直接使用快取，不再發送請求
+    assert rag.get_pchome_product_record(PRODUCT_URL).name == record.name
+    assert len(rag.http_client.requests) == 1
+    assert rag.product_index.search("筆電") is not None
+
+def test_blocked_page_is_not_cached(make_rag):
+    rag = make_rag()
+    rag.http_client = FakeHTTP((200, product_page(name=None), {}), (200, product_page(), {}))
+    record = rag.get_pchome_product_record(PRODUCT_URL)
+    assert not record.ok
+    assert rag.product_cache.get(PRODUCT_ID) is None
+    assert rag.product_index.search("機器人") is None
+    # 下一次請求重新抓取
+    assert rag.get_pchome_product_record(PRODUCT_URL).ok
+
+def test_blocked_page_keeps_stale_entry(make_rag):
+    rag = make_rag()
+    rag.http_client = FakeHTTP((200, product_page(), {}), (200, product_page(name=None), {}))
+    rag.get_pchome_product_record(PRODUCT_URL)
+    entry = rag.product_cache.get(PRODUCT_ID)
+    rag.product_cache._save(PRODUCT_ID, dict(entry, price_fetched_at=0, specs_fetched_at=0))
+
+    record = rag.get_pchome_product_record(PRODUCT_URL)
+    assert record.ok and record.price == 25900
+    # 快取時間沒有更新，下次仍會重新抓取
+    assert rag.product_cache.get(PRODUCT_ID)["specs_fetched_at"] == 0
+
+def test_blocked_page_does_not_overwrite_price(make_rag):
+    rag = make_rag()
+    rag.http_client = FakeHTTP((200, product_page(), {}), (200, product_page(name=None), {}))
+    rag.get_pchome_product_record(PRODUCT_URL)
+    entry = rag.product_cache.get(PRODUCT_ID)
+    rag.product_cache._save(PRODUCT_ID, dict(entry, price_fetched_at=time.time() - rag.product_cache.price_ttl - 1))
+
+    assert rag.get_pchome_product_record(PRODUCT_URL).price == 25900
+    assert rag.product_cache.get(PRODUCT_ID)["fields"]["price"] == "$25,900"
+
+def test_not_modified_revalidates(make_rag):
+    rag = make_rag(price_ttl=0)
+    rag.http_client = FakeHTTP((200, product_page(), {"ETag": '"v1"'}), (304, "", {}))
+    rag.get_pchome_product_record(PRODUCT_URL)
+    assert rag.get_pchome_product_record(PRODUCT_URL).ok
+    assert rag.http_client.requests[1][1]["If-None-Match"] == '"v1"'
+    assert rag.product_cache.stats()["revalidations"] == 1
+
+@pytest.mark.parametrize("status_code", [404, 503])
+def test_error_status_without_cache_is_an_error(make_rag, status_code):
+    rag = make_rag()
+    rag.http_client = FakeHTTP((status_code, product_page(name=None), {}))
+    record = rag.get_pchome_product_record(PRODUCT_URL)
+    assert not record.ok
+    assert f"HTTP狀態碼 {status_code}" in record.error
+    assert rag.product_cache.get(PRODUCT_ID) is None
+
+@pytest.mark.parametrize("status_code", [404, 503])
+@pytest.mark.parametrize("stale", ["price", "all"])
+def test_error_status_keeps_cached_fields(make_rag, status_code, stale):
+    rag = make_rag()
+    rag.http_client = FakeHTTP((200, product_page(), {}), (status_code, "<html>錯誤</html>", {}))
+    rag.get_pchome_product_record(PRODUCT_URL)
+    entry = rag.product_cache.get(PRODUCT_ID)
+    expired = time.time() - rag.product_cache.price_ttl - 1
+    rag.product_cache._save(PRODUCT_ID, dict(entry, price_fetched_at=expired, **({"specs_fetched_at": 0} if stale == "all" else {})))
+
+    record = rag.get_pchome_product_record(PRODUCT_URL)
+    assert record.ok and record.price == 25900
+    # 快取時間沒有更新，下次仍會重新抓取
+    assert rag.product_cache.get(PRODUCT_ID)["price_fetched_at"] == expired
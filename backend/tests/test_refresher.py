@@ -0,0 +1,34 @@
+from package.refresher import ProductRefresher
+import asyncio
+
+def test_run_cycle_refreshes_hot_and_due_products():
+    refreshed = []
+    ages = {"HOT": 500, "FRESH": 10}
+
+    def refresh(product_id, url):
+        refreshed.append(product_id)
+        return ["price"]
+
+    refresher = ProductRefresher(refresh, ages.get, rate=1000, due_after=480)
+    for _ in range(3):
+        refresher.record_access("HOT", "url-hot")
+        refresher.record_access("FRESH", "url-fresh")
+    refresher.record_access("COLD", "url-cold")
+
+    assert asyncio.run(refresher.run_cycle()) == 1
+    assert refreshed == ["HOT"]
+    stats = refresher.stats()
+    assert stats["changed"] == 1 and stats["field_changes"] == {"price": 1}
+
+def test_background_loop_purges_expired_cache():
+    purged = []
+    refresher = ProductRefresher(lambda *_: [], lambda _: None, interval=0.001,
+                                 purge_func=lambda: purged.append(1), purge_interval=0)
+
+    async def main():
+        refresher.start()
+        await asyncio.sleep(0.05)
+        await refresher.stop()
+
+    asyncio.run(main())
+    assert purged
@@ -0,0 +1,40 @@
+from package.reranker import SearchReranker, tokenize
+
+def result(title, link, snippet=""):
+    return {"標題": title, "連結": link, "摘要": snippet}
+
+def test_tokenize():
+    assert tokenize("ASUS 電競筆電 RTX4060") == ["asus", "rtx4060", "電競", "競筆", "筆電"]
+    assert tokenize("ＲＴＸ 4.5吋") == ["rtx", "4.5", "吋"]
+
+def test_rerank_orders_by_relevance_and_penalizes_accessories():
+    results = [
+        result("ASUS 筆電 保護貼", "https://24h.pchome.com.tw/prod/A-000000001"),
+        result("ASUS 電競筆電 RTX4060", "https://24h.pchome.com.tw/prod/A-000000002"),
+        result("無關的商品", "https://24h.pchome.com.tw/prod/A-000000003"),
+    ]
+    reranked = SearchReranker().rerank("ASUS 電競筆電", results)
+    assert [item["連結"][-1] for item in reranked] == ["2", "1"]
+
+def test_rerank_keeps_accessory_when_asked_for():
+    results = [
+        result("筆電", "https://24h.pchome.com.tw/prod/A-000000001"),
+        result("筆電 保護貼", "https://24h.pchome.com.tw/prod/A-000000002"),
+    ]
+    reranked = SearchReranker().rerank("筆電保護貼", results)
+    assert reranked[0]["連結"].endswith("2")
+
+def test_rerank_removes_duplicate_products_and_truncates():
+    results = [
+        result("ASUS 筆電", "https://24h.pchome.com.tw/prod/A-000000001"),
+        result("ASUS 筆電 特價", "https://24h.pchome.com.tw/prod/A-000000001?fq=/S/A"),
+    ] + [result(f"ASUS 筆電 {i}", f"https://24h.pchome.com.tw/prod/A-00000001{i}") for i in range(5)]
+    reranked = SearchReranker(top_n=3).rerank("ASUS 筆電", results)
+    assert len(reranked) == 3
+    links = [item["連結"].split("?")[0] for item in reranked]
+    assert len(set(links)) == 3
+
+def test_rerank_without_matches_keeps_google_order():
+    results = [result("甲", "https://a"), result("乙", "https://b")]
+    assert SearchReranker().rerank("筆電", results) == results
+    assert SearchReranker().rerank("筆電", []) == []
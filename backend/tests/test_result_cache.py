@@ -0,0 +1,180 @@
+from package.cache import SingleFlight
+from package.result_cache import ResultCache, normalize_query, is_cacheable_result
+import asyncio
+import threading
+import time
+import pytest
+
+RESULT = ("回應", {"product_comparisons": [{"name": "A"}], "summary": "..."})
+
+@pytest.mark.parametrize("query", ["華碩筆電推薦？", "華碩筆電推薦", "  華碩筆電推薦 ", "華碩筆電推薦!!"])
+def test_normalize_query(query):
+    assert normalize_query(query) == "華碩筆電推薦"
+
+def test_normalize_query_full_width_and_case():
+    assert normalize_query("ＡＳＵＳ　Vivobook") == "asus vivobook"
+
+@pytest.mark.parametrize("result, cacheable", [
+    (RESULT, True),
+    (("x", {"error": "Gemini沒有回應"}), False),
+    (("x", {"response": "無法解析的文字"}), False),
+    (("x", {"product_comparisons": []}), False),
+    (("x", {"product_comparisons": "A"}), False),
+    (("x", None), False),
+])
+def test_is_cacheable_result(result, cacheable):
+    assert is_cacheable_result(result) is cacheable
+
+def test_result_cache_skips_uncacheable():
+    cache = ResultCache(ttl=60)
+    cache.set("筆電", ("x", {"response": "無法解析的文字"}))
+    assert cache.get("筆電") is None
+    cache.set("筆電", RESULT)
+    assert cache.get("筆電？") == RESULT
+
+def test_get_or_compute_coalesces_threads():
+    cache = ResultCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return RESULT
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("筆電", compute)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(cache.get_or_compute("筆電", compute)))
+    follower.start()
+    # 等待者進入SingleFlight後才放行
+    while cache.single_flight.coalesced == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == [RESULT, RESULT]
+    assert len(calls) == 1
+
+def test_single_flight_async_coalesces():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["ok"] * 5
+    assert len(calls) == 1
+    assert flight.coalesced == 4
+    assert flight._calls == {}
+
+def test_single_flight_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("k", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "ok"
+
+def test_single_flight_async_exception_reaches_all_callers():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", compute) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight._calls == {}
+
+def test_aget_or_compute_caches_result():
+    cache = ResultCache(ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return RESULT
+
+    async def main():
+        first = await cache.aget_or_compute("筆電", compute)
+        second = await cache.aget_or_compute("筆電", compute)
+        return first, second
+
+    assert asyncio.run(main()) == (RESULT, RESULT)
+    assert len(calls) == 1
+
+def test_sync_leader_is_shared_with_async_caller():
+    cache = ResultCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append("sync")
+        started.set()
+        release.wait(5)
+        return RESULT
+
+    async def acompute():
+        calls.append("async")
+        return RESULT
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        leader = loop.run_in_executor(None, cache.get_or_compute, "筆電", compute)
+        await loop.run_in_executor(None, started.wait, 5)
+        follower = asyncio.ensure_future(cache.aget_or_compute("筆電", acompute))
+        await asyncio.sleep(0.01)
+        # 等待同步的執行者時不阻塞事件迴圈
+        assert not follower.done()
+        release.set()
+        return await asyncio.gather(leader, follower)
+
+    assert asyncio.run(main()) == [RESULT, RESULT]
+    assert calls == ["sync"]
+    assert cache.stats()["coalesced"] == 1
+
+def test_async_leader_is_shared_with_sync_caller():
+    cache = ResultCache(ttl=60)
+    calls = []
+
+    def compute():
+        calls.append("sync")
+        return RESULT
+
+    async def acompute():
+        calls.append("async")
+        await asyncio.sleep(0.05)
+        return RESULT
+
+    async def main():
+        leader = asyncio.ensure_future(cache.aget_or_compute("筆電", acompute))
+        await asyncio.sleep(0)
+        follower = asyncio.get_running_loop().run_in_executor(None, cache.get_or_compute, "筆電", compute)
+        return await asyncio.gather(leader, follower)
+
+    assert asyncio.run(main()) == [RESULT, RESULT]
+    assert calls == ["async"]
+    assert cache.single_flight._calls == {}
@@ -0,0 +1,28 @@
+from package.search_cache import SearchCache
+
+RESULTS = [{"標題": "筆電", "連結": "https://24h.pchome.com.tw/prod/A-1", "摘要": "", "來源": "24h.pchome.com.tw"}]
+
+def test_key_ignores_order_case_and_width():
+    assert SearchCache.make_key("inurl:x", "ASUS 筆電 電競", 10) == SearchCache.make_key("inurl:x", "電競  筆電 ａｓｕｓ", 10)
+    assert SearchCache.make_key("inurl:x", "ASUS 筆電", 10) != SearchCache.make_key("inurl:x", "ASUS 筆電", 5)
+    assert SearchCache.make_key("inurl:x", "ASUS 筆電", 10) != SearchCache.make_key("inurl:x", "MSI 筆電", 10)
+
+def test_persistent_tier_fills_memory(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SearchCache(ttl=60, db_path=path)
+    key = cache.make_key("inurl:x", "筆電", 10)
+    cache.set(key, RESULTS)
+    cache.close()
+
+    reopened = SearchCache(ttl=60, db_path=path)
+    assert reopened.get(key) == RESULTS
+    assert reopened.get(key) == RESULTS
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+def test_expired_results_are_not_returned(tmp_path):
+    cache = SearchCache(ttl=-1, db_path=str(tmp_path / "cache.db"))
+    key = cache.make_key("inurl:x", "筆電", 10)
+    cache.set(key, RESULTS)
+    assert cache.get(key) is None
+    cache.close()
@@ -0,0 +1,76 @@
+from package.semantic_cache import SemanticCache
+import numpy as np
+import pytest
+
+SEARCH_RESULTS = [{"標題": "商品", "連結": "https://24h.pchome.com.tw/prod/A-000000001"}]
+RESULT = ("回應", {"product_comparisons": [{"name": "A"}]})
+
+def cached(query, result=RESULT):
+    cache = SemanticCache(ttl=60)
+    cache.put_stages(query, "關鍵字", SEARCH_RESULTS)
+    cache.put_result(query, result)
+    return cache
+
+# 字元相似度都高於stage_threshold，但商品不同
+@pytest.mark.parametrize("cached_query, query", [
+    ("想找一台ASUS的電競筆電，預算4萬以內，要16GB記憶體", "想找一台MSI的電競筆電，預算4萬以內，要16GB記憶體"),
+    ("想找一台筆記型電腦，預算3萬以內，主要拿來文書處理", "想找一台桌上型電腦，預算3萬以內，主要拿來文書處理"),
+    ("推薦Sony的降噪藍牙耳機，預算8000以內，要能長時間配戴", "推薦Bose的降噪藍牙耳機，預算8000以內，要能長時間配戴"),
+    ("iphone 15 和 iphone 15 pro 比較", "iphone 14 和 iphone 14 pro 比較"),
+    ("需要有觸控螢幕的輕薄筆電，預算3萬以內", "不需要觸控螢幕的輕薄筆電，預算3萬以內"),
+    ("想找RTX4060顯卡的電競筆電，預算5萬以內，要16GB記憶體和1TB SSD", "想找RTX4090顯卡的電競筆電，預算5萬以內，要16GB記憶體和1TB SSD"),
+    # 詞庫外的屬性
+    ("白色的藍牙耳機", "黑色的藍牙耳機"),
+    ("samsung s24 手機", "samsung s23 手機"),
+])
+def test_near_miss_queries_do_not_hit(cached_query, query):
+    cache = cached(cached_query)
+    assert float(cache.vectorize(cached_query) @ cache.vectorize(query)) >= cache.stage_threshold
+    kind, content, _ = cache.lookup(query)
+    assert kind is None and content is None
+    assert cache.stats()["misses"] == 1
+
+def test_same_query_reuses_result():
+    cache = cached("華碩筆電推薦")
+    kind, content, similarity = cache.lookup("華碩筆電推薦！")
+    assert kind == "result" and content == RESULT
+    assert similarity == pytest.approx(1.0)
+
+def test_paraphrase_reuses_result_or_stages():
+    cache = cached("ASUS電競筆電推薦，預算4萬以內")
+    assert cache.lookup("我想買ASUS電競筆電，預算4萬以內！")[:2] == ("result", RESULT)
+    assert cache.lookup("推薦ASUS的電競筆電，預算4萬以內")[:2] == ("stages", ("關鍵字", SEARCH_RESULTS))
+
+def test_brand_and_category_aliases_share_signature():
+    signature = SemanticCache()._extractor.signature
+    assert signature("推薦華碩的電競筆電") == signature("ASUS 遊戲筆記型電腦") == frozenset({"ASUS", "筆電", "電競"})
+
+def test_different_budget_reuses_only_stages():
+    cache = cached("預算3萬的電競筆電")
+    kind, content, _ = cache.lookup("預算4萬的電競筆電")
+    assert kind == "stages"
+    assert content == ("關鍵字", SEARCH_RESULTS)
+
+@pytest.mark.parametrize("result", [
+    ("x", {"error": "Gemini沒有回應"}),
+    ("無法解析的文字", {"response": "無法解析的文字"}),
+])
+def test_failed_results_are_not_reused(result):
+    cache = cached("華碩筆電推薦", result)
+    kind, _, _ = cache.lookup("華碩筆電推薦")
+    assert kind == "stages"
+
+def test_evicts_least_recently_used():
+    cache = SemanticCache(ttl=60, max_entries=2)
+    cache.put_stages("華碩筆電", "a", SEARCH_RESULTS)
+    cache.put_stages("微星筆電", "b", SEARCH_RESULTS)
+    cache.lookup("華碩筆電")
+    cache.put_stages("宏碁筆電", "c", SEARCH_RESULTS)
+    assert cache.lookup("微星筆電")[0] is None
+    assert cache.lookup("華碩筆電")[0] == "stages"
+    assert cache.stats()["evictions"] == 1
+
+def test_vectorize_ignores_filler_words():
+    cache = SemanticCache()
+    assert np.allclose(cache.vectorize("我想買華碩筆電"), cache.vectorize("華碩筆電推薦"))
+    assert not cache.vectorize("推薦").any()
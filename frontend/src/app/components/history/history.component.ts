@@ -20,6 +20,7 @@ export class HistoryComponent implements OnInit {
   currentPage: number = 0;
   pageSize: number = 10;
   isLoading: boolean = false;
+  isLoadingDetails: boolean = false;
   errorMessage: string = '';
 
   constructor(
@@ -62,6 +63,32 @@ export class HistoryComponent implements OnInit {
   viewQueryDetails(query: any) {
     this.selectedQuery = query;
     
+    // 列表只有查詢摘要，完整回應需要另外載入
+    if (query.response === undefined) {
+      this.parsedResponse = null;
+      this.isLoadingDetails = true;
+      this.historyService.getQueryById(query.id).subscribe({
+        next: (record) => {
+          query.response = record.response;
+          if (this.selectedQuery === query) {
+            this.isLoadingDetails = false;
+            this.parseQueryResponse(query);
+          }
+        },
+        error: (error) => {
+          this.isLoadingDetails = false;
+          this.errorMessage = error.message || '無法載入查詢記錄';
+          this.messageService.error(this.errorMessage);
+        }
+      });
+      return;
+    }
+    
+    this.isLoadingDetails = false;
+    this.parseQueryResponse(query);
+  }
+
+  parseQueryResponse(query: any) {
     try {
       // 處理回應格式
       // 檢查response是否已經是JSON對象